@@ -5,16 +5,18 @@ extraction and adding new archive formats. '''
 
 import os
 import errno
-import shutil
 import sys
 import threading
 
 from mcomix import archive
 from mcomix import callback
+from mcomix import constants
 from mcomix import i18n
+from mcomix import log
 from mcomix import portability
 from mcomix import process
 from mcomix import tools
+from mcomix.archive import capabilities
 from mcomix.lib import mountmanager
 from mcomix.preferences import prefs
 
@@ -26,10 +28,24 @@ class BaseArchive(object):
     ''' True if concurrent calls to extract is supported. '''
     support_concurrent_extractions = False
 
+    ''' True if files can be read to memory with read(). '''
+    support_read = False
+
+    ''' True if iter_extract() extracts several files at about the cost of
+    a single extract() call (e.g. by a single process), so that files of
+    non-solid archives are better extracted in batches. '''
+    support_batch_extractions = False
+
+    ''' True if the listing of the archive can be cached, see get_listing().
+    The constructor then accepts the cached listing as <listing>. '''
+    support_listing_cache = False
+
     def __init__(self, archive):
         assert isinstance(archive, str), 'File should be an Unicode string.'
 
         self.archive = archive
+        # Cached listing the archive was opened with, see get_listing().
+        self.listing = None
         self._password = None
         self.is_encrypted = False
         self._event = threading.Event()
@@ -59,6 +75,34 @@ class BaseArchive(object):
             isinstance(destination_dir, str)
         return os.path.join(destination_dir, filename)
 
+    def get_listing(self):
+        ''' Returns everything needed to open the archive again without
+        listing its contents (e.g. member sizes, solid flag, mapping of
+        filenames to their original encoding) as a JSON serializable dict,
+        once iter_contents() has been run, or None if it can not be cached.
+        The names listed are added to it as 'names', and it is passed back
+        to the constructor as <listing>. Only supported if
+        support_listing_cache is True. '''
+        raise NotImplementedError('Archive does not support listing cache.')
+
+    def read(self, filename):
+        ''' Returns the content of the file specified by <filename> as bytes,
+        without writing it to the disk. Only supported if support_read is
+        True. This filename must be obtained by calling list_contents(). '''
+        raise NotImplementedError('Archive does not support reading to memory.')
+
+    def read_start(self, filename, size):
+        ''' Same as read(), but only at least the first <size> bytes of
+        <filename> are needed, e.g. to parse its header. Returns the whole
+        file unless the archive can read part of it. '''
+        return self.read(filename)
+
+    def get_size(self, filename):
+        ''' Returns the uncompressed size of <filename> as listed in the
+        archive, or None if unknown. This filename must be obtained by
+        calling list_contents(). '''
+        return None
+
     def iter_extract(self, entries, destination_dir):
         ''' Generator to extract <entries> from archive to <destination_dir>. '''
         wanted = set(entries)
@@ -80,6 +124,14 @@ class BaseArchive(object):
         in one pass. '''
         return False
 
+    def get_block(self, filename):
+        ''' Returns the solid block holding <filename>, as a hashable value.
+        A block can only be decompressed from its start, so the files of a
+        solid archive are extracted block by block, each in a single
+        iter_extract() pass. Defaults to a single block for the whole
+        archive. '''
+        return None
+
     def _replace_invalid_filesystem_chars(self, filename):
         ''' Replaces characters in <filename> that cannot be saved to the disk
         with underscore and returns the cleaned-up name. '''
@@ -181,6 +233,12 @@ class NonUnicodeArchive(BaseArchive):
         else:
             return i18n.to_utf8(filename)
 
+#: Maximum number of external processes extracting from an archive at once
+_MAX_PROCESSES = constants.CPU_COUNT or 1
+#: Maximum length of the filenames passed to a single extraction process,
+#: which must stay well below the command line limit (32K on Win32).
+_MAX_ARGUMENTS_LENGTH = 16 * 1024
+
 class ExternalExecutableArchive(NonUnicodeArchive):
     ''' For archives that are extracted by spawning an external
     application. '''
@@ -189,12 +247,32 @@ class ExternalExecutableArchive(NonUnicodeArchive):
     # concurrent calls are supported.
     support_concurrent_extractions = True
 
+    # Files are extracted by a single process in iter_extract(), as long
+    # as their sizes have been listed.
+    support_batch_extractions = True
+
     def __init__(self, archive):
         super(ExternalExecutableArchive, self).__init__(archive)
         # Flag to determine if list_contents() has been called
         # This builds the Unicode mapping and is likely required
         # for extracting filenames that have been internally mapped.
         self.filenames_initialized = False
+        # (original filename, size) of non-empty files, in the archive
+        # order, filled by _parse_list_output_line() if the list command
+        # reports sizes, see iter_extract().
+        self._contents = []
+        # Caps the number of processes extracting from the archive.
+        self._processes = threading.BoundedSemaphore(_MAX_PROCESSES)
+
+    def get_listing(self):
+        return {'unicode_mapping': self.unicode_mapping}
+
+    def _set_listing(self, listing):
+        ''' Restores the state of the archive from the cached <listing>, see
+        get_listing(). '''
+        self.listing = listing
+        self.unicode_mapping.update(listing['unicode_mapping'])
+        self.filenames_initialized = True
 
     def _get_executable(self):
         ''' Returns the executable's name or path. Return None if no executable
@@ -211,6 +289,14 @@ class ExternalExecutableArchive(NonUnicodeArchive):
         to extract a file to STDOUT. '''
         raise NotImplementedError('Subclasses must override _get_extract_arguments.')
 
+    def _get_batch_extract_arguments(self, filenames):
+        ''' Returns the command to extract <filenames> (all files if None)
+        to STDOUT, one after the other in the archive order. '''
+        args = [self._get_executable()] + self._get_extract_arguments() + [self.archive]
+        if filenames is not None:
+            args.extend(filenames)
+        return args
+
     def _parse_list_output_line(self, line):
         ''' Parses the output of the external executable's list command
         and return either a file path relative to the archive's root,
@@ -223,7 +309,8 @@ class ExternalExecutableArchive(NonUnicodeArchive):
 
         with process.popen([self._get_executable()] +
                            self._get_list_arguments() +
-                           [self.archive]) as proc:
+                           [self.archive],
+                           universal_newlines=True) as proc:
             for line in proc.stdout:
                 filename = self._parse_list_output_line(line.rstrip(os.linesep))
                 if filename is not None:
@@ -244,13 +331,87 @@ class ExternalExecutableArchive(NonUnicodeArchive):
 
         destination_path = os.path.join(destination_dir, filename)
 
-        with self._create_file(destination_path) as output:
+        with self._processes, self._create_file(destination_path) as output:
             process.call([self._get_executable()] +
                          self._get_extract_arguments() +
                          [self.archive, self._original_filename(filename)],
                          stdout=output)
         return destination_path
 
+    def iter_extract(self, entries, destination_dir):
+        ''' Extract <entries> to <destination_dir> with a single process,
+        splitting its output by the sizes listed. Without sizes, each file
+        is extracted by its own process. '''
+
+        if not self._get_executable():
+            return
+
+        if not self.filenames_initialized:
+            self.list_contents()
+
+        if not self._contents:
+            yield from super(ExternalExecutableArchive, self).iter_extract(
+                entries, destination_dir)
+            return
+
+        wanted = dict([(self._original_filename(unicode_name), unicode_name)
+                       for unicode_name in entries])
+        filenames = list(wanted)
+        if sum(len(filename) + 1 for filename in filenames) > _MAX_ARGUMENTS_LENGTH:
+            # Too many to pass, skip the unwanted files instead.
+            filenames = None
+        yield from self._iter_extract_output(
+            self._get_batch_extract_arguments(filenames), wanted,
+            destination_dir, only_wanted=filenames is not None)
+
+    def _iter_extract_output(self, args, wanted, destination_dir, only_wanted=True):
+        ''' Runs <args>, which writes the files of the archive to STDOUT
+        one after the other in the archive order (only the <wanted> ones if
+        <only_wanted> is True). The <wanted> files ({original filename:
+        unicode filename}) are written to <destination_dir>, and their
+        names yielded. If the output ends early, or <args> fails, the wanted
+        files left are extracted one by one. '''
+        listed = set(filename for filename, filesize in self._contents)
+        for filename in [filename for filename in wanted if filename not in listed]:
+            # Empty files, nothing to extract.
+            unicode_name = wanted.pop(filename)
+            with self._create_file(os.path.join(destination_dir, unicode_name)):
+                pass
+            yield unicode_name
+        if not wanted:
+            return
+        with self._processes, process.popen(args) as proc:
+            for filename, filesize in self._contents:
+                if only_wanted and filename not in wanted:
+                    continue
+                data = proc.stdout.read(filesize)
+                if len(data) != filesize:
+                    break
+                unicode_name = wanted.pop(filename, None)
+                if unicode_name is None:
+                    continue
+                with self._create_file(os.path.join(destination_dir, unicode_name)) as new:
+                    new.write(data)
+                yield unicode_name
+                if not wanted:
+                    break
+            if wanted or only_wanted:
+                # Nothing more is expected, wait for the exit status.
+                proc.stdout.read()
+                status = proc.wait()
+            else:
+                # Unwanted files are left, do not wait for them.
+                status = 0
+        if status != 0:
+            log.warning('Extraction from "%s" failed with status %d',
+                        self.archive, status)
+        if wanted:
+            log.warning('Extracting %u file(s) from "%s" one by one',
+                        len(wanted), self.archive)
+            for unicode_name in wanted.values():
+                self.extract(unicode_name, destination_dir)
+                yield unicode_name
+
 class MountArchive(BaseArchive):
     def __init__(self,archive,mounter,options=[]):
         super(MountArchive,self).__init__(archive)
@@ -322,6 +483,6 @@ class MountArchive(BaseArchive):
             return False
         if not prefs['mount']:
             return False
-        return shutil.which(mounter) and shutil.which('fusermount')
+        return capabilities.which(mounter) and capabilities.which('fusermount')
 
 # vim: expandtab:sw=4:ts=4
@@ -7,6 +7,7 @@ import tempfile
 
 from mcomix.preferences import prefs
 from mcomix.archive import archive_base
+from mcomix.archive import listing_cache
 from mcomix import archive_tools
 from mcomix import log
 
@@ -28,8 +29,9 @@ class RecursiveArchive(archive_base.BaseArchive):
         self._archive_root = {}
         self._contents_listed = False
         self._contents = []
-        # Assume concurrent extractions are not supported.
+        # Assume concurrent and batch extractions are not supported.
         self.support_concurrent_extractions = False
+        self.support_batch_extractions = False
 
     def _iter_contents(self, archive, root=None, decrypt=True):
         if archive.is_encrypted and not decrypt:
@@ -39,7 +41,9 @@ class RecursiveArchive(archive_base.BaseArchive):
         self._archive_list.append(archive)
         self._archive_root[archive] = root
         sub_archive_list = []
+        listed = []
         for f in archive.iter_contents():
+            listed.append(f)
             if archive_tools.is_archive_file(f):
                 # We found a sub-archive, don't try to extract it now, as we
                 # must finish listing the containing archive contents before
@@ -54,6 +58,8 @@ class RecursiveArchive(archive_base.BaseArchive):
                 name = os.path.join(root, name)
             self._entry_mapping[name] = (archive, f)
             yield name
+        if archive is self._main_archive:
+            listing_cache.store(archive, listed)
         for f in sub_archive_list:
             # Extract sub-archive.
             destination_dir = self.destdir
@@ -83,6 +89,9 @@ class RecursiveArchive(archive_base.BaseArchive):
                 supported = False
                 break
         self.support_concurrent_extractions = supported
+        # Same for batch extractions.
+        self.support_batch_extractions = all(
+            archive.support_batch_extractions for archive in self._archive_list)
 
     def iter_contents(self, decrypt=True):
         if self._contents_listed:
@@ -114,13 +123,40 @@ class RecursiveArchive(archive_base.BaseArchive):
                   archive.archive, destination_dir, filename)
         return archive.extract(name, destination_dir)
 
+    def can_read(self, filename):
+        ''' Returns True if <filename> can be read to memory with read(). '''
+        if not self._contents_listed:
+            self.list_contents()
+        archive, name = self._entry_mapping[filename]
+        return archive.support_read
+
+    def read(self, filename):
+        if not self._contents_listed:
+            self.list_contents()
+        archive, name = self._entry_mapping[filename]
+        return archive.read(name)
+
+    def read_start(self, filename, size):
+        if not self._contents_listed:
+            self.list_contents()
+        archive, name = self._entry_mapping[filename]
+        return archive.read_start(name, size)
+
+    def get_size(self, filename):
+        if not self._contents_listed:
+            self.list_contents()
+        archive, name = self._entry_mapping[filename]
+        return archive.get_size(name)
+
     def iter_extract(self, entries, destination_dir):
         if not self._contents_listed:
             self.list_contents()
         # Unfortunately we can't just rely on BaseArchive default
         # implementation if solid archives are to be correctly supported:
         # we need to call iter_extract (not extract) for each archive ourselves.
-        wanted = set(entries)|self._sub_archives
+        # Keep the order of <entries>, see get_block().
+        wanted = dict.fromkeys(entries)
+        wanted.update(dict.fromkeys(self._sub_archives))
         for archive in self._archive_list:
             archive_wanted = {}
             for name in wanted:
@@ -141,7 +177,8 @@ class RecursiveArchive(archive_base.BaseArchive):
                 if name in self._sub_archives:
                     continue
                 yield name
-            wanted -= set(archive_wanted.values())
+            for name in archive_wanted.values():
+                del wanted[name]
             if 0 == len(wanted):
                 break
 
@@ -154,6 +191,13 @@ class RecursiveArchive(archive_base.BaseArchive):
                 return True
         return False
 
+    def get_block(self, filename):
+        if not self._contents_listed:
+            self.list_contents()
+        archive, name = self._entry_mapping[filename]
+        # Files of different archives are never in the same block.
+        return self._archive_root[archive], archive.get_block(name)
+
     def close(self):
         # close all archives before cleanup temporary directory
         for archive in reversed(self._archive_list):
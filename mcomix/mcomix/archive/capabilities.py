@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+''' Registry of the capabilities of external tools (e.g. whether 7z can
+extract RAR files), probed once per executable and stored on disk until the
+executable changes. '''
+
+import json
+import os
+import shutil
+import threading
+
+from mcomix import constants
+from mcomix import log
+
+#: Bump when the on-disk layout changes.
+_STORE_VERSION = 1
+
+_UNKNOWN = object()
+
+# Held while probing, so that a tool is never probed twice at once.
+_lock = threading.RLock()
+# {command: path or None}
+_executables = {}
+# {(capability, command): value}
+_capabilities = {}
+# On-disk store, loaded on demand: {'capability:command': {'key', 'value'}}
+_store = None
+
+def which(command):
+    ''' Same as shutil.which, looked up once per session. '''
+    with _lock:
+        if command not in _executables:
+            _executables[command] = shutil.which(command)
+        return _executables[command]
+
+def get(capability, command, probe, persist=True):
+    ''' Returns the <capability> of the executable <command>, as returned by
+    probe(command), which must be a JSON value. <probe> is only called if
+    the capability is unknown, or if the executable changed since it was
+    stored. If <persist> is False, the capability is only remembered for
+    the session, e.g. when it depends on files other than the executable. '''
+    with _lock:
+        value = _capabilities.get((capability, command), _UNKNOWN)
+        if value is not _UNKNOWN:
+            return value
+        key = _get_key(command) if persist else None
+        store = _load_store() if persist else {}
+        name = capability + ':' + command
+        entry = store.get(name, None)
+        if key is not None and entry is not None and entry['key'] == key:
+            value = entry['value']
+        else:
+            value = probe(command)
+            if key is not None:
+                store[name] = {'key': key, 'value': value}
+                _save_store()
+        _capabilities[(capability, command)] = value
+        return value
+
+def _get_key(command):
+    path = which(command) or command
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [os.path.abspath(path), stat.st_mtime, stat.st_size]
+
+def _load_store():
+    # this function should be always called in lock
+    global _store
+    if _store is not None:
+        return _store
+    _store = {}
+    if not os.path.isfile(constants.TOOL_CAPABILITIES_PATH):
+        return _store
+    try:
+        with open(constants.TOOL_CAPABILITIES_PATH, mode='rt', encoding='utf8') as fd:
+            store = json.load(fd)
+    except Exception as ex:
+        log.warning(f'! Could not read tool capabilities "{constants.TOOL_CAPABILITIES_PATH}": {ex}')
+        return _store
+    if store.get('version') == _STORE_VERSION:
+        _store = store['capabilities']
+    return _store
+
+def _save_store():
+    # this function should be always called in lock
+    try:
+        os.makedirs(os.path.dirname(constants.TOOL_CAPABILITIES_PATH), 0o700, exist_ok=True)
+        with open(constants.TOOL_CAPABILITIES_PATH, mode='wt', encoding='utf8') as fd:
+            json.dump({
+                'version': _STORE_VERSION,
+                'capabilities': _store,
+            }, fd, ensure_ascii=False)
+    except Exception as ex:
+        log.warning(f'! Could not write tool capabilities "{constants.TOOL_CAPABILITIES_PATH}": {ex}')
+
+# vim: expandtab:sw=4:ts=4
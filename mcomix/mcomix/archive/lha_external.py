@@ -23,9 +23,12 @@ class LhaArchive(archive_base.ExternalExecutableArchive):
         return ['p', '-q2']
 
     def _parse_list_output_line(self, line):
-        match = re.search(r'\[generic\]\s+\d+\s+\S+?\s+\w+\s+\d+\s+\d+\s+(.+)$', line)
+        match = re.search(r'\[generic\]\s+(\d+)\s+\S+?\s+\w+\s+\d+\s+\d+\s+(.+)$', line)
         if match:
-            return match.group(1)
+            filesize = int(match.group(1))
+            if filesize > 0:
+                self._contents.append((match.group(2), filesize))
+            return match.group(2)
         else:
             return None
 
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+''' On-disk cache of archive listings, so that known archives can be opened
+without listing their contents again. '''
+
+import json
+import os
+from hashlib import md5
+
+from mcomix import constants
+from mcomix import log
+from mcomix import tools
+
+#: Bump when the on-disk layout changes.
+_STORE_VERSION = 1
+#: Number of archives whose listing is kept on disk, the least recently
+#: opened ones are dropped first
+_STORE_MAX_ARCHIVES = 1000
+
+def _get_key(path, handler):
+    ''' Returns the key of the archive at <path> opened with <handler>, or
+    None if <path> can not be accessed. '''
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [os.path.abspath(path), stat.st_mtime, stat.st_size,
+            handler.__module__ + '.' + handler.__name__]
+
+def _get_store_path(path):
+    return os.path.join(constants.ARCHIVE_LISTING_PATH,
+                        md5(os.path.abspath(path).encode('utf8', 'surrogateescape')).hexdigest() + '.json')
+
+def load(path, handler):
+    ''' Returns the listing of the archive at <path> as stored by store(),
+    to be passed to <handler> (an archive class), or None if the archive is
+    not known or changed since. '''
+    key = _get_key(path, handler)
+    if key is None:
+        return None
+    store_path = _get_store_path(path)
+    if not os.path.isfile(store_path):
+        return None
+    try:
+        with open(store_path, mode='rt', encoding='utf8') as fd:
+            store = json.load(fd)
+    except Exception as ex:
+        log.warning(f'! Could not read archive listing "{store_path}": {ex}')
+        return None
+    if store.get('version') != _STORE_VERSION or store.get('key') != key:
+        # Archive has changed since.
+        return None
+    try:
+        # Mark as recently used, see store().
+        os.utime(store_path)
+    except OSError:
+        pass
+    log.debug('Using cached listing of "%s"', path)
+    return store['listing']
+
+def store(archive, names):
+    ''' Stores the listing of <archive> (an archive instance), whose
+    contents are <names>, unless it has been opened with a cached listing
+    already. Nothing is stored for encrypted archives. Only the listings of
+    the last _STORE_MAX_ARCHIVES archives opened are kept. '''
+    if not archive.support_listing_cache or archive.listing is not None:
+        return
+    if archive.is_encrypted:
+        return
+    key = _get_key(archive.archive, type(archive))
+    if key is None:
+        return
+    store_path = _get_store_path(archive.archive)
+    try:
+        listing = archive.get_listing()
+        if listing is None:
+            return
+        listing['names'] = list(names)
+        os.makedirs(constants.ARCHIVE_LISTING_PATH, 0o700, exist_ok=True)
+        with open(store_path, mode='wt', encoding='utf8') as fd:
+            json.dump({
+                'version': _STORE_VERSION,
+                'key': key,
+                'listing': listing,
+            }, fd, ensure_ascii=False)
+    except Exception as ex:
+        log.warning(f'! Could not write archive listing "{store_path}": {ex}')
+        try:
+            os.remove(store_path)
+        except OSError:
+            pass
+        return
+    tools.prune_directory(constants.ARCHIVE_LISTING_PATH, _STORE_MAX_ARCHIVES)
+
+# vim: expandtab:sw=4:ts=4
@@ -9,6 +9,7 @@ import re
 from mcomix import log
 from mcomix import process
 from mcomix.archive import archive_base
+from mcomix.archive import capabilities
 
 # Default DPI for rendering.
 PDF_RENDER_DPI_DEF = 72 * 4
@@ -20,6 +21,21 @@ _mutool_exec = []
 _mudraw_exec = []
 _mudraw_trace_args = []
 
+def _probe_mutool_version(mutool):
+    # Find MuPDF version; assume 1.6 version since
+    # the '-v' switch is only supported from 1.7 onward...
+    version = [1,6]
+    with process.popen([mutool, '-v'],
+                       stdout=process.NULL,
+                       stderr=process.PIPE,
+                       universal_newlines=True) as proc:
+        output = re.match(r'mutool version '
+                          r'(?P<version>[\d.]+)([^\d].*)?',
+                          proc.stderr.read())
+        if output:
+            version = list(map(int,output.group('version').split('.')))
+    return version
+
 class PdfArchive(archive_base.BaseArchive):
 
     ''' Concurrent calls to extract welcome! '''
@@ -27,16 +43,26 @@ class PdfArchive(archive_base.BaseArchive):
 
     _fill_image_regex = re.compile(r'^\s*<fill_image\b.*\bmatrix="(?P<matrix>[^"]+)".*\bwidth="(?P<width>\d+)".*\bheight="(?P<height>\d+)".*/>\s*$')
 
-    def __init__(self, archive):
+    ''' Listing the pages spawns mutool. '''
+    support_listing_cache = True
+
+    def __init__(self, archive, listing=None):
         super(PdfArchive, self).__init__(archive)
+        self.listing = listing
 
     def iter_contents(self):
+        if self.listing is not None:
+            yield from self.listing['names']
+            return
         with process.popen(_mutool_exec + ['show', '--', self.archive, 'pages'],
                            universal_newlines=True) as proc:
             for line in proc.stdout:
                 if line.startswith('page '):
                     yield line.split()[1] + '.png'
 
+    def get_listing(self):
+        return {}
+
     def extract(self, filename, destination_dir):
         self._create_directory(destination_dir)
         destination_path = os.path.join(destination_dir, filename)
@@ -82,18 +108,7 @@ class PdfArchive(archive_base.BaseArchive):
             log.debug('mutool executable not found')
         else:
             _mutool_exec.append(mutool)
-            # Find MuPDF version; assume 1.6 version since
-            # the '-v' switch is only supported from 1.7 onward...
-            version = (1,6)
-            with process.popen([mutool, '-v'],
-                               stdout=process.NULL,
-                               stderr=process.PIPE,
-                               universal_newlines=True) as proc:
-                output = re.match(r'mutool version '
-                                  r'(?P<version>[\d.]+)([^\d].*)?',
-                                  proc.stderr.read())
-                if output:
-                    version = tuple(map(int,output.group('version').split('.')))
+            version = tuple(capabilities.get('version', mutool, _probe_mutool_version))
             if version >= (1,8):
                 # Mutool executable with draw support.
                 _mudraw_exec.extend((mutool, 'draw', '-q'))
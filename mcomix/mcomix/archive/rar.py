@@ -5,19 +5,21 @@ resort to calling rar/unrar manually. '''
 
 import sys, os
 import ctypes, ctypes.util
+import threading
 
 from mcomix import constants
 from mcomix.archive import archive_base
 from mcomix import log
 
+# The parameters are LPARAM, as large as pointers.
 if sys.platform == 'win32':
     UNRARCALLBACK = ctypes.WINFUNCTYPE(ctypes.c_int, ctypes.c_uint,
-                                       ctypes.c_long, ctypes.c_long,
-                                       ctypes.c_long)
+                                       ctypes.c_ssize_t, ctypes.c_ssize_t,
+                                       ctypes.c_ssize_t)
 else:
     UNRARCALLBACK = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_uint,
-                                     ctypes.c_long, ctypes.c_long,
-                                     ctypes.c_long)
+                                     ctypes.c_ssize_t, ctypes.c_ssize_t,
+                                     ctypes.c_ssize_t)
 
 class RarArchive(archive_base.BaseArchive):
     ''' Wrapper class for libunrar. All string values passed to this class must be unicode objects.
@@ -26,6 +28,11 @@ class RarArchive(archive_base.BaseArchive):
     # Nope! Not a good idea...
     support_concurrent_extractions = False
 
+    # Files are decompressed to memory, see read(). Not for solid archives
+    # once listed: reading them out of order means decompressing again
+    # from the start.
+    support_read = True
+
     class _OpenMode(object):
         ''' Rar open mode '''
         RAR_OM_LIST    = 0
@@ -34,8 +41,14 @@ class RarArchive(archive_base.BaseArchive):
     class _ProcessingMode(object):
         ''' Rar file processing mode '''
         RAR_SKIP       = 0
+        RAR_TEST       = 1
         RAR_EXTRACT    = 2
 
+    class _CallbackMessage(object):
+        ''' Messages sent to the callback '''
+        UCM_PROCESSDATA = 1
+        UCM_NEEDPASSWORD = 2
+
     class _ErrorCode(object):
         ''' Rar error codes '''
         ERAR_END_ARCHIVE = 10
@@ -113,6 +126,18 @@ class RarArchive(archive_base.BaseArchive):
         # Information about the current file will be stored in this structure
         self._headerdata = RarArchive._RARHeaderDataEx()
         self._current_filename = None
+        # Position of the current file in the archive, and of the next one.
+        self._current_position = None
+        self._next_position = 0
+        # Position of each file in the archive, remembered while listing,
+        # so that the handle is only reopened to read a file behind it.
+        self._positions = {}
+        # Uncompressed size of each file, remembered while listing.
+        self._sizes = {}
+        # Chunks of the file being read, see _process_data().
+        self._data = None
+        # Only one thread at a time can use the handle.
+        self._handle_lock = threading.Lock()
 
         # Set up function prototypes.
         # Mandatory since pointers get truncated on x64 otherwise!
@@ -138,67 +163,92 @@ class RarArchive(archive_base.BaseArchive):
 
     def iter_contents(self):
         ''' List archive contents. '''
-        self._close()
-        self._open()
-        try:
-            while True:
-                self._read_header()
-                if 0 != (0x10 & self._headerdata.Flags):
-                    self._is_solid = True
-                filename = self._current_filename
-                yield filename
-                # Skip to the next entry if we're still on the same name
-                # (extract may have been called by iter_extract).
-                if filename == self._current_filename:
-                    self._process()
-        except UnrarException as exc:
-            log.error('Error while listing contents: %s', str(exc))
-        except EOFError:
-            # End of archive reached.
-            pass
-        finally:
+        filenames = []
+        with self._handle_lock:
             self._close()
-
-    def extract(self, filename, destination_dir):
-        ''' Extract <filename> from the archive to <destination_dir>. '''
-        if not self._handle:
             self._open()
-        looped = False
-        destination_path = os.path.join(destination_dir, filename)
-        while True:
-            # Check if the current entry matches the requested file.
-            if self._current_filename is not None:
-                if (self._current_filename == filename):
-                    # It's the entry we're looking for, extract it.
-                    dest = ctypes.c_wchar_p(destination_path)
-                    self._process(dest)
-                    break
-                # Not the right entry, skip it.
-                self._process()
             try:
-                self._read_header()
+                while True:
+                    self._read_header()
+                    if 0 != (0x10 & self._headerdata.Flags):
+                        self._is_solid = True
+                    filename = self._current_filename
+                    self._positions.setdefault(filename, self._current_position)
+                    self._sizes[filename] = self._headerdata.UnpSize | \
+                        (self._headerdata.UnpSizeHigh << 32)
+                    filenames.append(filename)
+                    self._process()
+            except UnrarException as exc:
+                log.error('Error while listing contents: %s', str(exc))
             except EOFError:
-                # Archive end was reached, this might be due to out-of-order
-                # extraction while the handle was still open.  Close the
-                # archive and jump back to archive start and try to extract
-                # file again.  Do this only once; if the file isn't found after
-                # a second full pass, it probably doesn't even exist in the
-                # archive.
-                if looped:
-                    break
-                self._open()
+                # End of archive reached.
+                pass
+            finally:
+                self._close()
+        if self._is_solid:
+            self.support_read = False
+        yield from filenames
+
+    def get_size(self, filename):
+        return self._sizes.get(filename, None)
+
+    def read(self, filename):
+        ''' Decompress <filename> to memory and return its content. '''
         # After the method returns, the RAR handler is still open and pointing
-        # to the next archive file. This will improve extraction speed for sequential file reads.
-        # After all files have been extracted, close() should be called to free the handler resources.
+        # to the next archive file. This will improve read speed for sequential file reads.
+        # After all files have been read, close() should be called to free the handler resources.
+        with self._handle_lock:
+            position = self._positions.get(filename, None)
+            if self._current_filename == filename:
+                return self._process_data()
+            if self._handle is None or \
+               (position is not None and position < self._next_position):
+                # Files can only be read going forward.
+                self._close()
+                self._open()
+            looped = False
+            while True:
+                try:
+                    self._read_header()
+                except EOFError:
+                    # Archive end was reached, the file is not where it was
+                    # listed (if it was). Jump back to archive start and try
+                    # to read it again. Do this only once; if the file isn't
+                    # found after a second full pass, it probably doesn't
+                    # even exist in the archive.
+                    if looped:
+                        raise UnrarException('No such file: %s' % filename)
+                    looped = True
+                    self._open()
+                    continue
+                if self._current_filename == filename:
+                    return self._process_data()
+                # Not the right entry, skip it.
+                self._process()
+
+    def extract(self, filename, destination_dir):
+        ''' Extract <filename> from the archive to <destination_dir>. '''
+        destination_path = os.path.join(destination_dir, filename)
+        data = self.read(filename)
+        with self._create_file(destination_path) as new:
+            new.write(data)
         return destination_path
 
+    def iter_extract(self, entries, destination_dir):
+        # In the archive order, so that the handle is never reopened.
+        for filename in sorted(entries, key=lambda name: self._positions.get(name, 0)):
+            self.extract(filename, destination_dir)
+            yield filename
+
     def close(self):
         ''' Close the archive handle '''
-        self._close()
+        with self._handle_lock:
+            self._close()
 
     def _open(self):
         ''' Open rar handle for extraction. '''
-        self._callback_function = UNRARCALLBACK(self._password_callback)
+        self._close()
+        self._callback_function = UNRARCALLBACK(self._callback)
         archivedata = RarArchive._RAROpenArchiveDataEx(ArcNameW=self.archive,
                                                        OpenMode=RarArchive._OpenMode.RAR_OM_EXTRACT,
                                                        Callback=self._callback_function,
@@ -210,6 +260,9 @@ class RarArchive(archive_base.BaseArchive):
             raise UnrarException('Couldn\'t open archive: %s' % errormessage)
         self._unrar.RARSetCallback(handle, self._callback_function, 0)
         self._handle = handle
+        self._current_filename = None
+        self._current_position = None
+        self._next_position = 0
 
     def _has_encryption(self):
         ''' Checks archive encryption. '''
@@ -224,6 +277,7 @@ class RarArchive(archive_base.BaseArchive):
             errormessage = UnrarException.get_error_message(archivedata.OpenResult)
             raise UnrarException('Couldn\'t open archive: %s' % errormessage)
         self._handle = handle
+        self._next_position = 0
         # 0x0080 Block headers are encrypted
         if archivedata.Flags & 0x0080:
             self.is_encrypted = True
@@ -252,17 +306,25 @@ class RarArchive(archive_base.BaseArchive):
         errorcode = self._unrar.RARReadHeaderEx(self._handle, ctypes.byref(self._headerdata))
         self._check_errorcode(errorcode)
         self._current_filename = self._headerdata.FileNameW
+        self._current_position = self._next_position
+        self._next_position += 1
 
-    def _process(self, dest=None):
-        ''' Process current entry: extract or skip it. '''
-        if dest is None:
-            mode = RarArchive._ProcessingMode.RAR_SKIP
-        else:
-            mode = RarArchive._ProcessingMode.RAR_EXTRACT
-        errorcode = self._unrar.RARProcessFileW(self._handle, mode, None, dest)
+    def _process(self, mode=_ProcessingMode.RAR_SKIP):
+        ''' Process current entry: skip or test it. '''
+        errorcode = self._unrar.RARProcessFileW(self._handle, mode, None, None)
         self._current_filename = None
         self._check_errorcode(errorcode)
 
+    def _process_data(self):
+        ''' Decompress the current entry and return its content, which is
+        passed to _callback() chunk by chunk. '''
+        self._data = []
+        try:
+            self._process(RarArchive._ProcessingMode.RAR_TEST)
+            return b''.join(self._data)
+        finally:
+            self._data = None
+
     def _close(self):
         ''' Close the rar handle previously obtained by open. '''
         if self._handle is None:
@@ -273,9 +335,14 @@ class RarArchive(archive_base.BaseArchive):
             raise UnrarException('Couldn\'t close archive: %s' % errormessage)
         self._handle = None
 
-    def _password_callback(self, msg, userdata, buffer_address, buffer_size):
-        ''' Called by the unrar library in case of missing password. '''
-        if msg == 2: # UCM_NEEDPASSWORD
+    def _callback(self, msg, userdata, buffer_address, buffer_size):
+        ''' Called by the unrar library with decompressed data, or in case of
+        missing password. '''
+        if msg == RarArchive._CallbackMessage.UCM_PROCESSDATA:
+            if self._data is not None:
+                self._data.append(ctypes.string_at(buffer_address, buffer_size))
+            return 1
+        if msg == RarArchive._CallbackMessage.UCM_NEEDPASSWORD:
             self._get_password()
             if len(self._password) == 0:
                 # Abort extraction
@@ -15,18 +15,22 @@ _rar_executable = -1
 class RarArchive(archive_base.ExternalExecutableArchive):
     ''' RAR file extractor using the unrar/rar executable. '''
 
+    support_listing_cache = True
+
     STATE_HEADER, STATE_LISTING = 1, 2
 
     class EncryptedHeader(Exception):
         pass
 
-    def __init__(self, archive):
+    def __init__(self, archive, listing=None):
         super(RarArchive, self).__init__(archive)
         self._is_solid = False
-        self._contents = []
 
         self.is_encrypted =  False
-        self.is_encrypted = self._has_encryption()
+        if listing is not None:
+            self._set_listing(listing)
+        else:
+            self.is_encrypted = self._has_encryption()
 
     def _get_executable(self):
         return self._find_unrar_executable()
@@ -54,6 +58,12 @@ class RarArchive(archive_base.ExternalExecutableArchive):
         args.extend(('--', self.archive))
         return args
 
+    def _get_batch_extract_arguments(self, filenames):
+        args = self._get_extract_arguments()
+        if filenames is not None:
+            args.extend(filenames)
+        return args
+
     def _parse_list_output_line(self, line):
         if self._state == self.STATE_HEADER:
             if line.startswith('Details: '):
@@ -80,6 +90,16 @@ class RarArchive(archive_base.ExternalExecutableArchive):
     def is_solid(self):
         return self._is_solid
 
+    def get_listing(self):
+        listing = super(RarArchive, self).get_listing()
+        listing.update(solid=self._is_solid, contents=self._contents)
+        return listing
+
+    def _set_listing(self, listing):
+        super(RarArchive, self)._set_listing(listing)
+        self._is_solid = listing['solid']
+        self._contents = [tuple(entry) for entry in listing['contents']]
+
     def _has_encryption(self):
         with process.popen(self._get_list_arguments(),
                            stderr=process.STDOUT,
@@ -93,6 +113,10 @@ class RarArchive(archive_base.ExternalExecutableArchive):
         return False
 
     def iter_contents(self):
+        if self.listing is not None:
+            yield from self.listing['names']
+            return
+
         if not self._get_executable():
             return
 
@@ -133,36 +157,10 @@ class RarArchive(archive_base.ExternalExecutableArchive):
         destination_path = os.path.join(destination_dir, filename)
         desired_filename = self._original_filename(filename)
         cmd = self._get_extract_arguments() + [desired_filename]
-        with self._create_file(destination_path) as output:
+        with self._processes, self._create_file(destination_path) as output:
             process.call(cmd, stdout=output)
         return destination_path
 
-    def iter_extract(self, entries, destination_dir):
-
-        if not self._get_executable():
-            return
-
-        if not self.filenames_initialized:
-            self.list_contents()
-
-        with process.popen(self._get_extract_arguments()) as proc:
-            wanted = dict([(self._original_filename(unicode_name), unicode_name)
-                           for unicode_name in entries])
-
-            for filename, filesize in self._contents:
-                data = proc.stdout.read(filesize)
-                if filename not in wanted:
-                    continue
-                unicode_name = wanted.get(filename, None)
-                if unicode_name is None:
-                    continue
-                with self._create_file(os.path.join(destination_dir, unicode_name)) as new:
-                    new.write(data)
-                yield unicode_name
-                del wanted[filename]
-                if 0 == len(wanted):
-                    break
-
     @staticmethod
     def _find_unrar_executable():
         ''' Tries to start rar/unrar, and returns either 'rar' or 'unrar' if
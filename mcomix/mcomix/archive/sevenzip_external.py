@@ -8,6 +8,7 @@ import tempfile
 
 from mcomix import process
 from mcomix.archive import archive_base
+from mcomix.archive import capabilities
 
 # Filled on-demand by SevenZipArchive
 _7z_executable = -1
@@ -17,8 +18,16 @@ def is_7z_support_rar():
     if sys.platform=='win32':
         # assume 7z in windows already support rar
         return True
+    executable = SevenZipArchive._find_7z_executable()
+    if not executable:
+        return False
+    # Rar.so is a plugin, which can be installed or removed without the 7z
+    # executable changing: only remember it for the session.
+    return capabilities.get('rar', executable, _probe_rar_support, persist=False)
+
+def _probe_rar_support(executable):
     has_rar_so=False
-    with process.popen((SevenZipArchive._find_7z_executable(),'i'),
+    with process.popen((executable,'i'),
                        universal_newlines=True) as proc:
         libsblock=False
         for line in proc.stdout:
@@ -37,18 +46,24 @@ def is_7z_support_rar():
 class SevenZipArchive(archive_base.ExternalExecutableArchive):
     ''' 7z file extractor using the 7z executable. '''
 
+    support_listing_cache = True
+
     STATE_HEADER, STATE_LISTING, STATE_FOOTER = 1, 2, 3
 
     class EncryptedHeader(Exception):
         pass
 
-    def __init__(self, archive):
+    def __init__(self, archive, listing=None):
         super(SevenZipArchive, self).__init__(archive)
         self._is_solid = False
-        self._contents = []
+        # Solid block of each file: {original filename: block}
+        self._blocks = {}
 
         self.is_encrypted = False
-        self.is_encrypted = self._has_encryption()
+        if listing is not None:
+            self._set_listing(listing)
+        else:
+            self.is_encrypted = self._has_encryption()
 
     def _get_executable(self):
         return SevenZipArchive._find_7z_executable()
@@ -113,6 +128,8 @@ class SevenZipArchive(archive_base.ExternalExecutableArchive):
                 filesize = int(line[7:])
                 if filesize > 0:
                     self._contents.append((self._path, filesize))
+            if line.startswith('Block = '):
+                self._blocks[self._path] = int(line[8:])
 
         return None
 
@@ -130,7 +147,24 @@ class SevenZipArchive(archive_base.ExternalExecutableArchive):
     def is_solid(self):
         return self._is_solid
 
+    def get_listing(self):
+        listing = super(SevenZipArchive, self).get_listing()
+        listing.update(solid=self._is_solid, contents=self._contents,
+                       blocks=self._blocks)
+        return listing
+
+    def _set_listing(self, listing):
+        super(SevenZipArchive, self)._set_listing(listing)
+        self._is_solid = listing['solid']
+        self._contents = [tuple(entry) for entry in listing['contents']]
+        # Listings cached before blocks were stored have none.
+        self._blocks = listing.get('blocks', {})
+
     def iter_contents(self):
+        if self.listing is not None:
+            yield from self.listing['names']
+            return
+
         if not self._get_executable():
             return
 
@@ -173,12 +207,19 @@ class SevenZipArchive(archive_base.ExternalExecutableArchive):
             desired_filename = self._original_filename(filename)
             tmplistfile.write(desired_filename + os.linesep)
             tmplistfile.flush()
-            with self._create_file(destination_path) as output:
+            with self._processes, self._create_file(destination_path) as output:
                 process.call(self._get_extract_arguments(list_file=tmplistfile.name),
                              stdout=output)
         return destination_path
 
+    def get_block(self, filename):
+        return self._blocks.get(self._original_filename(filename), None)
+
     def iter_extract(self, entries, destination_dir):
+        ''' Extract <entries> to <destination_dir>, with a single 7z process
+        for non-solid archives, and one per solid block otherwise, starting
+        with the block of the first entry. Each block is only decompressed
+        up to its last entry. '''
 
         if not self._get_executable():
             return
@@ -186,23 +227,29 @@ class SevenZipArchive(archive_base.ExternalExecutableArchive):
         if not self.filenames_initialized:
             self.list_contents()
 
-        with process.popen(self._get_extract_arguments()) as proc:
-            wanted = dict([(self._original_filename(unicode_name), unicode_name)
-                           for unicode_name in entries])
-
-            for filename, filesize in self._contents:
-                data = proc.stdout.read(filesize)
-                if filename not in wanted:
-                    continue
-                unicode_name = wanted.get(filename, None)
-                if unicode_name is None:
-                    continue
-                with self._create_file(os.path.join(destination_dir, unicode_name)) as new:
-                    new.write(data)
-                yield unicode_name
-                del wanted[filename]
-                if 0 == len(wanted):
-                    break
+        if not self._is_solid:
+            yield from self._iter_extract(entries, destination_dir)
+            return
+
+        blocks = {}
+        for unicode_name in entries:
+            blocks.setdefault(self.get_block(unicode_name), []).append(unicode_name)
+        for block_entries in blocks.values():
+            yield from self._iter_extract(block_entries, destination_dir)
+
+    def _iter_extract(self, entries, destination_dir):
+        wanted = dict([(self._original_filename(unicode_name), unicode_name)
+                       for unicode_name in entries])
+        if not wanted:
+            return
+
+        with tempfile.NamedTemporaryFile(mode='wt', prefix='mcomix.7z.') as tmplistfile:
+            for filename in wanted:
+                tmplistfile.write(filename + os.linesep)
+            tmplistfile.flush()
+            yield from self._iter_extract_output(
+                self._get_extract_arguments(list_file=tmplistfile.name),
+                wanted, destination_dir)
 
     @staticmethod
     def _find_7z_executable():
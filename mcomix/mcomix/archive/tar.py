@@ -3,6 +3,7 @@
 ''' Unicode-aware wrapper for tarfile.TarFile. '''
 
 import collections
+import mmap
 import os
 import tarfile
 import threading
@@ -11,15 +12,41 @@ from mcomix import log
 from mcomix.archive import archive_base
 
 class TarArchive(archive_base.NonUnicodeArchive):
-    def __init__(self, archive):
+    # Listing a compressed tar file means decompressing all of it, and
+    # the listing of uncompressed ones is their index of member offsets.
+    support_listing_cache = True
+
+    def __init__(self, archive, listing=None):
         super(TarArchive, self).__init__(archive)
-        self._tar = tarfile.open(self.archive, 'r:*')
+        try:
+            self._tar = tarfile.open(self.archive, 'r:')
+            self._compressed = False
+        except tarfile.ReadError:
+            self._tar = tarfile.open(self.archive, 'r:*')
+            self._compressed = True
         self._lock = threading.Lock()
+        # Files of uncompressed tar files are sliced from a memory map of
+        # the archive at their offset, by any thread and in any order, see
+        # read. Compressed ones can only be decompressed in order.
+        self.support_read = not self._compressed
+        self.support_concurrent_extractions = not self._compressed
+        self._mmap = None
+        self._closed = False
 
         # tarfile is not thread-safe
         # so use OrderedDict to save TarInfo in order
         # {unicode_name: TarInfo}
         self._contents_info = collections.OrderedDict()
+        if listing is not None:
+            self.listing = listing
+            for name, member_name, member_type, size, offset, offset_data in listing['members']:
+                member = tarfile.TarInfo(member_name)
+                member.type = member_type.encode('latin-1')
+                member.size = size
+                member.offset = offset
+                member.offset_data = offset_data
+                self._contents_info[name] = member
+            return
         for member in self._tar.getmembers():
             if tarfile.ENCODING == 'utf-8':
                 # filename is utf8 encoded
@@ -31,26 +58,83 @@ class TarArchive(archive_base.NonUnicodeArchive):
                 self._contents_info[self._unicode_filename(name_bytes)] = member
 
     def is_solid(self):
-        return True
+        return self._compressed
 
     def iter_contents(self):
         yield from self._contents_info.keys()
 
-    def extract(self, filename, destination_dir):
-        destination_path = os.path.join(destination_dir, filename)
+    def get_listing(self):
+        members = []
+        for name, member in self._contents_info.items():
+            if not (member.isreg() or member.isdir()) or member.sparse is not None:
+                # tarfile needs the other members to extract these.
+                return None
+            members.append((name, member.name, member.type.decode('latin-1'),
+                            member.size, member.offset, member.offset_data))
+        return {'members': members}
+
+    def get_size(self, filename):
+        return self._contents_info[filename].size
+
+    def read(self, filename):
         member = self._contents_info[filename]
+        if not self._compressed and member.isreg() and member.sparse is None:
+            data = self._read_direct(member)
+            if data is not None:
+                return data
         with self._lock:
             try:
                 with self._tar.extractfile(member) as fp:
-                    data = fp.read()
+                    return fp.read()
             except AttributeError:
                 log.warning(_('Corrupted file: %(filename)s'),
                             {'filename': filename})
-            with self._create_file(destination_path) as new:
-                new.write(data)
+                return b''
+
+    def read_start(self, filename, size):
+        member = self._contents_info[filename]
+        if not self._compressed and member.isreg() and member.sparse is None:
+            data = self._read_direct(member, size)
+            if data is not None:
+                return data
+        return self.read(filename)
+
+    def _read_direct(self, member, size=None):
+        ''' Returns the content of the regular file <member> (only its first
+        <size> bytes if given), sliced from a memory map of the archive, or
+        None if it is out of the archive. '''
+        if member.size == 0:
+            return b''
+        with self._lock:
+            if self._mmap is None:
+                if self._closed:
+                    return None
+                with open(self.archive, 'rb') as f:
+                    self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            mm = self._mmap
+        length = member.size if size is None else min(size, member.size)
+        try:
+            data = mm[member.offset_data:member.offset_data + length]
+        except ValueError:
+            # The memory map was closed meanwhile, see close.
+            return None
+        if len(data) != length:
+            return None
+        return data
+
+    def extract(self, filename, destination_dir):
+        destination_path = os.path.join(destination_dir, filename)
+        data = self.read(filename)
+        with self._create_file(destination_path) as new:
+            new.write(data)
         return destination_path
 
     def close(self):
-        self._tar.close()
+        with self._lock:
+            self._closed = True
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+            self._tar.close()
 
 # vim: expandtab:sw=4:ts=4
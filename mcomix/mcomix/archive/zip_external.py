@@ -2,6 +2,8 @@
 
 ''' ZIP archive extractor via executable.'''
 
+import re
+
 from mcomix import i18n
 from mcomix import process
 from mcomix.archive import archive_base
@@ -16,7 +18,19 @@ class ZipArchive(archive_base.ExternalExecutableArchive):
         return ZipArchive._find_unzip_executable()
 
     def _get_list_arguments(self):
-        return ['-Z1']
+        return ['-Zl']
+
+    def _parse_list_output_line(self, line):
+        # Format: permissions version system size type compressed-size
+        # method date time name
+        match = re.match(r'\S+\s+\d+\.\d+\s+\S+\s+(\d+)\s+\S+\s+\d+\s+\S+\s+\S+\s+\S+ (.+)$', line)
+        if not match:
+            return None
+        filename = match.group(2)
+        filesize = int(match.group(1))
+        if filesize > 0:
+            self._contents.append((self._escape_filename(filename), filesize))
+        return filename
 
     def _get_extract_arguments(self):
         return ['-p', '-P', '']
@@ -37,12 +51,16 @@ class ZipArchive(archive_base.ExternalExecutableArchive):
     def _unicode_filename(self, filename, conversion_func=i18n.to_unicode):
         unicode_name = conversion_func(filename)
         safe_name = self._replace_invalid_filesystem_chars(unicode_name)
+        self.unicode_mapping[safe_name] = self._escape_filename(filename)
+        return safe_name
+
+    @staticmethod
+    def _escape_filename(filename):
+        ''' Returns <filename> as a pattern matching only itself. '''
         # As it turns out, unzip will try to interpret filenames as glob...
         for c in '[*?':
             filename = filename.replace(c, '[' + c + ']')
         # Won't work on Windows...
-        filename = filename.replace('\\', '\\\\')
-        self.unicode_mapping[safe_name] = filename
-        return safe_name
+        return filename.replace('\\', '\\\\')
 
 # vim: expandtab:sw=4:ts=4
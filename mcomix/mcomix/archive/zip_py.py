@@ -3,10 +3,14 @@
 ''' Unicode-aware wrapper for zipfile.ZipFile. '''
 
 import collections
+import mmap
 import os
+import struct
 import threading
 import zipfile
+import zlib
 
+from mcomix import constants
 from mcomix import log
 from mcomix.archive import archive_base
 
@@ -14,21 +18,80 @@ def is_py_supported_zipfile(path):
     '''Check if a given zipfile has all internal files stored with Python supported compression
     '''
     with zipfile.ZipFile(path, mode='r') as zip_file:
-        for file_info in zip_file.infolist():
-            try:
-                descr=zipfile._get_decompressor(file_info.compress_type)
-            except:
-                return False
+        return is_py_supported_infolist(zip_file.infolist())
+
+def is_py_supported_infolist(infolist):
+    ''' Same as is_py_supported_zipfile, for the ZipInfo list of an
+    already parsed central directory. '''
+    for file_info in infolist:
+        try:
+            descr=zipfile._get_decompressor(file_info.compress_type)
+        except:
+            return False
     return True
 
+# Central directory of a ZIP file, as parsed by zipfile.ZipFile: its ZipInfo
+# list, and the other ZipFile attributes set by _RealGetContents (None if
+# not found).
+ZipDirectory = collections.namedtuple('ZipDirectory', 'infolist start_dir comment')
+
+def get_directory(zip_file):
+    ''' Returns the ZipDirectory of the opened zipfile.ZipFile <zip_file>. '''
+    return ZipDirectory(zip_file.infolist(),
+                        getattr(zip_file, 'start_dir', None),
+                        getattr(zip_file, '_comment', None))
+
+class _ZipFile(zipfile.ZipFile):
+    ''' zipfile.ZipFile reusing the ZipDirectory <directory> of an already
+    parsed central directory, if given, instead of reading it again. '''
+
+    def __init__(self, file, directory=None):
+        self._directory = directory
+        super(_ZipFile, self).__init__(file, 'r')
+
+    def _RealGetContents(self):
+        # Checked against CPython 3.11: besides filling filelist and
+        # NameToInfo, _RealGetContents only sets start_dir and _comment.
+        # The central directory is parsed again if any of them is missing.
+        directory = self._directory
+        if directory is None or None in directory or \
+           not hasattr(self, 'filelist') or not hasattr(self, 'NameToInfo'):
+            return super(_ZipFile, self)._RealGetContents()
+        self.start_dir = directory.start_dir
+        self._comment = directory.comment
+        for info in directory.infolist:
+            self.filelist.append(info)
+            self.NameToInfo[info.filename] = info
+
+# Local file header: signature, ..., file name length, extra field length.
+_LOCAL_HEADER = struct.Struct('<4s22xHH')
+# Compressed bytes inflated at once when only the start of a file is read.
+_CHUNK_SIZE = 16 * 1024
+
 class ZipArchive(archive_base.NonUnicodeArchive):
-    def __init__(self, archive):
+    support_read = True
+    # Members are read concurrently from a memory map of the archive, or
+    # from independent zipfile handles, see read.
+    support_concurrent_extractions = True
+
+    def __init__(self, archive, directory=None):
+        ''' <directory> is the ZipDirectory of <archive>, if its central
+        directory has been parsed already, see
+        archive_tools.archive_mime_type. '''
         super(ZipArchive, self).__init__(archive)
-        self._zip = zipfile.ZipFile(archive, 'r')
+        self._zip = _ZipFile(archive, directory=directory)
         self._lock = threading.Lock()
+        # Memory map of the archive, to read stored and deflated files
+        # without going through zipfile, see _read_direct.
+        self._mmap = None
+        # zipfile is not thread-safe, so each thread reading through
+        # zipfile needs its own handle, see _get_handle.
+        self._handles = [self._zip]
+        self._handle_count = 1
+        self._handle_released = threading.Condition(self._lock)
+        self._closed = False
 
-        # zipfile is usually not thread-safe
-        # so use OrderedDict to save ZipInfo in order
+        # use OrderedDict to save ZipInfo in order
         # {unicode_name: ZipInfo}
         self._contents_info = collections.OrderedDict()
         for info in self._zip.infolist():
@@ -44,22 +107,141 @@ class ZipArchive(archive_base.NonUnicodeArchive):
         self.is_encrypted = self._has_encryption()
         self._password = None
 
-    def is_solid(self):
-        # zipfile is usually not thread-safe
-        # so treat it as a solid archive to reduce seek operate
-        return True
-
     def iter_contents(self):
         if self.is_encrypted and not self._password:
             self._get_password()
             self._zip.setpassword(self._password)
         yield from self._contents_info.keys()
 
+    def get_size(self, filename):
+        return self._contents_info[filename].file_size
+
+    def read(self, filename):
+        info = self._contents_info[filename]
+        if info.compress_type in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED) and \
+                not info.flag_bits & 0x1:
+            data = self._read_direct(info)
+            if data is not None:
+                return data
+        handle = self._get_handle()
+        try:
+            return handle.read(info)
+        finally:
+            self._release_handle(handle)
+
+    def read_start(self, filename, size):
+        info = self._contents_info[filename]
+        if info.file_size <= size or info.flag_bits & 0x1:
+            return self.read(filename)
+        if info.compress_type in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            data = self._read_direct(info, size)
+            if data is not None:
+                return data
+        handle = self._get_handle()
+        try:
+            with handle.open(info) as fp:
+                return fp.read(size)
+        finally:
+            self._release_handle(handle)
+
+    def _get_handle(self):
+        ''' Returns a zipfile handle no other thread is using, opening a new
+        one if needed (up to one per core). '''
+        with self._lock:
+            while not self._handles:
+                if self._closed:
+                    raise ValueError('Attempt to read ZIP archive that was already closed')
+                if self._handle_count < (constants.CPU_COUNT or 1):
+                    self._handle_count += 1
+                    break
+                self._handle_released.wait()
+            else:
+                return self._handles.pop()
+        try:
+            handle = _ZipFile(self.archive, directory=get_directory(self._zip))
+        except:
+            with self._lock:
+                self._handle_count -= 1
+                self._handle_released.notify()
+            raise
+        if self._zip.pwd:
+            handle.setpassword(self._zip.pwd)
+        return handle
+
+    def _release_handle(self, handle):
+        with self._lock:
+            if self._closed:
+                handle.close()
+                return
+            self._handles.append(handle)
+            self._handle_released.notify()
+
+    def _read_direct(self, info, size=None):
+        ''' Returns the content of the stored or deflated file <info>,
+        sliced from a memory map of the archive (and inflated), or None if
+        it must be read with zipfile instead. zlib releases the GIL, so
+        concurrent reads are inflated in parallel. If <size> is given, only
+        the first <size> bytes are returned, without checking the CRC. '''
+        with self._lock:
+            if self._closed:
+                return None
+            if self._mmap is None:
+                try:
+                    with open(self.archive, 'rb') as f:
+                        self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except (OSError, ValueError):
+                    # e.g. empty archive
+                    return None
+            mm = self._mmap
+        try:
+            return self._read_mapped(info, mm, size)
+        except ValueError:
+            # The memory map was closed meanwhile, see close.
+            return None
+
+    def _read_mapped(self, info, mm, size):
+        header = mm[info.header_offset:info.header_offset + _LOCAL_HEADER.size]
+        if len(header) != _LOCAL_HEADER.size:
+            return None
+        signature, name_length, extra_length = _LOCAL_HEADER.unpack(header)
+        if signature != b'PK\x03\x04':
+            return None
+        start = info.header_offset + _LOCAL_HEADER.size + name_length + extra_length
+        if size is not None and size < info.file_size:
+            return self._read_direct_start(info, mm, start, size)
+        data = mm[start:start + info.compress_size]
+        if info.compress_type == zipfile.ZIP_DEFLATED:
+            try:
+                data = zlib.decompress(data, -zlib.MAX_WBITS, max(info.file_size, 1))
+            except zlib.error:
+                return None
+        if len(data) != info.file_size or zlib.crc32(data) != info.CRC:
+            return None
+        return data
+
+    @staticmethod
+    def _read_direct_start(info, mm, start, size):
+        ''' Returns the first <size> bytes of the stored or deflated file
+        <info>, whose data starts at <start> in the memory map <mm>, only
+        inflating what is needed. '''
+        end = start + info.compress_size
+        if info.compress_type == zipfile.ZIP_STORED:
+            return mm[start:min(start + size, end)]
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        data = b''
+        try:
+            while len(data) < size and start < end:
+                chunk = mm[start:min(start + _CHUNK_SIZE, end)]
+                start += len(chunk)
+                data += decompressor.decompress(chunk, size - len(data))
+        except zlib.error:
+            return None
+        return data
+
     def extract(self, filename, destination_dir):
         destination_path = os.path.join(destination_dir, filename)
         info = self._contents_info[filename]
-        with self._lock:
-            data = self._zip.read(info)
+        data = self.read(filename)
         with self._create_file(destination_path) as new:
             filelen = new.write(data)
 
@@ -73,7 +255,16 @@ class ZipArchive(archive_base.NonUnicodeArchive):
         return destination_path
 
     def close(self):
-        self._zip.close()
+        with self._lock:
+            self._closed = True
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+            # Handles in use are closed once released.
+            for handle in self._handles:
+                handle.close()
+            self._handles.clear()
+            self._handle_released.notify_all()
 
     def _has_encryption(self):
         ''' Checks all files in the archive for encryption.
@@ -1,15 +1,24 @@
 """archive_extractor.py - Archive extraction class."""
 
+import heapq
 import os
+import sys
 import threading
 import traceback
 
+from gi.repository import GLib
+
 from mcomix import archive_tools
 from mcomix import callback
+from mcomix import constants
 from mcomix import log
 from mcomix.lib import mt
 from mcomix.preferences import prefs
 
+#: Number of files extracted at once from archives supporting batch
+#: extractions, see BaseArchive.support_batch_extractions
+_BATCH_SIZE = 8
+
 
 class Extractor(object):
     """Extractor is a threaded class for extracting different archive formats.
@@ -20,7 +29,18 @@ class Extractor(object):
     order in which they should be extracted.  The extraction can then be
     started in a new thread in which files are extracted one by one, and a
     signal is sent on a condition after each extraction, so that it is possible
-    for other threads to wait on specific files to be ready.
+    for other threads to wait on specific files to be ready. The main thread
+    is notified of extracted files in batches, see files_extracted().
+
+    Files can be given priority at any time with prioritize(): the next
+    file extracted by each thread is the most wanted one at that time. Solid
+    archives are extracted block by block (see BaseArchive.get_block()),
+    starting with the block of the most wanted file, and archives which
+    support it are extracted in batches of files.
+
+    Files which can be read from the archive to memory (see
+    keep_in_memory()) are not written to the destination directory, unless
+    a path to them is really needed (see write_file()).
 
     Note: Support for gzip/bzip2 compressed tar archives is limited, see
     set_files() for more info.
@@ -40,6 +60,15 @@ class Extractor(object):
         self._src = src
         self._files = []
         self._extracted = set()
+        #: Files left to extract, by priority
+        self._queue = _ExtractionQueue()
+        #: Extracted files the main thread has not been notified of yet
+        self._unnotified = []
+        #: Files read from the archive to memory instead of being extracted
+        self._in_memory = frozenset()
+        #: Files of _in_memory written to the destination directory anyway
+        self._written = set()
+        self._write_lock = threading.Lock()
         self._archive = archive_tools.get_recursive_archive_handler(
                 src, typ=typ, prefix='mcomix.extractor.')
         if self._archive is None:
@@ -67,7 +96,7 @@ class Extractor(object):
         with self._condition:
             if not self._contents_listed:
                 return
-            return self._files[:]
+            return [f for f in self._files if f not in self._extracted]
 
     def get_directory(self):
         """Returns the root extraction directory of this extractor."""
@@ -89,15 +118,78 @@ class Extractor(object):
             if not self._contents_listed:
                 return
             self._files[:] = [f for f in files if f not in self._extracted]
+            self._queue.set_files(self._files)
             if not self._files:
                 # Nothing to do!
                 return
             if self._extract_started:
-                self.extract()
+                self._start_workers()
+
+    def prioritize(self, files):
+        """Extract <files> (from the file list set by set_files()) before any
+        other file, in this order. Files given priority by a previous call
+        but not in <files> fall back to their place in the file list, e.g.
+        pages no longer around the current one. A file being extracted is
+        not interrupted, but a batch or a block of files is once none of its
+        files left is given priority, and it is resumed later on.
+        """
+        with self._condition:
+            if not self._contents_listed:
+                return
+            self._queue.prioritize(files)
+
+    def keep_in_memory(self, files):
+        """Do not extract the <files> which can be read from the archive to
+        memory: they are ready right away, see read(). Must be called before
+        set_files().
+        """
+        with self._condition:
+            if not self._contents_listed:
+                return
+            self._in_memory = frozenset(f for f in files if self._archive.can_read(f))
+            ready = [f for f in self._in_memory if f not in self._extracted]
+        log.debug('Reading %u file(s) from "%s" to memory', len(ready), self._src)
+        for name in ready:
+            self._extraction_finished(name)
+
+    def read(self, name, size=None):
+        """Return the content of the file <name> as bytes if it is read from
+        the archive to memory (see keep_in_memory()), or None if it is
+        extracted to the destination directory. If <size> is given, only at
+        least the first <size> bytes of the file are returned.
+        """
+        if name not in self._in_memory:
+            return None
+        if size is not None:
+            return self._archive.read_start(name, size)
+        return self._archive.read(name)
+
+    def get_size(self, name):
+        """Return the size of the file <name> as listed in the archive if it
+        is read to memory (see keep_in_memory()), or None if it is extracted
+        to the destination directory or its size is not listed.
+        """
+        if name not in self._in_memory:
+            return None
+        return self._archive.get_size(name)
+
+    def write_file(self, name):
+        """Return the path of the file <name> in the destination directory,
+        writing it first if it is only read to memory (see keep_in_memory()),
+        for features which need an actual file.
+        """
+        if name not in self._in_memory:
+            return os.path.join(self._dst, name)
+        with self._write_lock:
+            if name not in self._written:
+                log.debug('Writing "%s" to "%s"', name, self._dst)
+                self._archive.extract(name)
+                self._written.add(name)
+        return os.path.join(self._dst, name)
 
     def is_ready(self, name):
         """Return True if the file <name> in the extractor's file list
-        (as set by set_files()) is fully extracted.
+        (as set by set_files()) is fully extracted, or can be read to memory.
         """
         with self._condition:
             return name in self._extracted
@@ -122,16 +214,31 @@ class Extractor(object):
             if not self._contents_listed:
                 return
             if not self._extract_started:
-                multi_thread = self._archive.support_concurrent_extractions and not self._archive.is_solid()
-                if multi_thread:
-                    self._threadpool.ucbmap(
-                            self._extract_file, self._files,
-                            callback=self._extraction_finished,
-                            error_callback=self._extract_files_errcb)
+                self._extract_started = True
+                if self._archive.is_solid():
+                    self._max_workers = 1
+                elif self._archive.support_concurrent_extractions:
+                    self._max_workers = prefs['max extract threads'] or constants.CPU_COUNT or 1
                 else:
-                    self._threadpool.apply_async(
-                            self._extract_all_files,
-                            error_callback=self._extract_files_errcb)
+                    self._max_workers = 1
+                self._start_workers()
+
+    def _start_workers(self):
+        # this function should be always called with the condition held
+        queue = self._queue
+        while queue.workers < min(self._max_workers, len(queue)):
+            queue.workers += 1
+            if self._archive.is_solid():
+                worker = self._extract_all_files
+                args = (queue, lambda: queue.pop_block(self._archive.get_block))
+            elif self._archive.support_batch_extractions:
+                worker = self._extract_all_files
+                args = (queue, lambda: queue.pop_many(_BATCH_SIZE))
+            else:
+                worker = self._extract_files
+                args = (queue,)
+            self._threadpool.apply_async(worker, args,
+                                         error_callback=self._extract_files_errcb)
 
     @callback.Callback
     def contents_listed(self, extractor, files):
@@ -139,8 +246,9 @@ class Extractor(object):
         pass
 
     @callback.Callback
-    def file_extracted(self, extractor, filename):
-        """ Called whenever a new file is extracted and ready. """
+    def files_extracted(self, extractor, filenames):
+        """ Called whenever new files are extracted and ready. Files
+        extracted while the main thread is busy are notified at once. """
         pass
 
     def close(self):
@@ -155,28 +263,91 @@ class Extractor(object):
         if self._threadpool.closed:
             return True
         with self._condition:
-            self._files.remove(name)
             self._extracted.add(name)
             self._condition.notify_all()
-        self.file_extracted(self, name)
+            self._unnotified.append(name)
+            if len(self._unnotified) > 1:
+                # Already scheduled.
+                return
+        GLib.idle_add(self._notify_extracted)
 
-    def _extract_all_files(self):
-        # With multiple extractions for each pass, some of the files might have
-        # already been extracted.
+    def _notify_extracted(self):
         with self._condition:
-            files = list(set(self._files) - self._extracted)
+            filenames = self._unnotified
+            self._unnotified = []
+        if filenames:
+            self.files_extracted(self, filenames)
+        return False
 
-        log.debug('Extracting from "%s" to "%s": "%s"',
-                  self._src, self._dst, '", "'.join(files))
-        for name in self._archive.iter_extract(files, self._dst):
+    def _extract_all_files(self, queue, pop):
+        # Extract the files returned by <pop> in a single pass each, until
+        # none is left. The order within a pass is the one of the archive.
+        files = self._next_files(queue, pop)
+        while files:
+            log.debug('Extracting from "%s" to "%s": "%s"',
+                      self._src, self._dst, '", "'.join(files))
+            # Files of the pass not extracted yet, in order.
+            left = dict.fromkeys(files)
+            try:
+                for name in self._archive.iter_extract(files, self._dst):
+                    left.pop(name, None)
+                    if self._extraction_finished(name) or self._interrupt(queue, left):
+                        break
+            except Exception:
+                self._extract_files_errcb(self._threadpool.name, *sys.exc_info())
+            if left:
+                self._extract_left_files(list(left))
+            files = self._next_files(queue, pop)
+
+    def _interrupt(self, queue, files):
+        # Put the <files> left in a pass back in <queue> if files given
+        # priority are waiting while none of them is, and return True.
+        with self._condition:
+            if not files or not queue.is_overtaken(files):
+                return False
+            queue.push(files)
+        log.debug('Interrupted extraction from "%s", put back: "%s"',
+                  self._src, '", "'.join(files))
+        files.clear()
+        return True
+
+    def _extract_left_files(self, files):
+        # Extract the <files> a pass ended without, one at a time. Those
+        # failing again are still marked as extracted, so that nothing
+        # waits on them forever.
+        for name in files:
+            if self._threadpool.closed:
+                return
+            try:
+                self._extract_file(name)
+            except Exception:
+                self._extract_files_errcb(self._threadpool.name, *sys.exc_info())
             if self._extraction_finished(name):
                 return
 
+    def _extract_files(self, queue):
+        # Extract the most wanted file, one at a time, until none is left.
+        name = self._next_files(queue, queue.pop)
+        while name is not None:
+            try:
+                self._extract_file(name)
+            except Exception:
+                self._extract_files_errcb(self._threadpool.name, *sys.exc_info())
+            else:
+                self._extraction_finished(name)
+            name = self._next_files(queue, queue.pop)
+
+    def _next_files(self, queue, pop):
+        # Return what <pop> returns, or None once the extractor is stopped.
+        # The calling thread is done if nothing is returned.
+        with self._condition:
+            files = None if self._threadpool.closed else pop()
+            if not files:
+                queue.workers -= 1
+            return files
+
     def _extract_file(self, name):
-        """Extract the file named <name> to the destination directory,
-        mark the file as "ready", then signal a notify() on the Condition
-        returned by setup().
-        """
+        """Extract the file named <name> to the destination directory."""
         log.debug('Extracting from "%s" to "%s": "%s"',
                   self._src, self._dst, name)
         self._archive.extract(name)
@@ -206,6 +377,112 @@ class Extractor(object):
         log.debug(f"Traceback:\n{''.join(traceback.format_tb(tb)).strip()}")
 
 
+class _ExtractionQueue(object):
+    """Files left to extract, ordered by the file list (see
+    Extractor.set_files()), except for the files given priority (see
+    Extractor.prioritize()). Getting the next file and changing the priority
+    of a file are O(log n).
+    """
+
+    def __init__(self):
+        #: Heap of (priority, name), including outdated entries
+        self._heap = []
+        #: Name > current priority, of the files left to extract only
+        self._priority = {}
+        #: Name > position in the file list
+        self._rank = {}
+        #: Files currently given priority
+        self._prioritized = ()
+        #: Number of threads extracting files from this queue
+        self.workers = 0
+
+    def __len__(self):
+        return len(self._priority)
+
+    def set_files(self, files):
+        self._rank = {name: rank for rank, name in enumerate(files)}
+        self._priority = {name: (1, rank) for name, rank in self._rank.items()}
+        self._heap = [(priority, name) for name, priority in self._priority.items()]
+        heapq.heapify(self._heap)
+        self._prioritized = ()
+
+    def prioritize(self, files):
+        for name in set(self._prioritized) - set(files):
+            if name in self._priority:
+                self._set_priority(name, (1, self._rank[name]))
+        for n, name in enumerate(files):
+            if name in self._priority:
+                self._set_priority(name, (0, n))
+        # Popped files included, see is_overtaken().
+        self._prioritized = list(files)
+
+    def pop(self):
+        """Return the most wanted file, or None if there is none left."""
+        while self._heap:
+            priority, name = heapq.heappop(self._heap)
+            if self._priority.get(name) == priority:
+                del self._priority[name]
+                return name
+        return None
+
+    def pop_many(self, count):
+        """Return up to <count> files, the most wanted first."""
+        files = []
+        while len(files) < count:
+            name = self.pop()
+            if name is None:
+                break
+            files.append(name)
+        return files
+
+    def pop_block(self, get_block):
+        """Return the most wanted file, followed by all the files left in
+        the same block as returned by <get_block>, the most wanted first."""
+        name = self.pop()
+        if name is None:
+            return []
+        block = get_block(name)
+        files = sorted((other for other in self._priority
+                        if get_block(other) == block),
+                       key=self._priority.get)
+        for other in files:
+            # Outdated heap entries are skipped by pop().
+            del self._priority[other]
+        files.insert(0, name)
+        return files
+
+    def is_overtaken(self, files):
+        """Return True if files given priority are left, but none of the
+        popped <files>."""
+        prioritized = set(self._prioritized)
+        return any(name in self._priority for name in self._prioritized) and \
+            not any(name in prioritized for name in files)
+
+    def push(self, files):
+        """Put popped <files> back, with their current priority. Files not
+        in the file list anymore are dropped."""
+        prioritized = {name: n for n, name in enumerate(self._prioritized)}
+        for name in files:
+            if name not in self._rank or name in self._priority:
+                continue
+            if name in prioritized:
+                priority = (0, prioritized[name])
+            else:
+                priority = (1, self._rank[name])
+            self._priority[name] = priority
+            heapq.heappush(self._heap, (priority, name))
+
+    def _set_priority(self, name, priority):
+        if self._priority[name] == priority:
+            return
+        self._priority[name] = priority
+        heapq.heappush(self._heap, (priority, name))
+        if len(self._heap) > 2 * len(self._priority) + 64:
+            # Drop outdated entries.
+            self._heap = [(priority, name) for name, priority in self._priority.items()]
+            heapq.heapify(self._heap)
+
+
 class ArchiveException(Exception):
     """ Indicate error during extraction operations. """
     pass
@@ -18,7 +18,7 @@ class Packer(object):
     task than ZIP archives are (yes, really).
     """
 
-    def __init__(self, image_files, other_files, archive_path, base_name):
+    def __init__(self, image_files, other_files, archive_path, base_name, read_file=None):
         """Setup a Packer object to create a ZIP archive at <archive_path>.
         All files pointed to by paths in the sequences <image_files> and
         <other_files> will be included in the archive when packed.
@@ -30,11 +30,16 @@ class Packer(object):
         The files in <other_files> will be included as they are,
         assuming their filenames does not clash with other filenames in
         the archive. All files are placed in the archive root.
+
+        If given, <read_file> is called with each path, and returns the
+        content of files which are only read to memory (see
+        FileHandler.read_file()), or None for files on disk.
         """
         self._image_files = image_files
         self._other_files = other_files
         self._archive_path = archive_path
         self._base_name = base_name
+        self._read_file = read_file
         self._pack_thread = None
         self._packing_successful = False
 
@@ -66,6 +71,12 @@ class Packer(object):
                         b, e = os.path.splitext(path)
                         fname = fmt.format(page=i, ext=e)
                         used.add(fname)
+                        data = None if self._read_file is None else self._read_file(path)
+                        if data is not None:
+                            zfile.writestr(fname, data,
+                                           compress_type=zipfile.ZIP_DEFLATED,
+                                           compresslevel=9)
+                            continue
                         zfile.write(path, arcname=fname,
                                     compress_type=zipfile.ZIP_DEFLATED,
                                     compresslevel=9)
@@ -1,8 +1,13 @@
 """archive_tools.py - Archive tool functions."""
 
+import bz2
+import collections
+import lzma
 import os
 import tarfile
+import threading
 import zipfile
+import zlib
 
 from mcomix import constants
 from mcomix import image_tools
@@ -10,6 +15,7 @@ from mcomix import log
 from mcomix.archive import (
     archivemount,
     lha_external,
+    listing_cache,
     pdf_external,
     rar,
     rar_external,
@@ -141,55 +147,166 @@ def is_archive_file(path):
     return path.lower().endswith(tuple(SUPPORTED_ARCHIVE_EXTS))
 
 
+#: Bytes read at the start of a file to guess its type
+_HEADER_SIZE = 8 * 1024
+#: Bytes read at the end of a file to find the end of a ZIP central
+#: directory: its fixed part and the longest archive comment.
+_TRAILER_SIZE = 22 + 0xffff
+#: Magic numbers of compressed tar streams
+_TAR_COMPRESSIONS = (
+    (constants.GZIP, (b'\x1f\x8b\x08',)),
+    (constants.BZIP2, (b'BZh',)),
+    (constants.XZ, (b'\x5d\x00\x00\x80', b'\xfd7zXZ')),
+)
+#: Number of files whose type is remembered, see archive_mime_type
+_SNIFFED_MAX = 64
+
+#: (path, mtime, size) > (archive type, zip_py.ZipDirectory or None), least
+#: recently used first
+_sniffed = collections.OrderedDict()
+_sniffed_lock = threading.Lock()
+
+
+def _is_tar_header(buf):
+    """Return True if <buf> starts with a valid tar header block."""
+    try:
+        tarfile.TarInfo.frombuf(buf[:tarfile.BLOCKSIZE], tarfile.ENCODING, 'surrogateescape')
+    except tarfile.HeaderError:
+        return False
+    return True
+
+
+def _decompress_header(typ, header):
+    """Return the first tar block decompressed from <header>, the start of a
+    stream compressed in the <typ> format, or None if <header> is too short
+    or not in that format."""
+    if typ == constants.GZIP:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif typ == constants.BZIP2:
+        # bzip2 only outputs whole blocks, up to 900kB of input.
+        decompressor = bz2.BZ2Decompressor()
+    else:
+        decompressor = lzma.LZMADecompressor()
+    try:
+        block = decompressor.decompress(header, tarfile.BLOCKSIZE)
+    except (zlib.error, OSError, EOFError, lzma.LZMAError):
+        return None
+    if len(block) < tarfile.BLOCKSIZE:
+        return None
+    return block
+
+
+def _is_compressed_tarfile(path, typ, header):
+    """Return True if the file <path>, starting with <header>, is a tar
+    stream compressed in the <typ> format."""
+    block = _decompress_header(typ, header)
+    if block is not None:
+        return _is_tar_header(block)
+    # The header is too short to decompress a whole tar block.
+    try:
+        return tarfile.is_tarfile(path)
+    except IOError:
+        # Tarfile raises an error when accessing certain network shares
+        return False
+
+
+def _read_zip_directory(fd, trailer):
+    """Return the zip_py.ZipDirectory of the ZIP file <fd>, ending with
+    <trailer>, or None if it is not a ZIP file."""
+    if trailer.rfind(b'PK\x05\x06') == -1:
+        return None
+    try:
+        with zipfile.ZipFile(fd, mode='r') as zip_file:
+            return zip_py.get_directory(zip_file)
+    except (zipfile.BadZipFile, zipfile.LargeZipFile):
+        return None
+
+
+def _sniff(path, size):
+    """Return a tuple (archive type, zip_py.ZipDirectory or None) for the file
+    <path> of <size> bytes, from its first and last blocks only (tar streams
+    compressed with bzip2 excepted)."""
+    with open(path, 'rb') as fd:
+        header = fd.read(_HEADER_SIZE)
+        if size <= len(header):
+            trailer = header
+        else:
+            fd.seek(max(size - _TRAILER_SIZE, len(header)))
+            trailer = fd.read()
+            if len(header) + len(trailer) == size:
+                trailer = header + trailer
+
+        # ZIP files are identified by their end, so check them first
+        # (e.g. self-extracting archives).
+        directory = _read_zip_directory(fd, trailer)
+        if directory is not None:
+            if zip_py.is_py_supported_infolist(directory.infolist):
+                return constants.ZIP, directory
+            return constants.ZIP_EXTERNAL, None
+
+    magic = header[:10]
+
+    if size > 0:
+        if _is_tar_header(header):
+            return constants.TAR, None
+        for typ, magics in _TAR_COMPRESSIONS:
+            if magic.startswith(magics):
+                if typ == constants.BZIP2 and magic[4:10] != b'1AY&SY':
+                    continue
+                if _is_compressed_tarfile(path, typ, header):
+                    return typ, None
+                break
+
+    if magic.startswith(b'Rar!\x1a\x07'):
+        if sevenzip_external.is_7z_support_rar():
+            return constants.RAR, None
+        else:
+            return constants.RAR5, None
+
+    if magic[0:6] == b'7z\xbc\xaf\x27\x1c':
+        return constants.SEVENZIP, None
+
+    if magic[2:].startswith((b'-lh', b'-lz')):
+        return constants.LHA, None
+
+    if magic[0:4] == b'%PDF':
+        return constants.PDF, None
+
+    if magic.startswith((b'sqsh', b'hsqs')):
+        return constants.SQUASHFS, None
+
+    return None, None
+
+
+def _sniff_cached(path):
+    """Same as _sniff, remembering the result until <path> changes."""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    with _sniffed_lock:
+        result = _sniffed.get(key, None)
+        if result is not None:
+            _sniffed.move_to_end(key)
+            return result
+    result = _sniff(path, stat.st_size)
+    with _sniffed_lock:
+        _sniffed[key] = result
+        while len(_sniffed) > _SNIFFED_MAX:
+            _sniffed.popitem(last=False)
+    return result
+
+
 def archive_mime_type(path):
-    """Return the archive type of <path> or None for non-archives."""
+    """Return the archive type of <path> or None for non-archives.
+
+    The type is guessed from the first and last blocks of the file only, and
+    remembered until the file changes, so checking the same files again
+    (e.g. when looking for the next archive) is cheap.
+    """
     try:
         if os.path.isfile(path):
             if not os.access(path, os.R_OK):
                 return None
-
-            if zipfile.is_zipfile(path):
-                if zip_py.is_py_supported_zipfile(path):
-                    return constants.ZIP
-                else:
-                    return constants.ZIP_EXTERNAL
-
-            with open(path, 'rb') as fd:
-                magic = fd.read(10)
-
-            try:
-                istarfile = tarfile.is_tarfile(path)
-            except IOError:
-                # Tarfile raises an error when accessing certain network shares
-                istarfile = False
-
-            if istarfile and os.path.getsize(path) > 0:
-                if magic.startswith(b'\x1f\x8b\x08'):
-                    return constants.GZIP
-                elif magic.startswith(b'BZh') and magic[4:10] == b'1AY&SY':
-                    return constants.BZIP2
-                elif magic.startswith((b'\x5d\x00\x00\x80', b'\xfd7zXZ')):
-                    return constants.XZ
-                else:
-                    return constants.TAR
-
-            if magic.startswith(b'Rar!\x1a\x07'):
-                if sevenzip_external.is_7z_support_rar():
-                    return constants.RAR
-                else:
-                    return constants.RAR5
-
-            if magic[0:6] == b'7z\xbc\xaf\x27\x1c':
-                return constants.SEVENZIP
-
-            if magic[2:].startswith((b'-lh', b'-lz')):
-                return constants.LHA
-
-            if magic[0:4] == b'%PDF':
-                return constants.PDF
-
-            if magic.startswith((b'sqsh', b'hsqs')):
-                return constants.SQUASHFS
+            return _sniff_cached(path)[0]
 
     except Exception:
         log.warning(f'! Could not read {path}')
@@ -197,6 +314,23 @@ def archive_mime_type(path):
     return None
 
 
+def _pop_zip_directory(path):
+    """Return the zip_py.ZipDirectory of the ZIP file <path> if it has been
+    read by archive_mime_type and not changed since, or None. The directory
+    is dropped from the cache, only its type is remembered."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    with _sniffed_lock:
+        result = _sniffed.get(key, None)
+        if result is None or result[1] is None:
+            return None
+        _sniffed[key] = (result[0], None)
+    return result[1]
+
+
 def get_archive_info(path):
     """Return a tuple (mime, num_pages, size) with info about the archive
     at <path>, or None if <path> doesn't point to a supported
@@ -213,10 +347,13 @@ def get_archive_info(path):
         return mime, num_pages, size
 
 
-def get_archive_handler(path, typ=None):
+def get_archive_handler(path, typ=None, cached=False):
     """ Returns a fitting extractor handler for the archive passed
     in <path> (with optional mime type <type>. Returns None if no matching
     extractor was found.
+
+    If <cached> is True, the archive is opened with its cached listing if
+    it is known, see listing_cache.
     """
     if typ is None:
         typ = archive_mime_type(path)
@@ -227,6 +364,15 @@ def get_archive_handler(path, typ=None):
     if handler is None:
         return None
 
+    if handler is zip_py.ZipArchive:
+        # Do not parse the central directory again.
+        return handler(path, directory=_pop_zip_directory(path))
+
+    if cached and handler.support_listing_cache:
+        listing = listing_cache.load(path, handler)
+        if listing is not None:
+            return handler(path, listing=listing)
+
     return handler(path)
 
 
@@ -234,7 +380,7 @@ def get_recursive_archive_handler(path, typ=None, **kwargs):
     """ Same as <get_archive_handler> but the handler will transparently handle
     archives within archives.
     """
-    archive = get_archive_handler(path, typ=typ)
+    archive = get_archive_handler(path, typ=typ, cached=True)
     if archive is None:
         return None
     # XXX: Deferred import to avoid circular dependency
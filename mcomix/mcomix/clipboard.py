@@ -17,19 +17,23 @@ class Clipboard(object):
         """ Copies the current image to clipboard. """
 
         if self._window.filehandler.file_loaded:
-            # Get pixbuf for current page
-            current_page_pixbufs = self._window.imagehandler.get_pixbufs(
-                    2 if self._window.displayed_double() else 1)  # XXX limited to at most 2 pages
+            # Get pixbuf for current page, without waiting for it to be decoded
+            self._window.imagehandler.request_pixbufs(
+                    2 if self._window.displayed_double() else 1,  # XXX limited to at most 2 pages
+                    self._copy_pixbufs)
 
-            if len(current_page_pixbufs) == 1:
-                pixbuf = current_page_pixbufs[0]
-            else:
-                pixbuf = image_tools.combine_pixbufs(
-                        current_page_pixbufs[0],
-                        current_page_pixbufs[1],
-                        self._window.is_manga_mode)
+    def _copy_pixbufs(self, page, current_page_pixbufs):
+        """ Copies the pixbufs of the current page(s) to clipboard. """
 
-            self._clipboard.set_image(pixbuf)
+        if len(current_page_pixbufs) == 1:
+            pixbuf = current_page_pixbufs[0]
+        else:
+            pixbuf = image_tools.combine_pixbufs(
+                    current_page_pixbufs[0],
+                    current_page_pixbufs[1],
+                    self._window.is_manga_mode)
+
+        self._clipboard.set_image(pixbuf)
 
     def copy_cover(self, cover_pixbuf):
         """ Copies the current cover to clipboard. """
@@ -39,7 +43,12 @@ class Clipboard(object):
     def copy_image_path(self, *args):
         """ Copies the current page to clipboard. """
 
-        path = self._window.imagehandler.get_path_to_page()
+        # The page may only be read to memory, write it to disk first.
+        self._window.imagehandler.request_page_file(self._copy_path)
+
+    def _copy_path(self, page, path):
+        """ Copies the path of the page file to clipboard. """
+
         self._clipboard.set_text(path, -1)
 
     def copy_book_path(self, book_path):
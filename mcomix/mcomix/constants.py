@@ -17,6 +17,7 @@ PORTABLE_MODE = tools.is_portable_mode()
 HOME_DIR = tools.get_home_directory()
 CONFIG_DIR = tools.get_config_directory()
 DATA_DIR = tools.get_data_directory()
+CACHE_DIR = tools.get_cache_directory()
 
 BASE_PATH = tools.rootdir()
 THUMBNAIL_PATH = tools.get_thumbnails_directory()
@@ -27,6 +28,9 @@ KEYBINDINGS_CONF_PATH = os.path.join(CONFIG_DIR, 'keybindings.conf')
 
 BOOKMARK_JSON_PATH = os.path.join(DATA_DIR, 'bookmarks.json')
 FILEINFO_JSON_PATH = os.path.join(DATA_DIR, 'file.json')
+PAGE_METADATA_PATH = os.path.join(CACHE_DIR, 'pages')
+ARCHIVE_LISTING_PATH = os.path.join(CACHE_DIR, 'listings')
+TOOL_CAPABILITIES_PATH = os.path.join(CACHE_DIR, 'capabilities.json')
 
 ZOOM_MODE_BEST, ZOOM_MODE_WIDTH, ZOOM_MODE_HEIGHT, ZOOM_MODE_MANUAL, ZOOM_MODE_SIZE = range(5)
 
@@ -101,7 +101,8 @@ class _EditArchiveDialog(Gtk.Dialog):
 
         if not fail:
             packer = archive_packer.Packer(image_files, comment_files, tmp_path,
-                                           os.path.splitext(os.path.basename(archive_path))[0])
+                                           os.path.splitext(os.path.basename(archive_path))[0],
+                                           read_file=self._window.filehandler.read_file)
             packer.pack()
             packing_success = packer.wait()
 
@@ -84,7 +84,13 @@ class _ImageArea(Gtk.ScrolledWindow):
         except KeyError:
             # Not a page from the current archive, ignore.
             pass
-        pixbuf = self._thumbnailer.thumbnail(path)
+        data = self._window.filehandler.read_file(path)
+        if data is not None:
+            # Only read from the archive to memory.
+            pixbuf = image_tools.load_pixbuf_size(data, self._thumbnailer.width,
+                                                  self._thumbnailer.height)
+        else:
+            pixbuf = self._thumbnailer.thumbnail(path)
         if pixbuf is None:
             pixbuf = image_tools.MISSING_IMAGE_ICON
         return pixbuf
@@ -0,0 +1,97 @@
+"""encoded_cache.py - Cache of the encoded bytes of page files."""
+
+from collections import OrderedDict
+from threading import Lock
+
+from mcomix import log
+from mcomix.lib import reader
+from mcomix.preferences import prefs
+
+
+def read_file(path):
+    """Return the content of the page file <path>, as bytes."""
+    with reader.MappedFileIO(path) as fio:
+        return fio.read()
+
+
+class EncodedCache(object):
+    """LRU cache of the page files of the current book as they came out of
+    the archive (i.e. still compressed as JPEG, PNG, WebP...), keyed by page
+    index (starting from 0). Pages dropped from the decoded PageCache are
+    decoded again from these bytes, without reading the extracted file (or
+    the archive) again.
+
+    The total size of the cached data is bounded by the 'encoded cache
+    size' preference (in MiB), -1 for no limit, 0 disables the cache.
+    """
+
+    def __init__(self):
+        #: Page index > bytes, least recently used first
+        self._cache = OrderedDict()
+        #: Ensure thread safety
+        self._lock = Lock()
+        #: Current size of cached data, in bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, index):
+        with self._lock:
+            return index in self._cache
+
+    def get(self, index: int):
+        """Return the bytes of page <index>, or None if not cached."""
+        with self._lock:
+            data = self._cache.get(index, None)
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._cache.move_to_end(index)
+            return data
+
+    def add(self, index: int, data: bytes):
+        """Store the bytes <data> of page <index>, evicting the least
+        recently used pages if the cache grows over its budget."""
+        budget = self._get_budget()
+        if budget is not None and len(data) > budget:
+            return
+        with self._lock:
+            old = self._cache.pop(index, None)
+            if old is not None:
+                self.size -= len(old)
+            self._cache[index] = data
+            self.size += len(data)
+            self._trim(budget)
+
+    def trim(self):
+        """Evict pages until the cache fits in its budget again."""
+        budget = self._get_budget()
+        with self._lock:
+            self._trim(budget)
+
+    def clear(self):
+        """Remove all pages."""
+        with self._lock:
+            if self._cache:
+                log.debug('Encoded cache: %u KiB, %u hit(s), %u miss(es)',
+                          self.size // 1024, self.hits, self.misses)
+            self._cache.clear()
+            self.size = 0
+
+    def _trim(self, budget):
+        # this function should be always called in lock
+        # bytes objects are freed as soon as evicted, no need for
+        # memory.release()
+        if budget is None:
+            return
+        while self.size > budget:
+            _, evicted = self._cache.popitem(last=False)
+            self.size -= len(evicted)
+
+    @staticmethod
+    def _get_budget():
+        budget = prefs['encoded cache size']
+        if budget < 0:
+            return None
+        return budget * 1024 * 1024
@@ -23,14 +23,26 @@ class ImageEnhancer(object):
     def enhance(self, pixbuf):
         '''Return an "enhanced" version of <pixbuf>.'''
 
+        enhancement = self.get_enhancement()
+        if enhancement is not None:
+            return image_tools.enhance(pixbuf, **enhancement)
+
+        return pixbuf
+
+    def get_enhancement(self):
+        '''Return the enhancement values as keyword arguments of
+        image_tools.enhance(), or None if they would not change anything.
+        '''
+
         if (self.brightness != 1.0 or self.contrast != 1.0 or
             self.saturation != 1.0 or self.sharpness != 1.0 or
             self.autocontrast):
 
-            return image_tools.enhance(pixbuf, self.brightness, self.contrast,
-                                       self.saturation, self.sharpness, self.autocontrast)
+            return dict(brightness=self.brightness, contrast=self.contrast,
+                        saturation=self.saturation, sharpness=self.sharpness,
+                        autocontrast=self.autocontrast)
 
-        return pixbuf
+        return None
 
     def signal_update(self):
         '''Signal to the main window that a change in the enhancement
@@ -106,8 +106,14 @@ class _EnhanceImageDialog(Gtk.Dialog):
             self.clear_histogram()
             return
         # XXX transitional(double page limitation)
-        pixbuf = self._window.imagehandler.get_pixbufs(1)[0]
-        self.draw_histogram(pixbuf)
+        self._window.imagehandler.request_pixbufs(1, self._on_pixbufs_ready)
+
+    def _on_pixbufs_ready(self, page, pixbufs):
+        if _dialog is not self:
+            # Closed in the meantime.
+            return
+        if page == self._window.imagehandler.get_current_page():
+            self.draw_histogram(pixbufs[0])
 
     def _on_page_available(self, page_number):
         current_page_number = self._window.imagehandler.get_current_page()
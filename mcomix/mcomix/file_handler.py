@@ -15,6 +15,7 @@ from mcomix import file_provider
 from mcomix import image_tools
 from mcomix import last_read_page
 from mcomix import log
+from mcomix import memory
 from mcomix import message_dialog
 from mcomix import tools
 from mcomix.library import backend
@@ -56,7 +57,7 @@ class FileHandler(object):
         self._name_table = {}
         #: Archive extractor.
         self._extractor = archive_extractor.Extractor()
-        self._extractor.file_extracted += self._extracted_file
+        self._extractor.files_extracted += self._extracted_files
         self._extractor.contents_listed += self._listed_contents
         #: Condition to wait on when extracting archives and waiting on files.
         self._condition = None
@@ -138,7 +139,14 @@ class FileHandler(object):
         """
 
         self._window.imagehandler._base_path = self._base_path
-        self._window.imagehandler.set_image_files(image_files)
+        if self.archive_type is not None:
+            # Archive member names are stable across openings, unlike
+            # the paths in the temporary extraction directory.
+            self._window.imagehandler.set_image_files(
+                    image_files, book_path=self._base_path,
+                    names=[self._name_table[path] for path in image_files])
+        else:
+            self._window.imagehandler.set_image_files(image_files)
         self.file_opened()
 
         if not image_files:
@@ -217,7 +225,7 @@ class FileHandler(object):
         # Catch up on UI events, so we don't leave idle callbacks.
         while Gtk.events_pending():
             Gtk.main_iteration_do(False)
-        tools.garbage_collect()
+        memory.collect_when_idle()
         if self._tmp_dir is not None:
             self._tmp_dir = None
 
@@ -308,6 +316,8 @@ class FileHandler(object):
         self._name_table = dict(zip(image_files, archive_images))
         self._name_table.update(zip(self._comment_files, comment_files))
 
+        # Pages are decoded straight from the archive whenever possible.
+        self._extractor.keep_in_memory(archive_images)
         self._extractor.set_files(archive_images + comment_files)
 
         self._archive_opened(image_files)
@@ -567,6 +577,48 @@ class FileHandler(object):
         else:
             return False
 
+    def read_file(self, filepath, size=None):
+        """ Returns the content of the file <filepath> as bytes if it is
+        read from the archive to memory instead of being extracted (see
+        Extractor.keep_in_memory()), or None if it is to be read from disk.
+        If <size> is given, only at least the first <size> bytes of the file
+        are returned. """
+
+        if self.archive_type is None:
+            return None
+        name = self._name_table.get(filepath, None)
+        if name is None:
+            return None
+        return self._extractor.read(name, size=size)
+
+    def get_file_size(self, filepath):
+        """ Returns the size of the file <filepath> as listed in the archive
+        if it is read to memory instead of being extracted (see read_file()),
+        or None if it is to be read from disk. """
+
+        if self.archive_type is None:
+            return None
+        name = self._name_table.get(filepath, None)
+        if name is None:
+            return None
+        return self._extractor.get_size(name)
+
+    def write_file(self, filepath):
+        """ Makes sure the file <filepath> exists on disk, for features
+        which need an actual file (e.g. open with, saving a page), see
+        read_file(). Returns <filepath>. """
+
+        if self.archive_type is None:
+            return filepath
+        name = self._name_table.get(filepath, None)
+        if name is None:
+            return filepath
+        try:
+            return self._extractor.write_file(name)
+        except Exception as ex:
+            log.error('Extraction of "%s" failed: %s', filepath, ex)
+            return filepath
+
     @callback.Callback
     def file_available(self, filepaths):
         """ Called every time a new file from the Filehandler's opened
@@ -574,14 +626,14 @@ class FileHandler(object):
         """
         pass
 
-    def _extracted_file(self, extractor, name):
-        """ Called when the extractor finishes extracting the file at
-        <name>. This name is relative to the temporary directory
+    def _extracted_files(self, extractor, names):
+        """ Called when the extractor finishes extracting the files at
+        <names>. These names are relative to the temporary directory
         the files were extracted to. """
         if not self.file_loaded:
             return
-        filepath = os.path.join(extractor.get_directory(), name)
-        self.file_available([filepath])
+        directory = extractor.get_directory()
+        self.file_available([os.path.join(directory, name) for name in names])
 
     def _wait_on_comment(self, num):
         """Block the running (main) thread until the file corresponding to
@@ -613,14 +665,7 @@ class FileHandler(object):
         if self.archive_type is None:
             return
 
-        with self._condition:
-            extractor_files = self._extractor.get_files()
-            for path in reversed(files):
-                name = self._name_table[path]
-                if not self._extractor.is_ready(name):
-                    extractor_files.remove(name)
-                    extractor_files.insert(0, name)
-            self._extractor.set_files(extractor_files)
+        self._extractor.prioritize([self._name_table[path] for path in files])
 
     def write_fileinfo_file(self):
         """Write current open file information."""
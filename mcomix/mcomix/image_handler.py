@@ -1,18 +1,27 @@
 """image_handler.py - Image handler that takes care of cacheing and giving out images."""
 
+import functools
 import os
+import time
 import traceback
 
 from typing import List, Tuple, Union
 
+from gi.repository import GLib
+
 from mcomix.preferences import prefs
 from mcomix import i18n
 from mcomix import tools
 from mcomix import image_tools
 from mcomix import thumbnail_tools
 from mcomix import constants
+from mcomix import encoded_cache
 from mcomix import callback
 from mcomix import log
+from mcomix import page_cache
+from mcomix import page_metadata
+from mcomix import readahead
+from mcomix import render_cache
 from mcomix.lib import mt
 
 
@@ -44,41 +53,357 @@ class ImageHandler(object):
         self._base_path = None
         #: List of image file names, either from extraction or directory
         self._image_files = []
+        #: Image file name > page index
+        self._page_indexes = {}
         #: Index of current page
         self._current_image_index = None
         #: Set of images reading for decoding (i.e. already extracted)
         self._available_images = set()
         #: List of pixbufs we want to cache
         self._wanted_pixbufs = []
-        #: Pixbuf map from page > Pixbuf
-        self._raw_pixbufs = {}
-        #: How many pages to keep in cache
-        self._cache_pages = prefs['max pages to cache']
+        #: Decoded pages, bounded by the 'page cache size' preference
+        self.page_cache = page_cache.PageCache()
+        #: Encoded page files, decoded again when evicted from page_cache
+        self.encoded_cache = encoded_cache.EncodedCache()
+        #: Page index > full resolution pixbuf of recently requested compact
+        #: or reduced pages
+        self._expanded_pixbufs = {}
+        #: Size of the main display area, see set_display_size
+        self._display_size = None
+        #: Indexes of the pages the main window waits for, see request_pages
+        self._pending = set()
+        #: Indexes of the pages being decoded again, see get_page_image
+        self._redecoding = set()
+        #: Incremented whenever the pages change, see request_pixbufs
+        self._generation = 0
+        #: Runs the asynchronous page requests of the main thread, so that
+        #: they do not wait behind the pages cached in advance
+        self._requests = mt.ThreadPool(name=self.__class__.__name__ + 'Requests', processes=2)
+        #: Builds the previews of pages not decoded yet, see request_previews
+        self._previews = mt.ThreadPool(name=self.__class__.__name__ + 'Previews', processes=1)
+        #: (page, number of pages) of the previews being built
+        self._pending_previews = set()
+        #: Decides which pages to prepare in advance
+        self._read_ahead = readahead.ReadAheadPlanner()
+        #: Page index > time extraction was asked for, see _ask_for_pages
+        self._requested = {}
+        #: Time the last page became available
+        self._last_available = 0.0
+        #: Header-only metadata (format, size, orientation) of pages
+        self.page_metadata = page_metadata.PageMetadataIndex()
+        #: Scaled pixbufs ready for display, see MainWindow._draw_image
+        self.render_cache = render_cache.RenderCache()
+        #: (page, number of pages, manga mode) > automatic background color
+        self._auto_backgrounds = {}
 
         self._window.filehandler.file_available += self._file_available
 
+    def _get_page(self, index: int):
+        """Return the page indexed by <index> from cache, as returned by
+        image_tools.load_page(). Pages not found in cache are fetched from
+        disk first.
+        """
+        return self._cache_pixbuf(index, force=True)
+
     def _get_pixbuf(self, index: int):
         """Return the pixbuf indexed by <index> from cache.
         Pixbufs not found in cache are fetched from disk first.
         """
-        self._cache_pixbuf(index, force=True)
-        return self._raw_pixbufs[index]
-
-    def get_pixbufs(self, number_of_bufs: int):
+        image = self._get_page(index)
+        if not image_tools.is_compact(image) and not image_tools.is_reduced(image):
+            return image
+        # Compact or reduced page, keep the full resolution pixbuf of the
+        # last requested pages, e.g. for the magnifying lens.
+        with self._lock:
+            generation = self._generation
+            pixbuf = self._expanded_pixbufs.pop(index, None)
+        if pixbuf is None and image_tools.is_reduced(image):
+            try:
+                pixbuf = image_tools.to_pixbuf(self._load_page(index))
+            except Exception as e:
+                log.error('Could not load pixbuf for page %u: %r', index + 1, e)
+        if pixbuf is None:
+            pixbuf = image_tools.to_pixbuf(image)
+        with self._lock:
+            if generation == self._generation:
+                # Not from a previous book.
+                self._expanded_pixbufs[index] = pixbuf
+            while len(self._expanded_pixbufs) > 2:  # XXX limited to at most 2 pages
+                del self._expanded_pixbufs[next(iter(self._expanded_pixbufs))]
+        return pixbuf
+
+    def get_pixbufs(self, number_of_bufs: int, page: int = None):
         """Returns number_of_bufs pixbufs for the image(s) that should be
-        currently displayed. This method might fetch images from disk, so make
-        sure that number_of_bufs is as small as possible.
+        currently displayed, or starting with <page>. This method might fetch
+        images from disk, so make sure that number_of_bufs is as small as
+        possible.
+
+        This method waits for the pages to be extracted and decoded, use
+        request_pixbufs() in the main thread.
+        """
+        return self._get_pages(self._get_pixbuf, number_of_bufs, page)
+
+    def request_pixbufs(self, number_of_bufs: int, callback, page: int = None):
+        """Asynchronous version of get_pixbufs(): return right away, and call
+        <callback> in the main thread with the first page and the list of
+        pixbufs once they are ready.
         """
+        if page is None:
+            page = self.get_current_page()
+        self._requests.apply_async(
+                self._request_pixbufs, (number_of_bufs, page, callback, self._generation),
+                error_callback=self._request_error)
+
+    def _request_pixbufs(self, number_of_bufs, page, callback, generation):
+        pixbufs = self.get_pixbufs(number_of_bufs, page)
+        GLib.idle_add(self._call_request_callback, callback, generation, page, pixbufs)
+
+    def _call_request_callback(self, callback, generation, page, result):
+        if generation != self._generation:
+            # Another book has been opened in the meantime.
+            return False
+        callback(page, result)
+        return False
+
+    def request_pages(self, number_of_bufs: int, page: int = None) -> bool:
+        """Return True if the pages get_page_images() would return are all
+        decoded, i.e. calling it does not block. Otherwise, ask for the
+        missing pages to be decoded as soon as possible; page_decoded() is
+        called for each of them once done.
+        """
+        if page is None:
+            index = self._current_image_index
+        else:
+            index = page - 1
+        missing = []
+        with self._lock:
+            for i in range(index, index + number_of_bufs):
+                if i in self.page_cache:
+                    continue
+                missing.append(i)
+                if i not in self._pending:
+                    self._pending.add(i)
+                    self._requests.apply_async(self._cache_pixbuf, (i,),
+                                               kwargs=dict(force=True),
+                                               error_callback=self._request_error)
+        return not missing
+
+    @staticmethod
+    def _request_error(name, etype, value, tb):
+        log.error('Page request failed: %s', value)
+
+    def get_page_images(self, number_of_bufs: int, page: int = None):
+        """Same as get_pixbufs(), but return the pages as they are cached:
+        grayscale and palette pages are PIL images, see
+        image_tools.load_page(). Used to render the pages for display.
+        """
+        return self._get_pages(self._get_page, number_of_bufs, page)
+
+    def _get_pages(self, get_page, number_of_bufs, page):
+        if page is None:
+            index = self._current_image_index
+        else:
+            index = page - 1
         result = []
         for i in range(number_of_bufs):
-            result.append(self._get_pixbuf(self._current_image_index + i))
+            result.append(get_page(index + i))
         return result
 
-    def get_pixbuf_auto_background(self, number_of_bufs: int):  # XXX limited to at most 2 pages
+    def get_page_image(self, page: int, size, rotation: int, nowait=False):
+        """Return the image of <page>, as returned by get_page_images(), at a
+        resolution high enough to be displayed at <size> (width, height)
+        once rotated by <rotation>. Pages decoded at a lower resolution (see
+        set_display_size()) are decoded again, e.g. when zooming in.
+
+        If <nowait> is True, return None instead of decoding the page again,
+        which is then done in the background; page_decoded() is called once
+        done.
+        """
+        index = page - 1
+        image = self._get_page(index)
+        if rotation in (90, 270):
+            size = size[1], size[0]
+        if self._covers(image, size):
+            return image
+        if nowait:
+            with self._lock:
+                if index not in self._redecoding:
+                    self._redecoding.add(index)
+                    self._requests.apply_async(self._decode_again, (page, size),
+                                               error_callback=self._request_error)
+            return None
+        return self._decode_again(page, size, image)
+
+    def _decode_again(self, page, size, image=None):
+        index = page - 1
+        if image is None:
+            image = self._get_page(index)
+        with self._cache_lock[index]:
+            cached = self.page_cache.get(index, stats=False)
+            if cached is not None and self._covers(cached, size):
+                return cached
+            full_width, full_height = image_tools.get_image_size(image)
+            scale = max(size[0] / full_width, size[1] / full_height)
+            log.debug('Decoding page %u again at scale %.2f', page, scale)
+            try:
+                image = self._load_page(index, scale)
+            except Exception as e:
+                log.error('Could not load pixbuf for page %u: %r', page, e)
+            else:
+                self.page_cache.add(index, image)
+        with self._lock:
+            redecoded = index in self._redecoding
+            self._redecoding.discard(index)
+        if redecoded:
+            self.page_decoded(page)
+        return image
+
+    @staticmethod
+    def _covers(image, size):
+        if not image_tools.is_reduced(image):
+            return True
+        width, height = image_tools.get_decoded_size(image)
+        return width >= size[0] and height >= size[1]
+
+    def set_display_size(self, size):
+        """Set the <size> (width, height) of the main display area, without
+        scrollbars. If the 'decode at display size' preference is set, pages
+        are then decoded at the resolution needed to display them in <size>
+        rather than at full resolution, see get_page_image().
+        """
+        self._display_size = size
+
+    def _get_decode_scale(self, index: int):
+        """Return the scale page <index> is decoded at (see
+        set_display_size()), or None to decode it at full resolution."""
+        display_size = self._display_size
+        if display_size is None or not prefs['decode at display size']:
+            return None
+        info = self.get_page_info(index + 1)
+        if info is None or not info.width or not info.height:
+            return None
+        return self._window.get_display_scale((info.width, info.height),
+                                              info.orientation, display_size)
+
+    def request_previews(self, number_of_bufs: int, page: int = None):
+        """Ask for quick previews of the pages get_page_images() would
+        return, when they are all available but some of them are not decoded
+        yet. Pages already decoded are previewed as is. The previews are
+        built in the background, and preview_ready() is called with them,
+        unless all the pages have been decoded in the meantime or one of
+        them has no cheap preview (see _get_preview()). Use request_pages()
+        to have the pages decoded.
+
+        Must be called in the main thread. Pages which are not available
+        yet are asked for again once available, see page_available().
+        """
+        if page is None:
+            page = self.get_current_page()
+        indexes = range(page - 1, page - 1 + number_of_bufs)
+        if not all(self.page_is_available(i + 1) for i in indexes):
+            return
+        if all(i in self.page_cache for i in indexes):
+            return
+        with self._lock:
+            if (page, number_of_bufs) in self._pending_previews:
+                return
+            self._pending_previews.add((page, number_of_bufs))
+        # The thumbnail bar can only be read from the main thread.
+        thumbnails = [self._window.thumbnailsidebar.get_thumbnail(i + 1) for i in indexes]
+        self._previews.apply_async(
+                self._request_previews,
+                (page, number_of_bufs, thumbnails, self._generation),
+                error_callback=self._request_error)
+
+    def _request_previews(self, page, number_of_bufs, thumbnails, generation):
+        try:
+            if page != self.get_current_page():
+                # Flipped in the meantime.
+                return
+            indexes = range(page - 1, page - 1 + number_of_bufs)
+            previews = []
+            for i, thumbnail in zip(indexes, thumbnails):
+                # Decoding may be over by now.
+                preview = self.page_cache.get(i, stats=False)
+                if preview is None:
+                    preview = self._get_preview(i, thumbnail)
+                    if preview is None:
+                        return
+                    log.debug('Preview of page %u', i + 1)
+                previews.append(preview)
+            if all(i in self.page_cache for i in indexes):
+                return
+        finally:
+            with self._lock:
+                self._pending_previews.discard((page, number_of_bufs))
+        GLib.idle_add(self._call_preview_ready, generation, page, previews)
+
+    def _call_preview_ready(self, generation, page, previews):
+        if generation != self._generation:
+            # Another book has been opened in the meantime.
+            return False
+        self.preview_ready(page, previews)
+        return False
+
+    @callback.Callback
+    def preview_ready(self, page: int, previews):
+        """ Called in the main thread with the <previews> of the pages
+        starting with <page>, asked for by request_previews(). """
+        log.debug('Preview of page %u is ready', page)
+
+    def _get_preview(self, index: int, thumbnail=None):
+        """Return a low resolution preview of page <index>, with the full
+        size of the page (see image_tools.load_page()): its <thumbnail> from
+        the thumbnail bar if already generated, otherwise its Exif thumbnail
+        or a draft decode, see image_tools.load_preview(). Return None if
+        there is no cheap preview."""
+        info = self.get_page_info(index + 1, nowait=True)
+        if info is None or not info.width or not info.height:
+            return None
+        preview = thumbnail
+        if preview is not None:
+            width, height = preview.get_width(), preview.get_height()
+            if abs(width * info.height - height * info.width) > 0.05 * height * info.width:
+                # Not the same aspect ratio, e.g. a missing image icon.
+                preview = None
+        if preview is None:
+            try:
+                preview = image_tools.load_preview(self._read_page(index))
+            except Exception:
+                return None
+            if preview is None:
+                return None
+        if info.orientation is not None:
+            setattr(preview, 'orientation', info.orientation)
+        setattr(preview, 'full_size', (info.width, info.height))
+        return preview
+
+    @callback.Callback
+    def page_decoded(self, page: int):
+        """ Called when <page>, asked for by request_pages() or
+        get_page_image(), has been decoded. """
+        log.debug('Page %u is decoded', page)
+
+    def get_pixbuf_auto_background(self, number_of_bufs: int, page: int = None,
+                                   images=None):  # XXX limited to at most 2 pages
         """ Returns an automatically calculated background color
-        for the current page(s). """
+        for the current page(s), or the page(s) starting with <page>.
+        If <images> is given (e.g. previews), the color is computed from
+        them instead of the decoded pages, and not kept. """
 
-        pixbufs = self.get_pixbufs(number_of_bufs)
+        if page is None:
+            page = self.get_current_page()
+        key = (page, number_of_bufs, self._window.is_manga_mode)
+        if images is not None:
+            key = None
+        auto_bg = self._auto_backgrounds.get(key, None)
+        if auto_bg is not None:
+            return auto_bg
+
+        if images is not None:
+            pixbufs = images
+        else:
+            pixbufs = self.get_page_images(number_of_bufs, page)
 
         if len(pixbufs) == 1:
             auto_bg = image_tools.get_most_common_edge_color(pixbufs[0])
@@ -91,14 +416,16 @@ class ImageHandler(object):
         else:
             assert False, 'Unexpected pixbuf count'
 
+        if key is not None:
+            self._auto_backgrounds[key] = auto_bg
         return auto_bg
 
     def do_cacheing(self):
         """Make sure that the correct pixbufs are stored in cache. These
         are (in the current implementation) the current image(s), and
         if cacheing is enabled, also the one or two pixbufs before and
-        after the current page. All other pixbufs are deleted and garbage
-        collected directly in order to save memory.
+        after the current page. Other pixbufs are kept as long as the page
+        cache memory budget allows, see PageCache.
         """
 
         if not self._lock.acquire(blocking=False):
@@ -109,47 +436,117 @@ class ImageHandler(object):
 
             # Get list of wanted pixbufs.
             wanted_pixbufs = self._ask_for_pages(self.get_current_page())
-            if -1 != self._cache_pages:
-                # We're not caching everything, remove old pixbufs.
-                for index in set(self._raw_pixbufs) - set(wanted_pixbufs):
-                    del self._raw_pixbufs[index]
             log.debug('Caching page(s) %s',
                       ' '.join([str(index + 1) for index in wanted_pixbufs]))
+            log.debug('Page cache: %u KiB, %u hit(s), %u miss(es)',
+                      self.page_cache.size // 1024,
+                      self.page_cache.hits, self.page_cache.misses)
+            log.debug('Encoded cache: %u KiB, %u hit(s), %u miss(es)',
+                      self.encoded_cache.size // 1024,
+                      self.encoded_cache.hits, self.encoded_cache.misses)
             self._wanted_pixbufs[:] = wanted_pixbufs
             # Start caching available images not already in cache.
             wanted_pixbufs = [index for index in wanted_pixbufs
-                              if index in self._available_images]
+                              if index in self._available_images and
+                              index not in self.page_cache]
             self._thread.map_async(self._cache_pixbuf, wanted_pixbufs)
         finally:
             self._lock.release()
 
     def _cache_pixbuf(self, index: int, force=False):
-        self._wait_on_page(index + 1)
-        with self._cache_lock[index]:
-            if index in self._raw_pixbufs:
-                return
-            with self._lock:
-                if not force and index not in self._wanted_pixbufs:
-                    return
-            log.debug('Caching page %u', index + 1)
-            try:
-                pixbuf = image_tools.load_pixbuf(self._image_files[index])
-                tools.garbage_collect()
-            except Exception as e:
-                log.error('Could not load pixbuf for page %u: %r', index + 1, e)
-                pixbuf = image_tools.MISSING_IMAGE_ICON
-            self._raw_pixbufs[index] = pixbuf
+        # Do not wait on the lock of a page being decoded again (see
+        # get_page_image) if it is already cached.
+        pixbuf = self.page_cache.get(index, stats=force)
+        if pixbuf is None:
+            self._wait_on_page(index + 1)
+            with self._cache_lock[index]:
+                pixbuf = self.page_cache.get(index, stats=False)
+                if pixbuf is None:
+                    with self._lock:
+                        if not force and index not in self._wanted_pixbufs:
+                            return None
+                    log.debug('Caching page %u', index + 1)
+                    try:
+                        pixbuf = self._load_page(index, self._get_decode_scale(index))
+                    except Exception as e:
+                        log.error('Could not load pixbuf for page %u: %r', index + 1, e)
+                        pixbuf = image_tools.MISSING_IMAGE_ICON
+                    self.page_cache.add(index, pixbuf)
+        with self._lock:
+            pending = index in self._pending
+            self._pending.discard(index)
+        if pending:
+            self.page_decoded(index + 1)
+        return pixbuf
+
+    def _load_page(self, index: int, scale=None):
+        """Decode page <index> at <scale>, see image_tools.load_page()."""
+        start = time.monotonic()
+        image = image_tools.load_page(self._read_page(index), scale)
+        self._read_ahead.add_decode_time(time.monotonic() - start)
+        return image
+
+    def _read_page(self, index: int):
+        """Return the bytes of the file of page <index> from the encoded
+        cache, reading the file first if needed. Return the source of the
+        page (see _get_page_source) if the encoded cache is disabled."""
+        if prefs['encoded cache size'] == 0:
+            return self._get_page_source(index)
+        data = self.encoded_cache.get(index)
+        if data is None:
+            data = self._get_page_source(index)
+            if not isinstance(data, bytes):
+                data = encoded_cache.read_file(data)
+            self.encoded_cache.add(index, data)
+        return data
+
+    def _get_header_source(self, index: int, size: int = None):
+        """Return the source of page <index> (see _get_page_source) to parse
+        its header, only reading at least the first <size> bytes of pages
+        read from the archive to memory (see FileHandler.read_file), unless
+        they are in the encoded cache already. Nothing is added to the
+        encoded cache: headers are parsed as soon as pages are available,
+        not when they are about to be displayed."""
+        if index in self.encoded_cache:
+            data = self.encoded_cache.get(index)
+            if data is not None:
+                return data
+        path = self._image_files[index]
+        data = self._window.filehandler.read_file(path, size=size)
+        return path if data is None else data
+
+    def _get_page_source(self, index: int):
+        """Return the bytes of the file of page <index> if it is read from
+        the archive to memory (see FileHandler.read_file), or its path."""
+        path = self._image_files[index]
+        data = self._window.filehandler.read_file(path)
+        return path if data is None else data
 
     def set_page(self, page_num: int):
         """Set up filehandler to the page <page_num>.
         """
         assert 0 < page_num <= self.get_number_of_pages()
         self._current_image_index = page_num - 1
+        step = 2 if prefs['default double page'] and prefs['double step in double page mode'] else 1
+        if self._read_ahead.flip(self._current_image_index, step):
+            log.debug('Jump to page %u', page_num)
+        self.page_cache.set_position(self._current_image_index, self._read_ahead.direction)
         self.do_cacheing()
 
-    def set_image_files(self, files: List[str]):
+    def set_image_files(self, files: List[str], book_path: str = None, names: List[str] = None):
         # Set list of image file names
+        # <book_path> and <names> (names of files inside the book, in the
+        # same order) are used to persist page metadata, see PageMetadataIndex
         self._image_files[:] = files
+        self._page_indexes = {path: index for index, path in enumerate(files)}
+        self.page_metadata.open_book(book_path, names)
+        self.encoded_cache.clear()
+        self.render_cache.clear()
+        self._auto_backgrounds.clear()
+        self._expanded_pixbufs.clear()
+        self._pending.clear()
+        self._redecoding.clear()
+        self._generation += 1
 
     def get_image_files(self) -> List[str]:
         # Get list of image file names
@@ -158,10 +555,18 @@ class ImageHandler(object):
     def clear_image_files(self):
         # Clear list of image file names
         self._image_files.clear()
+        self._page_indexes.clear()
 
     def clear_raw_pixbufs(self):
-        # Clear map of page > Pixbuf
-        self._raw_pixbufs.clear()
+        # Clear cache of decoded pages
+        self.page_cache.clear()
+        self.encoded_cache.clear()
+        self.render_cache.clear()
+        self._auto_backgrounds.clear()
+        self._expanded_pixbufs.clear()
+        self._pending.clear()
+        self._redecoding.clear()
+        self._generation += 1
 
     def get_current_path(self) -> str:
         # Get current image path
@@ -191,13 +596,12 @@ class ImageHandler(object):
             return False
 
         for page in (page, page + 1):
-            if not self.page_is_available(page):
+            info = self.get_page_info(page, nowait=True)
+            if info is None:
                 return False
-            pixbuf = self._get_pixbuf(page - 1)
-            width, height = pixbuf.get_width(), pixbuf.get_height()
+            width, height = info.width, info.height
             if prefs['auto rotate from exif']:
-                rotation = image_tools.get_implied_rotation(pixbuf)
-                assert rotation in (0, 90, 180, 270)
+                rotation = image_tools.get_orientation_rotation(info.orientation)
                 if rotation in (90, 270):
                     width, height = height, width
             if width > height:
@@ -221,6 +625,9 @@ class ImageHandler(object):
         self.last_wanted = 1
 
         self._thread.renew()
+        self._requests.renew()
+        self._previews.renew()
+        self._pending_previews.clear()
         self._wanted_pixbufs.clear()
         while self._cache_lock:
             index, lock = self._cache_lock.popitem()
@@ -228,9 +635,20 @@ class ImageHandler(object):
                 pass
         self._base_path = None
         self._image_files.clear()
+        self._page_indexes.clear()
         self._current_image_index = None
         self._available_images.clear()
-        self._raw_pixbufs.clear()
+        self._requested.clear()
+        self._read_ahead.reset()
+        self.page_cache.clear()
+        self.encoded_cache.clear()
+        self.render_cache.clear()
+        self._auto_backgrounds.clear()
+        self._expanded_pixbufs.clear()
+        self._pending.clear()
+        self._redecoding.clear()
+        self._generation += 1
+        self.page_metadata.cleanup()
 
     def page_is_available(self, page: int = None) -> bool:
         """ Returns True if <page> is available and calls to get_pixbufs
@@ -262,21 +680,25 @@ class ImageHandler(object):
         assert index not in self._available_images
         self._cache_lock[index] = mt.Lock()
         self._available_images.add(index)
+        self.page_metadata.add(index, functools.partial(self._get_header_source, index))
+        now = time.monotonic()
+        requested = self._requested.pop(index, None)
+        if requested is not None:
+            # Do not count the time spent extracting the previous page.
+            self._read_ahead.add_extract_time(now - max(requested, self._last_available))
+        self._last_available = now
         # Check if we need to cache it.
-        if index in self._wanted_pixbufs or -1 == self._cache_pages:
+        if index in self._wanted_pixbufs or -1 == prefs['max pages to cache']:
             self._thread.apply_async(
                     self._cache_pixbuf, (index,))
 
     def _file_available(self, filepaths: List[str]):
-        """ Called by the filehandler when a new file becomes available. """
-        # Find the page that corresponds to <filepath>
-        if not self._image_files:
-            return
-
-        available = sorted(filepaths)
-        for i, imgpath in enumerate(self._image_files):
-            if tools.bin_search(available, imgpath) >= 0:
-                self.page_available(i + 1)
+        """ Called by the filehandler when new files become available. """
+        # Find the pages that correspond to <filepaths>
+        for path in filepaths:
+            index = self._page_indexes.get(path, None)
+            if index is not None and index not in self._available_images:
+                self.page_available(index + 1)
 
     def get_number_of_pages(self) -> int:
         """Return the number of pages in the current archive/directory."""
@@ -291,8 +713,33 @@ class ImageHandler(object):
 
     def get_path_to_page(self, page: int = None) -> Union[str, None]:
         """Return the full path to the image file for <page>, or the current
-        page if <page> is None.
+        page if <page> is None. Pages read from the archive to memory are
+        not written to disk, use request_page_file() when an actual file is
+        needed (e.g. to hand it to another program).
         """
+        return self._get_page_path(page)
+
+    def request_page_file(self, callback, page: int = None):
+        """Make sure the image file of <page> (or of the current page) exists
+        on disk, writing it in the background if it is only read to memory
+        (see FileHandler.write_file()), then call <callback> in the main
+        thread with the page and the path of the file.
+        """
+        if page is None:
+            page = self.get_current_page()
+        path = self._get_page_path(page)
+        if path is None:
+            return
+        self._requests.apply_async(
+                self._request_page_file, (page, path, callback, self._generation),
+                error_callback=self._request_error)
+
+    def _request_page_file(self, page, path, callback, generation):
+        path = self._window.filehandler.write_file(path)
+        GLib.idle_add(self._call_request_callback, callback, generation, page, path)
+
+    def _get_page_path(self, page: int = None) -> Union[str, None]:
+        """Same as get_path_to_page()."""
         if page is None:
             index = self._current_image_index
         else:
@@ -313,7 +760,7 @@ class ImageHandler(object):
             return ('', '') if double else ''
 
         def get_fname(pg):
-            path = self.get_path_to_page(pg)
+            path = self._get_page_path(pg)
             return '' if path is None else os.path.basename(path)
 
         if page is None:
@@ -337,11 +784,12 @@ class ImageHandler(object):
             return ('-1', '-1') if double else '-1'
 
         def get_fsize(pg):
-            path = self.get_path_to_page(pg)
+            path = self._get_page_path(pg)
             try:
                 fsize = 0 if path is None else os.stat(path).st_size
             except OSError:
-                fsize = 0
+                # Read from the archive to memory, see _read_page.
+                fsize = self._window.filehandler.get_file_size(path) or 0
             return tools.format_byte_size(fsize)
 
         if page is None:
@@ -369,31 +817,50 @@ class ImageHandler(object):
         name = os.path.join(*tools.splitpath(img_file)[-2:])
         return i18n.to_unicode(name)
 
-    def get_size(self, page: int = None) -> Tuple[int, int]:
+    def get_page_info(self, page: int = None, nowait=False):
+        """Return the PageInfo (format, width, height, orientation) of <page>,
+        or of the current page if <page> is None, without decoding the image.
+
+        If <nowait> is True and <page> is neither known to the metadata index
+        nor available yet, return None instead of waiting for it.
+        """
+        if page is None:
+            index = self._current_image_index
+        else:
+            index = page - 1
+        if not isinstance(index, int) or not 0 <= index < len(self._image_files):
+            return None
+
+        info = self.page_metadata.get(index)
+        if info is not None:
+            return info
+        if not self._wait_on_page(index + 1, check_only=nowait):
+            return None
+        return self.page_metadata.parse(index, functools.partial(self._get_header_source, index))
+
+    def get_size(self, page: int = None, nowait=False) -> Tuple[int, int]:
         """Return a tuple (width, height) with the size of <page>. If <page>
         is None, return the size of the current page.
-        """
-        self._wait_on_page(page)
 
-        page_path = self.get_path_to_page(page)
-        if page_path is None:
+        If <nowait> is True, return (0, 0) instead of waiting for the page
+        to be available, see get_page_info().
+        """
+        info = self.get_page_info(page, nowait=nowait)
+        if info is None:
             return 0, 0
+        return info.width, info.height
 
-        fmt, width, height = image_tools.get_image_info(page_path)
-        return width, height
-
-    def get_mime_name(self, page: int = None) -> Union[str, None]:
+    def get_mime_name(self, page: int = None, nowait=False) -> Union[str, None]:
         """Return a string with the name of the mime type of <page>. If
         <page> is None, return the mime type name of the current page.
-        """
-        self._wait_on_page(page)
 
-        page_path = self.get_path_to_page(page)
-        if page_path is None:
+        If <nowait> is True, return None instead of waiting for the page to
+        be available, see get_page_info().
+        """
+        info = self.get_page_info(page, nowait=nowait)
+        if info is None:
             return None
-
-        fmt, width, height = image_tools.get_image_info(page_path)
-        return fmt
+        return info.format
 
     def get_thumbnail(self, page: int = None, width=128, height=128, create=False, nowait=False):
         """Return a thumbnail pixbuf of <page> that fit in a box with
@@ -409,11 +876,16 @@ class ImageHandler(object):
             # Page is not available!
             return None
 
-        path = self.get_path_to_page(page)
+        path = self._get_page_path(page)
         if path is None:
             return None
 
         try:
+            data = self._window.filehandler.read_file(path)
+            if data is not None:
+                # Read from the archive to memory: there is no file to
+                # store the thumbnail of.
+                return image_tools.load_pixbuf_size(data, width, height)
             thumbnailer = thumbnail_tools.Thumbnailer(store_on_disk=create, size=(width, height))
             return thumbnailer.thumbnail(path)
         except Exception:
@@ -438,38 +910,33 @@ class ImageHandler(object):
             return False
 
         log.debug('Waiting for page %u', page)
-        path = self.get_path_to_page(page)
+        path = self._get_page_path(page)
         self._window.filehandler._wait_on_file(path)
         return True
 
     def _ask_for_pages(self, page: int) -> List[int]:
         """Ask for pages around <page> to be given priority extraction.
         """
-        total_pages = range(self.get_number_of_pages())
-
-        num_pages = self._cache_pages
+        num_pages = prefs['max pages to cache']
         if num_pages < 0:
             # default to 10 pages
-            num_pages = min(10, len(total_pages))
-
-        page -= 1
-        harf = num_pages // 2
-        start = max(0, page - harf)
-        end = start + num_pages
-        page_list: List[int] = list(total_pages[start:end])
-        if end > len(total_pages):
-            start = page_list[0] - (num_pages - len(page_list))
-            page_list.extend(range(max(0, start), page_list[0]))
-        page_list.sort()
-
-        # move page before now to the end
-        pos = page_list.index(page)
-        head = page_list[:pos]
-        page_list[:] = page_list[pos:]
-        page_list.extend(reversed(head))
+            num_pages = 10
+
+        displayed = 2 if self._window.displayed_double() else 1
+        if displayed == 2 and prefs['double step in double page mode']:
+            step = 2
+        else:
+            step = 1
+        page_list = self._read_ahead.plan(page - 1, self.get_number_of_pages(),
+                                          displayed, step, num_pages)
 
         log.debug('Ask for priority extraction around page %u: %s',
-                  page + 1, ' '.join([str(n + 1) for n in page_list]))
+                  page, ' '.join([str(n + 1) for n in page_list]))
+
+        now = time.monotonic()
+        for index in page_list:
+            if index not in self._available_images:
+                self._requested.setdefault(index, now)
 
         files = [self._image_files[index]
                  for index in page_list
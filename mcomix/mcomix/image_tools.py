@@ -1,8 +1,10 @@
 """image_tools.py - Various image manipulations."""
 
 import binascii
+import math
 import operator
 import os
+import threading
 from io import BytesIO
 
 from PIL import Image
@@ -17,6 +19,10 @@ from mcomix import tools
 from mcomix.lib import reader
 from mcomix.preferences import prefs
 
+#: PIL modes of the pages kept as PIL images (one byte per pixel) until
+#: display, see load_page()
+COMPACT_MODES = ('1', 'L', 'P')
+
 if tools.use_gui():
     from gi.repository import Gdk, Gtk
 
@@ -186,16 +192,11 @@ def fit_in_rectangle(src, width, height, keep_ratio=True, scale_up=False,
         assert (width, height) == (src_width, src_height), 'PIL resize bug'
 
     if src.get_has_alpha():
-        if prefs['checkered bg for transparent images']:
-            check_size, color1, color2 = 8, 0x777777, 0x999999
-        else:
-            check_size, color1, color2 = 1024, 0xFFFFFF, 0xFFFFFF
         if (width, height) == (src_width, src_height):
             # Using anything other than nearest interpolation will result in a
             # modified image if no resizing takes place (even if it's opaque).
             scaling_quality = GdkPixbuf.InterpType.NEAREST
-        src = src.composite_color_simple(width, height, scaling_quality,
-                                         255, check_size, color1, color2)
+        src = _composite_background(src, width, height, scaling_quality)
     elif (width, height) != (src_width, src_height):
         src = src.scale_simple(width, height, scaling_quality)
 
@@ -204,6 +205,117 @@ def fit_in_rectangle(src, width, height, keep_ratio=True, scale_up=False,
     return src
 
 
+def _composite_background(src, width, height, scaling_quality):
+    """Return <src> scaled to <width> x <height> over the background used
+    for transparent images."""
+    if prefs['checkered bg for transparent images']:
+        check_size, color1, color2 = 8, 0x777777, 0x999999
+    else:
+        check_size, color1, color2 = 1024, 0xFFFFFF, 0xFFFFFF
+    return src.composite_color_simple(width, height, scaling_quality,
+                                      255, check_size, color1, color2)
+
+
+def transform_image(src, size, rotation, flip=False, flop=False, enhancement=None):
+    """Return a pixbuf of <src> (a pixbuf or a PIL image) scaled to <size>
+    (width, height) once rotated by <rotation>, flipped vertically if
+    <flip>, horizontally if <flop>, and enhanced with <enhancement> (a dict
+    of enhance() keyword arguments, or None), as displayed in the main view.
+
+    If PIL is needed (to scale with a 'pil scaling filter', to enhance, or
+    because <src> is a PIL image), every step is done on the same PIL image
+    and it is converted to a pixbuf only once at the end. Grayscale images
+    are then only expanded to RGB at display size. Otherwise <src> stays a
+    pixbuf.
+    """
+    if is_animation(src):
+        if enhancement:
+            enhancement = dict(enhancement, sharpness=1.0, autocontrast=False)
+        return anime_tools.frame_executor(
+                src, transform_image,
+                args=(size, rotation),
+                kwargs=dict(flip=flip, flop=flop, enhancement=enhancement)
+        )
+    rotation %= 360
+    if rotation not in (0, 90, 180, 270):
+        raise ValueError('unsupported rotation: %s' % rotation)
+    width, height = max(size[0], 1), max(size[1], 1)
+    if rotation in (90, 270):
+        width, height = height, width
+
+    pil_filter = prefs['pil scaling filter']
+    if not isinstance(src, Image.Image) and not enhancement and \
+            (pil_filter < 0 or (src.get_width(), src.get_height()) == (width, height)):
+        # No need for PIL.
+        return trans_pixbuf(fit_pixbuf_to_rectangle(src, size, rotation),
+                            flip=flip, flop=flop)
+
+    transpose = _get_transpose(rotation, flip, flop)
+    composited = False
+    if isinstance(src, Image.Image):
+        im = src
+        if im.mode in ('1', 'P') and \
+           (im.size != (width, height) or enhancement or transpose is not None):
+            # PIL only scales these modes with the nearest neighbour filter,
+            # and ImageEnhance does not support them.
+            im = im.convert('L' if im.mode == '1' else _get_pixbuf_mode(im))
+    elif pil_filter < 0:
+        # Scale (and compose transparent images) with GdkPixbuf first,
+        # so that PIL only works on the smaller image.
+        composited = src.get_has_alpha()
+        im = pixbuf_to_pil(fit_in_rectangle(src, width, height,
+                                            keep_ratio=False, scale_up=True))
+    else:
+        im = pixbuf_to_pil(src)
+    if im.size != (width, height):
+        if pil_filter < 0:
+            resample = _PIL_FILTERS.get(prefs['scaling quality'], Image.BILINEAR)
+        else:
+            resample = pil_filter
+        im = im.resize((width, height), resample=resample)
+    if transpose is not None:
+        im = im.transpose(transpose)
+    if enhancement:
+        im = _enhance_image(im, **enhancement)
+    pixbuf = pil_to_pixbuf(im)
+    if pixbuf.get_has_alpha() and not composited:
+        pixbuf = _composite_background(pixbuf, pixbuf.get_width(), pixbuf.get_height(),
+                                       GdkPixbuf.InterpType.NEAREST)
+    return pixbuf
+
+
+#: GdkPixbuf interpolation ('scaling quality') > closest PIL filter
+_PIL_FILTERS = {
+    int(GdkPixbuf.InterpType.NEAREST): Image.NEAREST,
+    int(GdkPixbuf.InterpType.TILES): Image.BOX,
+    int(GdkPixbuf.InterpType.BILINEAR): Image.BILINEAR,
+    int(GdkPixbuf.InterpType.HYPER): Image.BICUBIC,
+}
+
+#: (clockwise rotation, horizontal flip) > PIL transpose operation
+_TRANSPOSES = {
+    (0, False): None,
+    (90, False): Image.ROTATE_270,
+    (180, False): Image.ROTATE_180,
+    (270, False): Image.ROTATE_90,
+    (0, True): Image.FLIP_LEFT_RIGHT,
+    (90, True): Image.TRANSPOSE,
+    (180, True): Image.FLIP_TOP_BOTTOM,
+    (270, True): Image.TRANSVERSE,
+}
+
+
+def _get_transpose(rotation, flip, flop):
+    """Return the single PIL transpose operation rotating by <rotation>
+    clockwise, then flipping vertically if <flip> and horizontally if
+    <flop>, or None."""
+    if flip:
+        # A vertical flip is a half turn and a horizontal flip.
+        rotation = (rotation + 180) % 360
+        flop = not flop
+    return _TRANSPOSES[(rotation, flop)]
+
+
 def add_border(pixbuf, thickness, colour=0x000000FF):
     """Return a pixbuf from <pixbuf> with a <thickness> px border of
     <colour> added.
@@ -219,9 +331,9 @@ def add_border(pixbuf, thickness, colour=0x000000FF):
 
 def get_most_common_edge_color(pixbufs, edge=2):
     """Return the most commonly occurring pixel value along the four edges
-    of <pixbuf>. The return value is a sequence, (r, g, b), with 16 bit
-    values. If <pixbuf> is a tuple, the edges will be computed from
-    both the left and the right image.
+    of <pixbuf> (or PIL image). The return value is a sequence, (r, g, b),
+    with 16 bit values. If <pixbuf> is a tuple, the edges will be computed
+    from both the left and the right image.
 
     Note: This could be done more cleanly with subpixbuf(), but that
     doesn't work as expected together with get_pixels().
@@ -288,6 +400,17 @@ def get_most_common_edge_color(pixbufs, edge=2):
     def get_edge_pixbuf(pixbuf, side, edg):
         """ Returns a pixbuf corresponding to the side passed in <side>.
         Valid sides are 'left', 'right', 'top', 'bottom'. """
+        if isinstance(pixbuf, Image.Image):
+            # Same colors as the pixbuf of the whole image would have.
+            width, height = pixbuf.size
+            edg = min(edg, width, height)
+            box = {
+                'left': (0, 0, edg, height),
+                'right': (width - edg, 0, width, height),
+                'top': (0, 0, width, edg),
+                'bottom': (0, height - edg, width, height),
+            }[side]
+            return pixbuf.crop(box).convert(_get_pixbuf_mode(pixbuf))
         pixbuf = static_image(pixbuf)
         width = pixbuf.get_width()
         height = pixbuf.get_height()
@@ -322,7 +445,7 @@ def get_most_common_edge_color(pixbufs, edge=2):
     # Find all edge colors. Color count is separate for all four edges
     ungrouped_colors = []
     for edge in (left_edge, right_edge):
-        im = pixbuf_to_pil(edge)
+        im = edge if isinstance(edge, Image.Image) else pixbuf_to_pil(edge)
         ungrouped_colors.extend(im.getcolors(im.size[0] * im.size[1]))
 
     # Sum up colors from all edges
@@ -331,45 +454,149 @@ def get_most_common_edge_color(pixbufs, edge=2):
     return [color / 255 for color in most_used]
 
 
-def pil_to_pixbuf(im, keep_orientation=False):
-    """Return a pixbuf created from the PIL <im>."""
+def _get_pixbuf_mode(im):
+    """Return the PIL mode ('RGB' or 'RGBA') the PIL <im> is converted to
+    when creating a pixbuf."""
     if im.mode.startswith('RGB'):
         has_alpha = im.mode == 'RGBA'
     elif im.mode in ('LA', 'P'):
         has_alpha = True
     else:
         has_alpha = False
-    target_mode = 'RGBA' if has_alpha else 'RGB'
+    return 'RGBA' if has_alpha else 'RGB'
+
+
+def pil_to_pixbuf(im, keep_orientation=False):
+    """Return a pixbuf created from the PIL <im>. If <keep_orientation>,
+    the Exif orientation of <im> and the full size of a reduced page (see
+    load_page()) are kept as attributes of the pixbuf."""
+    target_mode = _get_pixbuf_mode(im)
+    has_alpha = target_mode == 'RGBA'
     if im.mode != target_mode:
         im = im.convert(target_mode)
+        _count_copy(im.size[0] * im.size[1] * len(target_mode))
+    # PyGObject always copies the data into the GLib.Bytes.
+    data = im.tobytes()
     pixbuf = GdkPixbuf.Pixbuf.new_from_bytes(
-            GLib.Bytes.new(im.tobytes()), GdkPixbuf.Colorspace.RGB,
+            GLib.Bytes.new(data), GdkPixbuf.Colorspace.RGB,
             has_alpha, 8,
             im.size[0], im.size[1],
             (4 if has_alpha else 3) * im.size[0]
     )
+    _count_copy(2 * len(data))
     if keep_orientation:
         # Keep orientation metadata.
-        orientation = _getexif(im).get(274, None)
+        orientation = getattr(im, 'orientation', None)
+        if orientation is None:
+            orientation = _getexif(im).get(274, None)
         if orientation is not None:
             setattr(pixbuf, 'orientation', str(orientation))
+        full_size = getattr(im, 'full_size', None)
+        if full_size is not None:
+            setattr(pixbuf, 'full_size', full_size)
     return pixbuf
 
 
+def to_pixbuf(image):
+    """Return <image>, as returned by load_page(), as a pixbuf (or
+    animation)."""
+    if isinstance(image, Image.Image):
+        return pil_to_pixbuf(image, keep_orientation=True)
+    return image
+
+
 def pixbuf_to_pil(pixbuf):
-    """Return a PIL image created from <pixbuf>."""
+    """Return a PIL image created from <pixbuf>. The image is read-only, and
+    wraps (including the row padding) the copy of the pixels returned by
+    Pixbuf.get_pixels()."""
     dimensions = pixbuf.get_width(), pixbuf.get_height()
     stride = pixbuf.get_rowstride()
     pixels = pixbuf.get_pixels()
+    _count_copy(len(pixels))
     mode = 'RGBA' if pixbuf.get_has_alpha() else 'RGB'
     im = Image.frombuffer(mode, dimensions, pixels, 'raw', mode, stride, 1)
     return im
 
 
+#: Number of bytes copied by the conversions between PIL images and
+#: pixbufs, None unless counting is enabled by count_copies()
+_copied_bytes = None
+_copied_bytes_lock = threading.Lock()
+
+
+def count_copies():
+    """Start counting the bytes copied by the conversions between PIL images
+    and pixbufs, see get_copied_bytes(). Only meant for benchmarks."""
+    global _copied_bytes
+    with _copied_bytes_lock:
+        if _copied_bytes is None:
+            _copied_bytes = 0
+
+
+def _count_copy(size):
+    global _copied_bytes
+    if _copied_bytes is None:
+        return
+    with _copied_bytes_lock:
+        _copied_bytes += size
+
+
+def get_copied_bytes():
+    """Return the number of bytes copied since count_copies() was called by
+    the conversions between PIL images and pixbufs."""
+    return _copied_bytes or 0
+
+
 def is_animation(pixbuf):
     return isinstance(pixbuf, GdkPixbuf.PixbufAnimation)
 
 
+def get_memory_size(pixbuf):
+    """ Returns the number of bytes used by the pixel data of <pixbuf> (or
+    of a PIL image as returned by load_page()). For animations, this is the
+    size of one frame times the number of frames (1 if unknown). """
+    if isinstance(pixbuf, Image.Image):
+        width, height = pixbuf.size
+        return width * height * (1 if pixbuf.mode in COMPACT_MODES else 4)
+    frames = 1
+    if is_animation(pixbuf):
+        framebuffer = getattr(pixbuf, '_framebuffer', None)
+        if framebuffer is not None:
+            frames = framebuffer.n_frames
+        pixbuf = pixbuf.get_static_image()
+    return pixbuf.get_rowstride() * pixbuf.get_height() * frames
+
+
+def is_compact(image):
+    """ Returns True if <image> is a page kept as a PIL image, see
+    load_page(). """
+    return isinstance(image, Image.Image)
+
+
+def is_reduced(image):
+    """ Returns True if <image> was decoded at a reduced resolution, see
+    load_page(). """
+    return getattr(image, 'full_size', None) is not None
+
+
+def get_image_size(image):
+    """ Returns the (width, height) of <image>, a pixbuf, an animation or a
+    PIL image, at full resolution even if it was decoded at a reduced
+    resolution, see load_page(). """
+    full_size = getattr(image, 'full_size', None)
+    if full_size is not None:
+        return full_size
+    return get_decoded_size(image)
+
+
+def get_decoded_size(image):
+    """ Returns the (width, height) of the pixel data of <image>, a pixbuf,
+    an animation or a PIL image. """
+    if isinstance(image, Image.Image):
+        return image.size
+    return image.get_width(), image.get_height()
+
+
 def disable_transform(pixbuf):
     if is_animation(pixbuf):
         if not hasattr(pixbuf, '_framebuffer'):
@@ -440,34 +667,180 @@ def load_animation(im):
 
 def load_pixbuf(path):
     """ Loads a pixbuf from a given image file. """
+    return to_pixbuf(load_page(path))
+
+
+def _open_source(source):
+    """ Returns a file object reading <source>, either the path of an image
+    file or the bytes of an image file. """
+    if isinstance(source, bytes):
+        return BytesIO(source)
+    return reader.MappedFileIO(source)
+
+
+def _load_source_data(source):
+    """ Feeds the bytes <source> to a GdkPixbuf loader, and returns the
+    loader once closed. """
+    loader = GdkPixbuf.PixbufLoader()
+    loader.write(source)
+    loader.close()
+    return loader
+
+
+def load_page(source, scale=None):
+    """ Loads a page from a given image file, or from the bytes of an image
+    file. Bilevel, grayscale and palette images (see COMPACT_MODES) are
+    returned as PIL images, with the Exif orientation (if any) as an
+    'orientation' attribute, since they use a single byte per pixel instead
+    of 3 or 4 in a pixbuf. Other images are returned as pixbufs or
+    animations. See to_pixbuf().
+
+    If <scale> is below 1, still images are decoded at the lowest resolution
+    which covers their size scaled by <scale>, and keep their full size as
+    a 'full_size' attribute, see get_image_size() and get_decoded_size(). """
     enable_anime = prefs['animation mode'] != constants.ANIMATION_DISABLED
     try:
-        with reader.LockedFileIO(path) as fio:
+        with _open_source(source) as fio:
             with Image.open(fio) as im:
-                # make sure n_frames loaded
-                im.load()
+                if scale is not None and scale < 1 and not getattr(im, 'is_animated', False):
+                    full_size = im.size
+                    im = _decode_reduced(im, scale)
+                    if im.size != full_size:
+                        setattr(im, 'full_size', full_size)
+                else:
+                    # make sure n_frames loaded
+                    im.load()
                 if enable_anime and getattr(im, 'is_animated', False):
                     return load_animation(im)
+                if im.mode in COMPACT_MODES:
+                    orientation = _getexif(im).get(274, None)
+                    if orientation is not None:
+                        setattr(im, 'orientation', str(orientation))
+                    return im
                 return pil_to_pixbuf(im, keep_orientation=True)
     except:
         pass
+    if isinstance(source, bytes):
+        loader = _load_source_data(source)
+        if enable_anime:
+            pixbuf = loader.get_animation()
+            if pixbuf.is_static_image():
+                return pixbuf.get_static_image()
+            return pixbuf
+        return loader.get_pixbuf()
     if enable_anime:
-        pixbuf = GdkPixbuf.PixbufAnimation.new_from_file(path)
+        pixbuf = GdkPixbuf.PixbufAnimation.new_from_file(source)
         if pixbuf.is_static_image():
             return pixbuf.get_static_image()
         return pixbuf
-    return GdkPixbuf.Pixbuf.new_from_file(path)
+    return GdkPixbuf.Pixbuf.new_from_file(source)
+
+
+def _decode_reduced(im, scale):
+    """ Decodes <im>, freshly opened, at the lowest resolution which still
+    covers its size scaled by <scale>, and returns the decoded image (which
+    may not be <im>). The Exif orientation of <im> is kept as an
+    'orientation' attribute.
+
+    JPEG images are scaled by the decoder itself (by 1/2, 1/4 or 1/8, see
+    Image.draft), other images are reduced by an integer factor right after
+    decoding (see Image.reduce), before the final resampling. """
+    orientation = _getexif(im).get(274, None)
+    if scale < 1:
+        size = (max(1, math.ceil(im.size[0] * scale)),
+                max(1, math.ceil(im.size[1] * scale)))
+        im.draft(None, size)
+        im.load()
+        factor = min(im.size[0] // size[0], im.size[1] // size[1])
+        # Image.reduce is only available since Pillow 7.0.0, and does not
+        # support bilevel and palette images, nor 16 bits grayscale ones
+        # (reduced as 32 bits ones instead).
+        if factor > 1 and hasattr(im, 'reduce') and im.mode not in ('1', 'P'):
+            if im.mode.startswith('I;16'):
+                im = im.convert('I')
+            im = im.reduce(factor)
+    else:
+        im.load()
+    if orientation is not None:
+        setattr(im, 'orientation', str(orientation))
+    return im
+
+
+def _get_exif_thumbnail(im):
+    """ Returns the JPEG thumbnail embedded in the Exif data of <im> (as
+    bytes), or None. """
+    data = im.info.get('exif', None)
+    if not data or not data.startswith(b'Exif\x00\x00'):
+        return None
+    try:
+        # IFD1, only available since Pillow 8.2.0
+        ifd1 = im.getexif().get_ifd(-1)
+    except Exception:
+        return None
+    offset = ifd1.get(0x0201, None)
+    length = ifd1.get(0x0202, None)
+    if not offset or not length:
+        return None
+    # Offsets are relative to the TIFF header, after the Exif marker.
+    thumbnail = data[6 + offset:6 + offset + length]
+    if len(thumbnail) != length:
+        return None
+    return thumbnail
+
+
+def load_preview(source):
+    """ Quickly loads a low resolution preview of a page from a given image
+    file, or from the bytes of an image file: the Exif thumbnail of the
+    page if it has one with the same aspect ratio, otherwise the page itself
+    decoded at 1/8 of its size if it is a JPEG image (see Image.draft).
+
+    Returns a PIL image keeping the full size and the Exif orientation of
+    the page as attributes (see load_page()), or None if no cheap preview
+    can be made. """
+    try:
+        with _open_source(source) as fio:
+            with Image.open(fio) as im:
+                full_size = im.size
+                orientation = _getexif(im).get(274, None)
+                preview = None
+                thumbnail = _get_exif_thumbnail(im)
+                if thumbnail is not None:
+                    preview = Image.open(BytesIO(thumbnail))
+                    preview.load()
+                    width, height = preview.size
+                    if abs(width * full_size[1] - height * full_size[0]) > \
+                            0.05 * height * full_size[0]:
+                        # Probably letterboxed, or not the same picture.
+                        preview = None
+                if preview is None and im.format == 'JPEG':
+                    im.draft(None, (max(1, full_size[0] // 8),
+                                    max(1, full_size[1] // 8)))
+                    im.load()
+                    preview = im
+    except Exception:
+        return None
+    if preview is None:
+        return None
+    if orientation is not None:
+        setattr(preview, 'orientation', str(orientation))
+    setattr(preview, 'full_size', full_size)
+    return preview
 
 
 def load_pixbuf_size(path, width, height):
-    """ Loads a pixbuf from a given image file and scale it to fit
-    inside (width, height). """
+    """ Loads a pixbuf from a given image file (or from the bytes of an
+    image file) and scale it to fit inside (width, height). The image is
+    decoded at a reduced resolution whenever possible, see
+    _decode_reduced(). """
     try:
-        with reader.LockedFileIO(path) as fio:
+        with _open_source(path) as fio:
             with Image.open(fio) as im:
+                im = _decode_reduced(im, min(width / im.size[0], height / im.size[1]))
                 im.thumbnail((width, height), resample=Image.BOX)
                 return pil_to_pixbuf(im, keep_orientation=True)
     except:
+        if isinstance(path, bytes):
+            return fit_in_rectangle(_load_source_data(path).get_pixbuf(), width, height)
         info, image_width, image_height = GdkPixbuf.Pixbuf.get_file_info(path)
         # If we could not get the image info, still try to load
         # the image to let GdkPixbuf raise the appropriate exception.
@@ -509,7 +882,17 @@ def enhance(pixbuf, brightness=1.0, contrast=1.0, saturation=1.0,
                         autocontrast=False
                 )
         )
-    im = pixbuf_to_pil(pixbuf)
+    im = _enhance_image(pixbuf_to_pil(pixbuf), brightness, contrast,
+                        saturation, sharpness, autocontrast)
+    return pil_to_pixbuf(im)
+
+
+def _enhance_image(im, brightness=1.0, contrast=1.0, saturation=1.0,
+                   sharpness=1.0, autocontrast=False):
+    """Same as enhance(), for the PIL image <im>."""
+    if im.mode in ('1', 'P'):
+        # ImageEnhance does not support these modes.
+        im = im.convert('L' if im.mode == '1' else _get_pixbuf_mode(im))
     if brightness != 1.0:
         im = ImageEnhance.Brightness(im).enhance(brightness)
     if autocontrast and im.mode in ('L', 'RGB'):
@@ -520,7 +903,7 @@ def enhance(pixbuf, brightness=1.0, contrast=1.0, saturation=1.0,
         im = ImageEnhance.Color(im).enhance(saturation)
     if sharpness != 1.0:
         im = ImageEnhance.Sharpness(im).enhance(sharpness)
-    return pil_to_pixbuf(im)
+    return im
 
 
 def get_implied_rotation(pixbuf):
@@ -533,8 +916,16 @@ def get_implied_rotation(pixbuf):
     """
     pixbuf = static_image(pixbuf)
     orientation = getattr(pixbuf, 'orientation', None)
-    if orientation is None:
+    if orientation is None and not isinstance(pixbuf, Image.Image):
         orientation = pixbuf.get_option('orientation')
+    return get_orientation_rotation(orientation)
+
+
+def get_orientation_rotation(orientation):
+    """Return the rotation in degrees (0, 90, 180, or 270) implied by the
+    Exif <orientation> tag value (as an int or a string), or 0 if unknown.
+    """
+    orientation = str(orientation)
     if orientation == '3':
         return 180
     elif orientation == '6':
@@ -605,7 +996,7 @@ def get_image_info(path):
     """
     info = None
     try:
-        with reader.LockedFileIO(path) as fio:
+        with reader.MappedFileIO(path) as fio:
             with Image.open(fio) as im:
                 return (im.format,) + im.size
     except:
@@ -619,6 +1010,62 @@ def get_image_info(path):
     return info
 
 
+def get_image_header(path):
+    """Return image informations read from the header of <path> (or of the
+    bytes of an image file) only, without decoding any pixel data:
+        (format, width, height, orientation)
+    <orientation> is the Exif orientation tag as a string, or None.
+    Return None if the header could not be parsed.
+    """
+    try:
+        with _open_source(path) as fio:
+            with Image.open(fio) as im:
+                orientation = None
+                if 'exif' in im.info:
+                    # Exif data is part of the header for JPEG and WebP.
+                    orientation = im.getexif().get(274, None)
+                elif hasattr(im, 'tag_v2'):
+                    # TIFF
+                    orientation = im.tag_v2.get(274, None)
+                if orientation is not None:
+                    orientation = str(orientation)
+                return (im.format,) + im.size + (orientation,)
+    except:
+        pass
+    if isinstance(path, bytes):
+        return _get_data_header(path)
+    info = GdkPixbuf.Pixbuf.get_file_info(path)
+    if info[0] is None:
+        return None
+    return info[0].get_name().upper(), info[1], info[2], None
+
+
+def _get_data_header(data, chunk_size=64 * 1024):
+    """Same as get_image_header() for the bytes <data> of an image file
+    GdkPixbuf can load: <data> is fed to a loader chunk by chunk, only until
+    the size of the image is known."""
+    loader = GdkPixbuf.PixbufLoader()
+    size = []
+    loader.connect('size-prepared', lambda loader, width, height: size.append((width, height)))
+    try:
+        for offset in range(0, len(data), chunk_size):
+            loader.write(data[offset:offset + chunk_size])
+            if size:
+                break
+        fmt = loader.get_format()
+    except GLib.GError:
+        return None
+    finally:
+        try:
+            loader.close()
+        except GLib.GError:
+            # Not fed with the whole image.
+            pass
+    if fmt is None or not size:
+        return None
+    return (fmt.get_name().upper(),) + size[0] + (None,)
+
+
 SUPPORTED_IMAGE_EXTS = set()
 SUPPORTED_IMAGE_MIMES = set()
 SUPPORTED_IMAGE_FORMATS = {}
@@ -31,6 +31,10 @@ class MagnifyingLens(object):
         self._point = None
         #: Stores the last rectangle that was used to render the lens
         self._last_lens_rect = None
+        #: (page, number of pages) of the source pixbufs, requested or ready
+        self._source_key = None
+        #: Unscaled pixbufs of the displayed pages, None until decoded
+        self._source_pixbufs = None
 
     def get_enabled(self):
         return self._enabled
@@ -49,6 +53,8 @@ class MagnifyingLens(object):
             self._window.cursor_handler.set_cursor_type(constants.NORMAL_CURSOR)
             self._clear_lens()
             self._last_lens_rect = None
+            self._source_key = None
+            self._source_pixbufs = None
 
     enabled = property(get_enabled, set_enabled)
 
@@ -60,8 +66,11 @@ class MagnifyingLens(object):
         if self._window.images[0].get_storage_type() not in (Gtk.ImageType.PIXBUF, Gtk.ImageType.ANIMATION):
             return
 
-        rectangle = self._calculate_lens_rect(x, y, prefs['lens size'], prefs['lens size'])
         pixbuf = self._get_lens_pixbuf(x, y)
+        if pixbuf is None:
+            # Drawn once the source pixbufs are decoded.
+            return
+        rectangle = self._calculate_lens_rect(x, y, prefs['lens size'], prefs['lens size'])
 
         draw_region = Gdk.Rectangle()
         draw_region.x, draw_region.y, draw_region.width, draw_region.height = rectangle
@@ -126,16 +135,19 @@ class MagnifyingLens(object):
 
     def _get_lens_pixbuf(self, x, y):
         """Get a pixbuf containing the appropiate image data for the lens
-        where <x> and <y> are the positions of the cursor.
+        where <x> and <y> are the positions of the cursor, or None if the
+        displayed pages are not decoded yet.
         """
+        cb = self._window.layout.get_content_boxes()
+        source_pixbufs = self._get_source_pixbufs(len(cb))
+        if source_pixbufs is None:
+            return None
         canvas = GdkPixbuf.Pixbuf.new(colorspace=GdkPixbuf.Colorspace.RGB,
                                       has_alpha=True, bits_per_sample=8,
                                       width=prefs['lens size'],
                                       height=prefs['lens size'])
         r, g, b, a = [int(p * 255) for p in self._window.get_bg_color()]
         canvas.fill(image_tools.convert_rgb16list_to_rgba8int([r, g, b]))
-        cb = self._window.layout.get_content_boxes()
-        source_pixbufs = self._window.imagehandler.get_pixbufs(len(cb))
         for i in range(len(cb)):
             if image_tools.is_animation(source_pixbufs[i]):
                 continue
@@ -145,6 +157,28 @@ class MagnifyingLens(object):
 
         return image_tools.add_border(canvas, 1)
 
+    def _get_source_pixbufs(self, number_of_bufs):
+        """Return the unscaled pixbufs of the <number_of_bufs> displayed
+        pages, or None after asking for them without waiting; the lens is
+        drawn again once they are ready.
+        """
+        key = (self._window.imagehandler.get_current_page(), number_of_bufs)
+        if key == self._source_key:
+            return self._source_pixbufs
+        self._source_key = key
+        self._source_pixbufs = None
+        self._window.imagehandler.request_pixbufs(number_of_bufs,
+                                                  self._source_pixbufs_ready)
+        return None
+
+    def _source_pixbufs_ready(self, page, pixbufs):
+        if not self.enabled or self._source_key != (page, len(pixbufs)):
+            # Outdated request.
+            return
+        self._source_pixbufs = pixbufs
+        if self._point:
+            self._draw_lens(*self._point)
+
     def _add_subpixbuf(self, canvas, x, y, image_size, source_pixbuf):
         """Copy a subpixbuf from <source_pixbuf> to <canvas> as it should
         be in the lens if the coordinates <x>, <y> are the mouse pointer
@@ -1,10 +1,148 @@
 import io
+import mmap
+import os
 from threading import Lock
 
-_IOLock=Lock()
+# Lock for _mappings itself, only held while looking up a mapping,
+# never while reading from a file.
+_registry_lock=Lock()
+# {(path,st_dev,st_ino,st_mtime_ns,st_size): _SharedMapping}
+_mappings={}
 
-class LockedFileIO(io.BytesIO):
+
+class _SharedMapping:
+    # A read-only mmap of one file, shared by all readers of that file.
+    def __init__(self,key):
+        self.key=key
+        self.lock=Lock() # per-file lock, guards mapping and unmapping
+        self.refs=0 # protected by _registry_lock
+        self.map=None
+
+    def acquire(self,path):
+        with self.lock:
+            if self.map is None:
+                with open(path,mode='rb') as f:
+                    # mmap keeps its own reference to the file,
+                    # so f can be closed right away.
+                    self.map=mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+            return self.map
+
+    def unmap(self):
+        with self.lock:
+            if self.map is None:
+                return
+            try:
+                self.map.close()
+            except BufferError:
+                # a memoryview from getbuffer() is still alive,
+                # leave the mapping to the garbage collector.
+                pass
+            self.map=None
+
+
+def _get_mapping(path,st):
+    key=(path,st.st_dev,st.st_ino,st.st_mtime_ns,st.st_size)
+    with _registry_lock:
+        shared=_mappings.get(key)
+        if shared is None:
+            shared=_mappings[key]=_SharedMapping(key)
+        shared.refs+=1
+    return shared
+
+
+def _drop_mapping(shared):
+    with _registry_lock:
+        shared.refs-=1
+        if shared.refs>0:
+            return
+        if _mappings.get(shared.key) is shared:
+            del _mappings[shared.key]
+    shared.unmap()
+
+
+class MappedFileIO(io.RawIOBase):
+    # Read-only, seekable file object backed by a memory mapping.
+    #
+    # Replacement of the former LockedFileIO: no process-wide lock
+    # and no copy of the whole file into a BytesIO. All readers of
+    # the same file share one mapping, every reader has its own
+    # position, so any number of decoders can work concurrently.
     def __init__(self,path):
-        with _IOLock:
-            with open(path,mode='rb') as f:
-                super().__init__(f.read())
+        super().__init__()
+        self.name=path
+        self._pos=0
+        self._shared=None
+        self._map=None
+        st=os.stat(path)
+        if st.st_size==0:
+            # empty files can not be mapped
+            self._view=memoryview(b'')
+            return
+        shared=_get_mapping(path,st)
+        try:
+            self._map=shared.acquire(path)
+        except:
+            _drop_mapping(shared)
+            raise
+        self._shared=shared
+        self._view=memoryview(self._map)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self,offset,whence=io.SEEK_SET):
+        if whence==io.SEEK_SET:
+            pos=offset
+        elif whence==io.SEEK_CUR:
+            pos=self._pos+offset
+        elif whence==io.SEEK_END:
+            pos=len(self._view)+offset
+        else:
+            raise ValueError('invalid whence ({})'.format(whence))
+        if pos<0:
+            raise ValueError('negative seek position {}'.format(pos))
+        self._pos=pos
+        return pos
+
+    def read(self,size=-1):
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+        start=min(self._pos,len(self._view))
+        end=len(self._view) if size is None or size<0 else min(start+size,len(self._view))
+        self._pos=end
+        return self._view[start:end].tobytes()
+
+    def readall(self):
+        return self.read()
+
+    def readinto(self,b):
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+        start=min(self._pos,len(self._view))
+        n=min(len(b),len(self._view)-start)
+        b[:n]=self._view[start:start+n]
+        self._pos=start+n
+        return n
+
+    def getbuffer(self):
+        # zero-copy access to the whole file content
+        return self._view
+
+    def size(self):
+        return len(self._view)
+
+    def close(self):
+        if self.closed:
+            return
+        self._view.release()
+        self._map=None
+        if self._shared is not None:
+            _drop_mapping(self._shared)
+            self._shared=None
+        super().close()
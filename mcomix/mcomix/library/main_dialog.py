@@ -5,8 +5,8 @@ from gi.repository import Gdk, Gtk
 
 from mcomix.preferences import prefs
 from mcomix import i18n
-from mcomix import tools
 from mcomix import log
+from mcomix import memory
 from mcomix import file_chooser_library_dialog
 from mcomix import status
 from mcomix.library import backend as library_backend
@@ -192,6 +192,6 @@ def _close_dialog(*args):
     if _dialog is not None:
         _dialog.destroy()
         _dialog = None
-        tools.garbage_collect()
+        memory.collect_when_idle()
 
 # vim: expandtab:sw=4:ts=4
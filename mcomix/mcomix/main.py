@@ -24,11 +24,14 @@ from mcomix import metadata
 from mcomix import osd
 from mcomix import pageselect
 from mcomix import preferences
+from mcomix import prerender
+from mcomix import render_cache
 from mcomix import slideshow
 from mcomix import status
 from mcomix import thumbbar
 from mcomix import tools
 from mcomix import ui
+from mcomix import watchdog
 from mcomix import zoom
 from mcomix.library import backend, main_dialog
 from mcomix.preferences import prefs
@@ -59,6 +62,8 @@ class MainWindow(Gtk.Window):
         self.hide_all_forced = False
         # Remember last scroll destination.
         self._last_scroll_destination = constants.SCROLL_TO_START
+        #: Scroll position right after a preview was drawn, see _page_decoded
+        self._preview_scroll_position = None
 
         self.layout = _dummy_layout()
         self._spacing = 2
@@ -83,6 +88,8 @@ class MainWindow(Gtk.Window):
         self.filehandler.file_opened += self._on_file_opened
         self.imagehandler = image_handler.ImageHandler(self)
         self.imagehandler.page_available += self._page_available
+        self.imagehandler.page_decoded += self._page_decoded
+        self.imagehandler.preview_ready += self._preview_ready
         self.thumbnailsidebar = thumbbar.ThumbnailSidebar(self)
         self.thumbnailsidebar.get_page_num_str_func = self.get_page_num_str
 
@@ -94,6 +101,7 @@ class MainWindow(Gtk.Window):
         self.lens = lens.MagnifyingLens(self)
         self.osd = osd.OnScreenDisplay(self)
         self.zoom = zoom.ZoomModel()
+        self.prerenderer = prerender.PreRenderer(self)
         self.uimanager = ui.MainUI(self)
         self.menubar = self.uimanager.get_widget('/Menu')
         self.toolbar = self.uimanager.get_widget('/Tool')
@@ -282,6 +290,10 @@ class MainWindow(Gtk.Window):
 
         self.cursor_handler.auto_hide_on()
 
+        # Report when something blocks the main loop, e.g. waiting for a page.
+        self._watchdog = watchdog.MainLoopWatchdog()
+        self._watchdog.start()
+
         # Make sure we receive *all* mouse motion events,
         # even if a modal dialog is being shown.
         def _on_event(evnt):
@@ -394,7 +406,7 @@ class MainWindow(Gtk.Window):
                 if should_be_visible != widget.get_visible():
                     (widget.show if should_be_visible else widget.hide)()
 
-    def _draw_image(self, scroll_to):
+    def _draw_image(self, scroll_to, previews=None):
 
         self._update_toggles_visibility()
 
@@ -405,52 +417,31 @@ class MainWindow(Gtk.Window):
             self._waiting_for_redraw = False
             return False
 
+        pixbuf_count = 2 if self.displayed_double() else 1  # XXX limited to at most 2 pages
+        decoded = False
         if self.imagehandler.page_is_available():
-            distribution_axis = constants.DISTRIBUTION_AXIS
-            alignment_axis = constants.ALIGNMENT_AXIS
-            pixbuf_count = 2 if self.displayed_double() else 1  # XXX limited to at most 2 pages
-            pixbuf_list = list(self.imagehandler.get_pixbufs(pixbuf_count))
-            do_not_transform = [image_tools.disable_transform(x) for x in pixbuf_list]
-            size_list = [[pixbuf.get_width(), pixbuf.get_height()] for pixbuf in pixbuf_list]
-
-            if self.is_manga_mode:
-                orientation = constants.MANGA_ORIENTATION
+            # Never wait here for the page(s) to be decoded, they are redrawn
+            # once decoded, see _page_decoded.
+            decoded = self.imagehandler.request_pages(pixbuf_count)
+        if decoded:
+            previews = None
+        elif previews is None and prefs['progressive display']:
+            # Show a preview as soon as possible, see _preview_ready.
+            self.imagehandler.request_previews(pixbuf_count)
+
+        if decoded or previews is not None:
+            if previews is not None:
+                pixbuf_list = previews
+                # Scroll again once the page(s) are decoded.
+                self._last_scroll_destination = scroll_to
             else:
-                orientation = constants.WESTERN_ORIENTATION
-
-            # Rotation handling:
-            # - apply Exif rotation on individual images
-            # - apply automatic rotation (size based) on whole page
-            # - apply manual rotation on whole page
-            if prefs['auto rotate from exif']:
-                rotation_list = [image_tools.get_implied_rotation(pixbuf) for pixbuf in pixbuf_list]
-            else:
-                rotation_list = [0] * len(pixbuf_list)
-            virtual_size = [0, 0]
-            for i in range(pixbuf_count):
-                if rotation_list[i] in (90, 270):
-                    size_list[i].reverse()
-                size = size_list[i]
-                virtual_size[distribution_axis] += size[distribution_axis]
-                virtual_size[alignment_axis] = max(virtual_size[alignment_axis], size[alignment_axis])
-            rotation = self._get_size_rotation(*virtual_size)
-            rotation = (rotation + prefs['rotation']) % 360
-            if rotation in (90, 270):
-                distribution_axis, alignment_axis = alignment_axis, distribution_axis
-                orientation = list(orientation)
-                orientation.reverse()
-                for i in range(pixbuf_count):
-                    size_list[i].reverse()
-            if rotation in (180, 270):
-                orientation = tools.vector_opposite(orientation)
-            for i in range(pixbuf_count):
-                rotation_list[i] = (rotation_list[i] + rotation) % 360
-            if prefs['vertical flip'] and rotation in (90, 270):
-                orientation = tools.vector_opposite(orientation)
-            if prefs['horizontal flip'] and rotation in (0, 180):
-                orientation = tools.vector_opposite(orientation)
+                pixbuf_list = list(self.imagehandler.get_page_images(pixbuf_count))
+            do_not_transform = [image_tools.disable_transform(x) for x in pixbuf_list]
+            size_list, rotation_list, orientation, distribution_axis, alignment_axis = \
+                self.get_page_transform(pixbuf_list)
 
             viewport_size = ()  # dummy
+            area_size = None  # without scrollbars
             expand_area = False
             scrollbar_requests = [False] * len(self._scroll)
             # Visible area size is recomputed depending on scrollbar visibility
@@ -459,14 +450,11 @@ class MainWindow(Gtk.Window):
                 new_viewport_size = self.get_visible_area_size()
                 if new_viewport_size == viewport_size:
                     break
+                if area_size is None:
+                    area_size = new_viewport_size
                 viewport_size = new_viewport_size
-                zoom_dummy_size = list(viewport_size)
-                dasize = zoom_dummy_size[distribution_axis] - self._spacing * (pixbuf_count - 1)
-                if dasize <= 0:
-                    dasize = 1
-                zoom_dummy_size[distribution_axis] = dasize
-                scaled_sizes = self.zoom.get_zoomed_size(size_list, zoom_dummy_size,
-                                                         distribution_axis, do_not_transform)
+                scaled_sizes = self.get_scaled_sizes(size_list, viewport_size,
+                                                     distribution_axis, do_not_transform)
                 self.layout = layout.FiniteLayout(
                         scaled_sizes, viewport_size, orientation, self._spacing,
                         expand_area, distribution_axis, alignment_axis)
@@ -479,16 +467,33 @@ class MainWindow(Gtk.Window):
                     expand_area = True
                     viewport_size = ()  # start anew
 
-            for i in range(pixbuf_count):
-                pixbuf_list[i] = image_tools.fit_pixbuf_to_rectangle(pixbuf_list[i], scaled_sizes[i], rotation_list[i])
+            # Drop pre-rendered pages if the view geometry has changed.
+            self.prerenderer.update(area_size, viewport_size)
+            self.imagehandler.set_display_size(area_size)
 
+            first_index = self.imagehandler.get_current_page() - 1
             for i in range(pixbuf_count):
-                pixbuf_list[i] = image_tools.trans_pixbuf(
-                        pixbuf_list[i],
-                        flip=prefs['vertical flip'],
-                        flop=prefs['horizontal flip']
-                )
-                pixbuf_list[i] = self.enhancer.enhance(pixbuf_list[i])
+                if previews is not None:
+                    # Replaced as soon as the page(s) are decoded, see _page_decoded.
+                    pixbuf_list[i] = render_cache.render_pixbuf(pixbuf_list[i], scaled_sizes[i],
+                                                                rotation_list[i], self.enhancer)
+                    continue
+                key = render_cache.make_key(first_index + i, scaled_sizes[i],
+                                            rotation_list[i], self.enhancer)
+                rendered = self.imagehandler.render_cache.get(key)
+                if rendered is None:
+                    image = self.imagehandler.get_page_image(first_index + i + 1, scaled_sizes[i],
+                                                             rotation_list[i], nowait=True)
+                    if image is None:
+                        # Being decoded again at a higher resolution, show
+                        # the current one meanwhile, see _page_decoded.
+                        rendered = render_cache.render_pixbuf(pixbuf_list[i], scaled_sizes[i],
+                                                              rotation_list[i], self.enhancer)
+                    else:
+                        rendered = render_cache.render_pixbuf(image, scaled_sizes[i],
+                                                              rotation_list[i], self.enhancer)
+                        self.imagehandler.render_cache.add(key, rendered)
+                pixbuf_list[i] = rendered
 
             for i in range(pixbuf_count):
                 image_tools.set_from_pixbuf(self.images[i], pixbuf_list[i])
@@ -504,7 +509,8 @@ class MainWindow(Gtk.Window):
             smartbg = prefs['smart bg']
             smartthumbbg = prefs['show thumbnails'] and prefs['smart thumb bg']
             if smartbg or smartthumbbg:
-                bg_color = self.imagehandler.get_pixbuf_auto_background(pixbuf_count)
+                bg_color = self.imagehandler.get_pixbuf_auto_background(pixbuf_count,
+                                                                        images=previews)
                 if smartbg:
                     self.set_bg_color(bg_color)
                 if smartthumbbg:
@@ -540,20 +546,121 @@ class MainWindow(Gtk.Window):
                 self.scroll_to_predefined(destination, index)
 
             self._main_layout.get_bin_window().thaw_updates()
+
+            if previews is not None:
+                self._preview_scroll_position = self._get_scroll_position()
+            else:
+                self._preview_scroll_position = None
+
+            # Render the following page(s) in the background.
+            self.prerenderer.schedule()
         else:
-            # Save scroll destination for when the page becomes available.
+            # Save scroll destination for when the page becomes available
+            # (or decoded).
             self._last_scroll_destination = scroll_to
-            # If the pixbuf for the current page(s) isn't available,
-            # hide all images to clear any old pixbufs.
-            # XXX How about calling self._clear_main_area?
-            for i in range(len(self.images)):
-                self.images[i].hide()
-            self._show_scrollbars([False] * len(self._scroll))
+            self._preview_scroll_position = None
+            if not self.imagehandler.page_is_available():
+                # If the pixbuf for the current page(s) isn't available,
+                # hide all images to clear any old pixbufs.
+                # XXX How about calling self._clear_main_area?
+                for i in range(len(self.images)):
+                    self.images[i].hide()
+                self._show_scrollbars([False] * len(self._scroll))
+            # Otherwise keep the previous pixbufs on screen until the page(s)
+            # are decoded, see _page_decoded.
 
         self._waiting_for_redraw = False
 
         return False
 
+    def get_page_transform(self, pixbuf_list):
+        """ Computes how the pages of a spread (<pixbuf_list>, as displayed
+        from left to right in western mode, pixbufs or PIL images as
+        returned by ImageHandler.get_page_images()) are laid out. Returns the
+        unscaled page sizes after rotation, the rotation of each page, the
+        orientation, the distribution axis and the alignment axis.
+
+        Only depends on the pixbufs and on preferences, and can be used
+        outside of the main thread. """
+
+        distribution_axis = constants.DISTRIBUTION_AXIS
+        alignment_axis = constants.ALIGNMENT_AXIS
+        pixbuf_count = len(pixbuf_list)
+        size_list = [list(image_tools.get_image_size(pixbuf)) for pixbuf in pixbuf_list]
+
+        if self.is_manga_mode:
+            orientation = constants.MANGA_ORIENTATION
+        else:
+            orientation = constants.WESTERN_ORIENTATION
+
+        # Rotation handling:
+        # - apply Exif rotation on individual images
+        # - apply automatic rotation (size based) on whole page
+        # - apply manual rotation on whole page
+        if prefs['auto rotate from exif']:
+            rotation_list = [image_tools.get_implied_rotation(pixbuf) for pixbuf in pixbuf_list]
+        else:
+            rotation_list = [0] * pixbuf_count
+        virtual_size = [0, 0]
+        for i in range(pixbuf_count):
+            if rotation_list[i] in (90, 270):
+                size_list[i].reverse()
+            size = size_list[i]
+            virtual_size[distribution_axis] += size[distribution_axis]
+            virtual_size[alignment_axis] = max(virtual_size[alignment_axis], size[alignment_axis])
+        rotation = self._get_size_rotation(*virtual_size)
+        rotation = (rotation + prefs['rotation']) % 360
+        if rotation in (90, 270):
+            distribution_axis, alignment_axis = alignment_axis, distribution_axis
+            orientation = list(orientation)
+            orientation.reverse()
+            for i in range(pixbuf_count):
+                size_list[i].reverse()
+        if rotation in (180, 270):
+            orientation = tools.vector_opposite(orientation)
+        for i in range(pixbuf_count):
+            rotation_list[i] = (rotation_list[i] + rotation) % 360
+        if prefs['vertical flip'] and rotation in (90, 270):
+            orientation = tools.vector_opposite(orientation)
+        if prefs['horizontal flip'] and rotation in (0, 180):
+            orientation = tools.vector_opposite(orientation)
+
+        return size_list, rotation_list, orientation, distribution_axis, alignment_axis
+
+    def get_display_scale(self, size, orientation, viewport_size):
+        """ Returns the largest scale a page of <size> (width, height), with
+        the Exif <orientation>, is displayed at on its own in <viewport_size>
+        with the current zoom and rotation preferences. Both orientations are
+        considered if pages are rotated depending on their size.
+
+        Can be used outside of the main thread. """
+        width, height = size
+        rotation = prefs['rotation']
+        if prefs['auto rotate from exif']:
+            rotation += image_tools.get_orientation_rotation(orientation)
+        if rotation % 180:
+            width, height = height, width
+        size_list = [(width, height)]
+        if prefs['auto rotate depending on size'] != constants.AUTOROTATE_NEVER:
+            size_list.append((height, width))
+        scale = 0
+        for size in size_list:
+            scaled_size = self.get_scaled_sizes([size], viewport_size,
+                                                constants.DISTRIBUTION_AXIS, [False])[0]
+            scale = max(scale, scaled_size[0] / size[0], scaled_size[1] / size[1])
+        return scale
+
+    def get_scaled_sizes(self, size_list, viewport_size, distribution_axis, do_not_transform):
+        """ Returns the sizes the pages of a spread (with unscaled sizes
+        <size_list>) are scaled to when displayed in <viewport_size>. """
+        zoom_dummy_size = list(viewport_size)
+        dasize = zoom_dummy_size[distribution_axis] - self._spacing * (len(size_list) - 1)
+        if dasize <= 0:
+            dasize = 1
+        zoom_dummy_size[distribution_axis] = dasize
+        return self.zoom.get_zoomed_size(size_list, zoom_dummy_size,
+                                         distribution_axis, do_not_transform)
+
     def _update_page_information(self):
         """ Updates the window with information that can be gathered
         even when the page pixbuf(s) aren't ready yet. """
@@ -616,12 +723,37 @@ class MainWindow(Gtk.Window):
         if current_page <= page < (current_page + nb_pages):
             self.draw_image(scroll_to=self._last_scroll_destination)
             self._update_page_information()
+        elif page > current_page:
+            self.prerenderer.schedule()
 
         # Use first page as application icon when opening archives.
         if page == 1 and self.filehandler.archive_type is not None and prefs['archive thumbnail as icon']:
             pixbuf = self.imagehandler.get_thumbnail(page, 48, 48)
             self.set_icon(pixbuf)
 
+    def _page_decoded(self, page):
+        """ Called when a page the main window waits for has been decoded. """
+        current_page = self.imagehandler.get_current_page()
+        nb_pages = 2 if self.displayed_double() else 1
+        if current_page <= page < (current_page + nb_pages):
+            scroll_to = self._last_scroll_destination
+            position = self._preview_scroll_position
+            if position is not None and position != self._get_scroll_position():
+                # Scrolled by the user while the preview was displayed.
+                scroll_to = None
+            self.draw_image(scroll_to=scroll_to)
+
+    def _preview_ready(self, page, previews):
+        """ Called with the previews of the pages starting with <page> when
+        they are not decoded yet, see ImageHandler.request_previews(). """
+        nb_pages = 2 if self.displayed_double() else 1
+        if page != self.imagehandler.get_current_page() or len(previews) != nb_pages:
+            return
+        if self._waiting_for_redraw:
+            # The pending redraw asks for them again if still needed.
+            return
+        self._draw_image(self._last_scroll_destination, previews=previews)
+
     def _on_file_opened(self):
         self.uimanager.set_sensitivities()
         number, count = self.filehandler.get_file_number()
@@ -631,6 +763,7 @@ class MainWindow(Gtk.Window):
 
     def _on_file_closed(self):
         self.clear()
+        self.prerenderer.cleanup()
         self.thumbnailsidebar.hide()
         self.thumbnailsidebar.clear()
         self.uimanager.set_sensitivities()
@@ -922,6 +1055,9 @@ class MainWindow(Gtk.Window):
 
         return old_vadjust != new_vadjust or old_hadjust != new_hadjust
 
+    def _get_scroll_position(self):
+        return self._hadjust.get_value(), self._vadjust.get_value()
+
     def scroll_to_predefined(self, destination, index=None):
         self.layout.scroll_to_predefined(destination, index)
         self.update_viewport_position()
@@ -953,14 +1089,16 @@ class MainWindow(Gtk.Window):
         self._main_layout.set_size(*self.layout.get_union_box().get_size())
         self.set_bg_color(prefs['bg colour'])
 
-    def displayed_double(self):
-        """Return True if two pages should be displayed."""
-        cur_page = self.imagehandler.get_current_page()
-        return cur_page and \
+    def displayed_double(self, page: int = None):
+        """Return True if two pages should be displayed, starting with
+        <page> (the current page by default)."""
+        if page is None:
+            page = self.imagehandler.get_current_page()
+        return page and \
                prefs['default double page'] and \
-               not self.imagehandler.get_virtual_double_page() and \
-               self.can_display_as_double_page(cur_page) and \
-               cur_page != self.imagehandler.get_number_of_pages()
+               not self.imagehandler.get_virtual_double_page(page) and \
+               self.can_display_as_double_page(page) and \
+               page != self.imagehandler.get_number_of_pages()
 
     def can_display_as_double_page(self, page_num: int):
         self.load_metadata()
@@ -1067,8 +1205,10 @@ class MainWindow(Gtk.Window):
         save_dialog.set_current_name(suggested_name)
 
         if save_dialog.run() == Gtk.ResponseType.ACCEPT and save_dialog.get_filename():
-            shutil.copy(self.imagehandler.get_path_to_page(),
-                        save_dialog.get_filename())
+            destination = save_dialog.get_filename()
+            # The page may only be read to memory, write it to disk first.
+            self.imagehandler.request_page_file(
+                    lambda page, path: shutil.copy(path, destination))
 
         save_dialog.destroy()
 
@@ -1144,6 +1284,8 @@ class MainWindow(Gtk.Window):
 
         self.hide()
 
+        self._watchdog.stop()
+
         if Gtk.main_level() > 0:
             Gtk.main_quit()
 
@@ -0,0 +1,98 @@
+"""memory.py - Garbage collection driven by released memory."""
+
+import gc
+import time
+from threading import Lock
+
+from gi.repository import GLib
+
+from mcomix import log
+
+#: Collect right away once that many bytes of image data have been released
+COLLECT_THRESHOLD = 256 * 1024 * 1024
+#: Otherwise, collect once nothing has been released for that many seconds
+IDLE_DELAY = 2
+
+
+class _MemoryManager(object):
+
+    def __init__(self):
+        self._lock = Lock()
+        #: Bytes released since the last collection
+        self._released = 0
+        #: Time of the last release
+        self._last_release = 0.0
+        #: True if an idle collection is scheduled
+        self._idle_scheduled = False
+        #: Number of collections run, and total time spent in them
+        self.collections = 0
+        self.collect_time = 0.0
+
+    def release(self, size):
+        if size <= 0:
+            return
+        with self._lock:
+            self._released += size
+            self._last_release = time.monotonic()
+            if self._released < COLLECT_THRESHOLD:
+                self._schedule()
+                return
+        self.collect()
+
+    def collect_when_idle(self):
+        with self._lock:
+            self._last_release = time.monotonic()
+            self._schedule()
+
+    def collect(self):
+        with self._lock:
+            released = self._released
+            self._released = 0
+        start = time.perf_counter()
+        found = gc.collect(0)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.collections += 1
+            self.collect_time += elapsed
+        log.debug('Garbage collection #%u: %u KiB released, %u object(s) collected in %.1fms',
+                  self.collections, released // 1024, found, elapsed * 1000)
+
+    def _schedule(self):
+        # this function should be always called in lock
+        if not self._idle_scheduled:
+            self._idle_scheduled = True
+            GLib.timeout_add_seconds(IDLE_DELAY, self._idle_collect,
+                                     priority=GLib.PRIORITY_LOW)
+
+    def _idle_collect(self):
+        with self._lock:
+            if time.monotonic() - self._last_release < IDLE_DELAY:
+                # Still busy, try again later.
+                return True
+            self._idle_scheduled = False
+        self.collect()
+        return False
+
+
+_manager = _MemoryManager()
+
+
+def release(size):
+    """ Records that <size> bytes of image data (e.g. pixbufs dropped from a
+    cache) have been released. Runs a collection right away if too much
+    memory was released since the last one, otherwise when idle. """
+    _manager.release(size)
+
+
+def collect_when_idle():
+    """ Runs a collection once nothing has been released for a while, e.g.
+    after closing a file. """
+    _manager.collect_when_idle()
+
+
+def get_statistics():
+    """ Returns the number of collections run, and the total time spent in
+    them (in seconds). """
+    return _manager.collections, _manager.collect_time
+
+# vim: expandtab:sw=4:ts=4
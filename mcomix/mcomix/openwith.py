@@ -69,6 +69,14 @@ class OpenWithCommand(object):
             window.osd.show(f'"{self.get_label()}" is disabled for archives.')
             return
 
+        if self._get_context_type(window) & ARCHIVE_CONTEXT:
+            # The page may only be read to memory, write it to disk first.
+            window.imagehandler.request_page_file(
+                    lambda page, path: self._execute(window))
+        else:
+            self._execute(window)
+
+    def _execute(self, window):
         current_dir = os.getcwd()
         try:
             if self.is_valid_workdir(window):
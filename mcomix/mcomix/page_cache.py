@@ -0,0 +1,119 @@
+"""page_cache.py - Memory-bounded cache of decoded pages."""
+
+from threading import Lock
+
+from mcomix import image_tools
+from mcomix import log
+from mcomix import memory
+from mcomix.preferences import prefs
+
+#: Pages behind the reader are evicted as if they were that many times
+#: farther away than pages ahead.
+_BEHIND_PENALTY = 2
+
+
+class PageCache(object):
+    """Cache of full resolution decoded pages, as returned by
+    image_tools.load_page(), keyed by page index (starting from 0), holding
+    at most 'page cache size' MiB (-1 for no limit) of decoded pixel data.
+
+    When over budget, the pages farthest from the current position are
+    evicted first, pages behind the reading direction before those ahead.
+    The page(s) currently displayed are never evicted.
+    """
+
+    def __init__(self):
+        #: Page index > (pixbuf, size in bytes)
+        self._cache = {}
+        #: Ensure thread safety
+        self._lock = Lock()
+        #: Index of the current page
+        self._position = 0
+        #: +1 when reading forward, -1 when reading backward
+        self._direction = 1
+        #: Current size of cached pixel data, in bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, index):
+        with self._lock:
+            return index in self._cache
+
+    def get(self, index: int, stats=True):
+        """Return the pixbuf of page <index>, or None if not cached. If
+        <stats> is False, the lookup is not counted as a hit or miss."""
+        with self._lock:
+            entry = self._cache.get(index, None)
+            if stats:
+                if entry is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+            return None if entry is None else entry[0]
+
+    def add(self, index: int, pixbuf):
+        """Store the <pixbuf> of page <index>, and evict pages if the cache
+        grows over its budget. <pixbuf> itself may be evicted right away if
+        it is the least useful page."""
+        size = image_tools.get_memory_size(pixbuf)
+        with self._lock:
+            old = self._cache.pop(index, None)
+            if old is not None:
+                self.size -= old[1]
+            self._cache[index] = (pixbuf, size)
+            self.size += size
+            released = self._trim()
+        memory.release(released)
+
+    def set_position(self, index: int, direction: int = 1):
+        """Set the current page to <index>, and the reading <direction> to
+        +1 (forward) or -1 (backward)."""
+        with self._lock:
+            self._position = index
+            self._direction = direction
+            released = self._trim()
+        memory.release(released)
+
+    def trim(self):
+        """Evict pages until the cache fits in its budget again."""
+        with self._lock:
+            released = self._trim()
+        memory.release(released)
+
+    def clear(self):
+        """Remove all pages."""
+        with self._lock:
+            if self._cache:
+                log.debug('Page cache: %u hit(s), %u miss(es)',
+                          self.hits, self.misses)
+            self._cache.clear()
+            released = self.size
+            self.size = 0
+        memory.release(released)
+
+    def _get_distance(self, index):
+        offset = (index - self._position) * self._direction
+        if offset < 0:
+            return -offset * _BEHIND_PENALTY
+        return offset
+
+    def _trim(self):
+        # this function should be always called in lock
+        # returns the number of bytes released
+        budget = prefs['page cache size']
+        if budget < 0:
+            return 0
+        budget *= 1024 * 1024
+        if self.size <= budget:
+            return 0
+        size = self.size
+        # Current page, and the next one in double page mode.
+        pinned = (self._position, self._position + 1)
+        candidates = sorted((index for index in self._cache if index not in pinned),
+                            key=self._get_distance)
+        while self.size > budget and candidates:
+            index = candidates.pop()
+            self.size -= self._cache.pop(index)[1]
+            log.debug('Page cache: evicted page %u', index + 1)
+        return size - self.size
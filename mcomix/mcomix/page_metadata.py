@@ -0,0 +1,203 @@
+"""page_metadata.py - Header-only metadata index for the pages of a book."""
+
+import json
+import os
+from collections import namedtuple
+from hashlib import md5
+
+from mcomix import constants
+from mcomix import image_tools
+from mcomix import log
+from mcomix import tools
+from mcomix.lib import mt
+
+#: Metadata of one page, as found in the image header.
+#: <orientation> is the Exif orientation tag as a string, or None.
+PageInfo = namedtuple('PageInfo', 'format width height orientation')
+
+#: Bump when the on-disk layout changes.
+_STORE_VERSION = 1
+#: Bytes read first from the start of pages kept in memory to parse their
+#: header, see PageMetadataIndex.parse()
+_HEADER_SIZE = 64 * 1024
+#: Number of books whose page metadata is kept on disk, the least recently
+#: opened ones are dropped first
+_STORE_MAX_BOOKS = 1000
+
+
+class PageMetadataIndex(object):
+    """Index of the format, size and Exif orientation of every page of the
+    currently opened book, queryable by page index (starting from 0).
+
+    Entries are filled in the background by parsing only the header bytes of
+    each page once it becomes available. For archives, the index is
+    persisted per book in constants.PAGE_METADATA_PATH, keyed by the archive
+    path, modification time and size, so that reopening a known book can
+    answer queries before a single page has been extracted. Only the last
+    _STORE_MAX_BOOKS books opened are kept. Directories are not persisted:
+    their pages are files read directly, whose headers are cheap to parse
+    again.
+    """
+
+    def __init__(self):
+        #: Background header parser
+        self._thread = mt.ThreadPool(name=self.__class__.__name__, processes=1)
+        self._lock = mt.Lock()
+        #: Incremented on each open/close, stale results are dropped
+        self._generation = 0
+        #: Page index > PageInfo
+        self._infos = {}
+        #: Page index > name used as key in the persistent store
+        self._names = []
+        #: (path, mtime, size) of the book, None if not persisted
+        self._book_key = None
+        #: True if new entries need to be written to disk
+        self._dirty = False
+
+    def open_book(self, book_path=None, names=None):
+        """Reset the index for a new book. <names> are the names of the pages
+        (in page order) inside the book at <book_path>, used as persistent
+        keys. If <book_path> is None, nothing is persisted.
+        """
+        self.close()
+        with self._lock:
+            self._names = list(names or ())
+            if book_path is None:
+                return
+            try:
+                stat = os.stat(book_path)
+            except OSError:
+                return
+            self._book_key = (os.path.abspath(book_path), stat.st_mtime, stat.st_size)
+            stored = self._read_store()
+            for index, name in enumerate(self._names):
+                info = stored.get(name)
+                if info is not None:
+                    self._infos[index] = PageInfo(*info)
+        log.debug('Page metadata: %u of %u pages known for "%s"',
+                  len(self._infos), len(self._names), book_path)
+
+    def close(self):
+        """Write pending entries to disk and clear the index."""
+        with self._lock:
+            self._generation += 1
+            if self._dirty:
+                self._write_store()
+            self._infos.clear()
+            self._names.clear()
+            self._book_key = None
+            self._dirty = False
+
+    def cleanup(self):
+        """Stop pending background work and clear the index."""
+        self._thread.renew()
+        self.close()
+
+    def get(self, index: int):
+        """Return the PageInfo of page <index>, or None if not known yet."""
+        with self._lock:
+            return self._infos.get(index, None)
+
+    def parse(self, index: int, source):
+        """Parse the header of <source> for page <index> now (if not already
+        known), and return its PageInfo or None. <source> is the path of the
+        page file, or a function returning the path or the bytes of the page
+        file (e.g. for pages kept in memory instead of being extracted),
+        called with a size: only the first bytes of the file (at least that
+        many) are needed. It is called again with None for the whole file if
+        the header could not be parsed from them.
+        """
+        with self._lock:
+            info = self._infos.get(index, None)
+            generation = self._generation
+        if info is not None:
+            return info
+        return self._parse(generation, index, source)
+
+    def add(self, index: int, source):
+        """Schedule parsing the header of <source> (page <index>, see
+        parse()) in the background, unless the page is already known.
+        """
+        with self._lock:
+            if index in self._infos:
+                return
+            generation = self._generation
+        self._thread.apply_async(self._parse, (generation, index, source))
+
+    def _parse(self, generation, index, source):
+        if callable(source):
+            size = _HEADER_SIZE
+            while True:
+                try:
+                    data = source(size)
+                except Exception as e:
+                    log.debug('Could not read page %u: %s', index + 1, e)
+                    return None
+                header = image_tools.get_image_header(data)
+                if header is not None or size is None or \
+                   not isinstance(data, bytes) or len(data) < size:
+                    break
+                # The header may go beyond the bytes read.
+                size = None
+        else:
+            header = image_tools.get_image_header(source)
+        if header is None:
+            return None
+        info = PageInfo(*header)
+        with self._lock:
+            if generation != self._generation:
+                return info
+            if index not in self._infos:
+                self._infos[index] = info
+                self._dirty = self._book_key is not None
+        return info
+
+    def _get_store_path(self):
+        path = self._book_key[0]
+        return os.path.join(constants.PAGE_METADATA_PATH,
+                            md5(path.encode('utf8', 'surrogateescape')).hexdigest() + '.json')
+
+    def _read_store(self):
+        # this function should be always called in lock
+        store_path = self._get_store_path()
+        if not os.path.isfile(store_path):
+            return {}
+        try:
+            with open(store_path, mode='rt', encoding='utf8') as fd:
+                store = json.load(fd)
+        except Exception as ex:
+            log.warning(f'! Could not read page metadata "{store_path}": {ex}')
+            return {}
+        if store.get('version') != _STORE_VERSION or \
+                [store.get('path'), store.get('mtime'), store.get('size')] != list(self._book_key):
+            # Book has changed since.
+            return {}
+        try:
+            # Mark as recently used, see _write_store.
+            os.utime(store_path)
+        except OSError:
+            pass
+        return store.get('pages', {})
+
+    def _write_store(self):
+        # this function should be always called in lock
+        path, mtime, size = self._book_key
+        pages = {}
+        for index, info in self._infos.items():
+            if index < len(self._names):
+                pages[self._names[index]] = list(info)
+        store = {
+                'version': _STORE_VERSION,
+                'path': path,
+                'mtime': mtime,
+                'size': size,
+                'pages': pages,
+        }
+        store_path = self._get_store_path()
+        try:
+            os.makedirs(constants.PAGE_METADATA_PATH, 0o700, exist_ok=True)
+            with open(store_path, mode='wt', encoding='utf8') as fd:
+                json.dump(store, fd, ensure_ascii=False)
+        except Exception as ex:
+            log.warning(f'! Could not write page metadata "{store_path}": {ex}')
+        tools.prune_directory(constants.PAGE_METADATA_PATH, _STORE_MAX_BOOKS)
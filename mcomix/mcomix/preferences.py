@@ -83,6 +83,12 @@ prefs = {
         'sharpness': 1.0,
         'auto contrast': False,
         'max pages to cache': 7,
+        'page cache size': 1024,  # in MiB, -1 for no limit
+        'decode at display size': True,
+        'progressive display': True,
+        'encoded cache size': 512,  # in MiB, -1 for no limit, 0 to disable
+        'render cache size': 256,  # in MiB, 0 to disable
+        'pre-render pages': 2,  # spreads after the current one, 0 to disable
         'window x': 0,
         'window y': 0,
         'window height': 600,
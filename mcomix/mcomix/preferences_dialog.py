@@ -378,11 +378,51 @@ class _PreferencesDialog(Gtk.Dialog):
         page.add_row(Gtk.Label(label='Temporary directory (restart required)'),
                      self._create_pref_path_chooser('temporary directory', folder=True, default=None))
 
-        page.add_row(Gtk.Label(label='Maximum number of pages to store in the cache:'),
+        page.add_row(Gtk.Label(label='Number of pages to load in advance:'),
                      self._create_pref_spinner('max pages to cache',
                                                1, -1, 500, 1, 3, 0,
-                                               'Set the max number of pages to cache. A value of -1 will'
-                                               + ' cache the entire archive.'))
+                                               'Set the number of pages around the current one to load'
+                                               + ' in advance. A value of -1 will load the entire archive.'))
+
+        page.add_row(Gtk.Label(label='Memory for loaded pages (in MiB):'),
+                     self._create_pref_spinner('page cache size',
+                                               1, -1, 65536, 64, 256, 0,
+                                               'Set the memory used to keep loaded pages. Pages farthest'
+                                               + ' from the current one, behind first, are dropped when'
+                                               + ' it is full. A value of -1 removes the limit.'))
+
+        page.add_row(self._create_pref_check_button(
+                'Show a preview of pages still loading',
+                'progressive display',
+                'Show a low resolution preview of the page (its thumbnail, or a quick decoding) while'
+                + ' it is loading, instead of an empty window.'))
+
+        page.add_row(self._create_pref_check_button(
+                'Load pages at display resolution',
+                'decode at display size',
+                'Load pages only at the resolution needed to fit them in the window, which uses'
+                + ' less memory and time for high resolution scans. Pages are loaded again at a'
+                + ' higher resolution when zooming in.'))
+
+        page.add_row(Gtk.Label(label='Memory for compressed pages (in MiB):'),
+                     self._create_pref_spinner('encoded cache size',
+                                               1, -1, 65536, 64, 256, 0,
+                                               'Set the memory used to keep pages as read from the archive,'
+                                               + ' so that they are loaded again without extracting them.'
+                                               + ' A value of -1 removes the limit, 0 disables it.'))
+
+        page.add_row(Gtk.Label(label='Memory for scaled pages (in MiB):'),
+                     self._create_pref_spinner('render cache size',
+                                               1, 0, 4096, 16, 64, 0,
+                                               'Set the memory used to keep pages scaled for display,'
+                                               + ' so that flipping back to them is instant. 0 disables it.'))
+
+        page.add_row(Gtk.Label(label='Number of pages to prepare ahead:'),
+                     self._create_pref_spinner('pre-render pages',
+                                               1, 0, 10, 1, 2, 0,
+                                               'Set how many of the following pages (or double pages) are scaled'
+                                               + ' in the background, so that turning the page is instant.'
+                                               + ' 0 disables it.'))
 
         if sys.platform == 'linux':
             page.add_row(self._create_pref_check_button(
@@ -939,6 +979,22 @@ class _PreferencesDialog(Gtk.Dialog):
             prefs[preference] = int(value)
             self._window.imagehandler.do_cacheing()
 
+        elif preference == 'page cache size':
+            prefs[preference] = int(value)
+            self._window.imagehandler.page_cache.trim()
+
+        elif preference == 'encoded cache size':
+            prefs[preference] = int(value)
+            self._window.imagehandler.encoded_cache.trim()
+
+        elif preference == 'render cache size':
+            prefs[preference] = int(value)
+            self._window.imagehandler.render_cache.clear()
+
+        elif preference == 'pre-render pages':
+            prefs[preference] = int(value)
+            self._window.prerenderer.schedule()
+
         elif preference == 'number of key presses before page turn':
             prefs[preference] = int(value)
             self._window._event_handler._extra_scroll_events = 0
@@ -0,0 +1,153 @@
+"""prerender.py - Background rendering of the pages following the current one."""
+
+from mcomix import image_tools
+from mcomix import log
+from mcomix import render_cache
+from mcomix.lib import mt
+from mcomix.preferences import prefs
+
+
+class PreRenderer(object):
+    """Renders the page spreads following the current one in the background,
+    at the size, rotation and enhancement they will be displayed with, and
+    stores the result in the render cache of the image handler. Turning the
+    page then only needs to swap in ready pixbufs.
+
+    The number of spreads rendered ahead is set by the 'pre-render pages'
+    preference, 0 disables pre-rendering. Whenever the geometry of the view
+    (viewport size, zoom, rotation, ...) or a rendering preference changes,
+    the render cache is cleared and pending work is dropped.
+    """
+
+    def __init__(self, window):
+        #: Reference to main window
+        self._window = window
+        #: Rendering thread
+        self._thread = mt.ThreadPool(name=self.__class__.__name__, processes=1)
+        self._lock = mt.Lock()
+        #: Incremented when the view changes, stale results are dropped
+        self._generation = 0
+        #: Values the rendered pixbufs depend on, see _get_state
+        self._state = None
+        #: Size of the visible area the current page was drawn in
+        self._viewport_size = None
+        #: Spreads (first page, number of pages) already scheduled, as long
+        #: as they are in the look-ahead range
+        self._scheduled = set()
+
+    def update(self, area_size, viewport_size):
+        """Called before drawing the current page(s) in <viewport_size>
+        (<area_size> without scrollbars). Invalidate the render cache if the
+        view has changed since the last draw."""
+        # Scrollbars come and go depending on the page, so do not let them
+        # invalidate anything.
+        state = self._get_state(area_size)
+        with self._lock:
+            self._viewport_size = viewport_size
+            if state == self._state:
+                return
+            self._generation += 1
+            self._state = state
+            self._scheduled.clear()
+            # Keep the render cache lock nested inside ours, so that no
+            # stale result can be added after this point.
+            self._window.imagehandler.render_cache.clear()
+        log.debug('Pre-render: view changed, render cache cleared')
+
+    def schedule(self):
+        """Schedule rendering the spreads following the current page(s), as
+        long as their pages are available."""
+        count = prefs['pre-render pages']
+        imagehandler = self._window.imagehandler
+        if count <= 0 or self._viewport_size is None or \
+                not self._window.filehandler.file_loaded:
+            return
+        with self._lock:
+            generation = self._generation
+            viewport_size = self._viewport_size
+        number_of_pages = imagehandler.get_number_of_pages()
+        page = imagehandler.get_current_page()
+        ahead = set()
+        for n in range(count):
+            page += self._get_step(page)
+            if page > number_of_pages:
+                break
+            pages = 2 if self._window.displayed_double(page) else 1
+            spread = (page, pages)
+            ahead.add(spread)
+            if spread in self._scheduled:
+                continue
+            if not all(imagehandler.page_is_available(page + i) for i in range(pages)):
+                # Scheduled again once available, see MainWindow._page_available.
+                continue
+            self._scheduled.add(spread)
+            self._thread.apply_async(self._render, (generation, viewport_size, page, pages),
+                                     error_callback=self._render_error)
+        # Spreads out of range may be evicted from the render cache, render
+        # them again when they are back in range.
+        self._scheduled &= ahead
+
+    def cleanup(self):
+        """Stop pending work and forget the view state."""
+        self._thread.renew()
+        with self._lock:
+            self._generation += 1
+            self._state = None
+            self._viewport_size = None
+            self._scheduled.clear()
+
+    def _get_step(self, page):
+        # Same as MainWindow.flip_page for a step of one spread forward.
+        if prefs['default double page'] and \
+                prefs['double step in double page mode'] and \
+                self._window.displayed_double(page):
+            return 2
+        return 1
+
+    def _get_state(self, area_size):
+        window = self._window
+        enhancer = window.enhancer
+        return (tuple(area_size), window.zoom.get_state(), window.is_manga_mode,
+                prefs['default double page'], prefs['double step in double page mode'],
+                prefs['virtual double page for fitting images'],
+                prefs['auto rotate from exif'], prefs['auto rotate depending on size'],
+                prefs['rotation'], prefs['vertical flip'], prefs['horizontal flip'],
+                prefs['scaling quality'], prefs['pil scaling filter'],
+                prefs['checkered bg for transparent images'],
+                enhancer.brightness, enhancer.contrast, enhancer.saturation,
+                enhancer.sharpness, enhancer.autocontrast)
+
+    def _is_current(self, generation):
+        with self._lock:
+            return generation == self._generation
+
+    def _render(self, generation, viewport_size, page, pages):
+        window = self._window
+        imagehandler = window.imagehandler
+        cache = imagehandler.render_cache
+        if not self._is_current(generation):
+            return
+        pixbuf_list = imagehandler.get_page_images(pages, page)
+        do_not_transform = [image_tools.disable_transform(x) for x in pixbuf_list]
+        size_list, rotation_list, orientation, distribution_axis, alignment_axis = \
+            window.get_page_transform(pixbuf_list)
+        scaled_sizes = window.get_scaled_sizes(size_list, viewport_size,
+                                               distribution_axis, do_not_transform)
+        for i in range(pages):
+            key = render_cache.make_key(page - 1 + i, scaled_sizes[i],
+                                        rotation_list[i], window.enhancer)
+            if key in cache:
+                continue
+            image = imagehandler.get_page_image(page + i, scaled_sizes[i], rotation_list[i])
+            rendered = render_cache.render_pixbuf(image, scaled_sizes[i],
+                                                  rotation_list[i], window.enhancer)
+            with self._lock:
+                if generation != self._generation:
+                    return
+                cache.add(key, rendered)
+        if prefs['smart bg'] or (prefs['show thumbnails'] and prefs['smart thumb bg']):
+            imagehandler.get_pixbuf_auto_background(pages, page)
+        log.debug('Pre-rendered page(s) %u-%u', page, page + pages - 1)
+
+    def _render_error(self, name, etype, value, tb):
+        log.error('Pre-rendering failed: %s', value)
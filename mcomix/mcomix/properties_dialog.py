@@ -102,10 +102,12 @@ class _PropertiesDialog(Gtk.Dialog):
         path = window.imagehandler.get_path_to_page()
         filename = os.path.basename(path)
         page.set_filename(filename)
-        width, height = window.imagehandler.get_size()
+        # Never wait for the page, the page is updated once it is available,
+        # see _on_page_available.
+        width, height = window.imagehandler.get_size(nowait=True)
         main_info = (
                 '%dx%d px' % (width, height),
-                window.imagehandler.get_mime_name(),
+                window.imagehandler.get_mime_name(nowait=True),
         )
         page.set_main_info(main_info)
         self._update_page_secondary_info(page, path)
@@ -114,7 +116,8 @@ class _PropertiesDialog(Gtk.Dialog):
     def _update_page_image(self, page, page_number=None):
         if not self._window.imagehandler.page_is_available(page_number):
             return
-        thumb = self._window.imagehandler.get_thumbnail(page_number, width=128, height=128)
+        thumb = self._window.imagehandler.get_thumbnail(page_number, width=128, height=128,
+                                                        nowait=True)
         page.set_thumbnail(thumb)
 
     @staticmethod
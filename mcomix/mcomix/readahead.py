@@ -0,0 +1,135 @@
+"""readahead.py - Adaptive planning of the pages to extract and decode in advance."""
+
+import math
+import time
+from collections import deque
+from threading import Lock
+from typing import List
+
+#: Number of recent page turns used to measure the reading speed
+_HISTORY_SIZE = 8
+#: Page turns older than this (in seconds) do not count for the reading speed
+_HISTORY_TIMEOUT = 10.0
+#: Minimal period (in seconds) the reading speed is measured over
+_MIN_ELAPSED = 1.0
+#: Weight of a new sample in the latency moving averages
+_LATENCY_WEIGHT = 0.25
+#: At the current reading speed, the read-ahead window should last at least
+#: the time needed to prepare that many pages (and at least one second)
+_LATENCY_HORIZON = 4
+#: The read-ahead window grows to at most that many times its base size
+_MAX_GROWTH = 4
+
+
+class ReadAheadPlanner(object):
+    """Decides which pages to extract and decode in advance, and in which
+    order, from the reading direction, the reading speed and the measured
+    time needed to prepare a page.
+
+    Page indexes start from 0 and follow the order of the book, which is
+    also the reading order in manga mode (only the display is mirrored).
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        #: (time, page index) of the recent page turns
+        self._history = deque(maxlen=_HISTORY_SIZE)
+        #: +1 when reading forward, -1 when reading backward
+        self.direction = 1
+        #: Moving averages of the extraction and decoding time of one page,
+        #: in seconds, None if not measured yet
+        self._extract_time = None
+        self._decode_time = None
+
+    def reset(self):
+        """Forget everything, e.g. when a new book is opened."""
+        with self._lock:
+            self._history.clear()
+            self.direction = 1
+
+    def flip(self, index: int, step: int = 1):
+        """Record that the current page is now <index>, <step> being the
+        number of pages of a regular page turn. Return True if this is a
+        jump (e.g. go to page) rather than a page turn."""
+        now = time.monotonic()
+        with self._lock:
+            jump = False
+            if self._history:
+                delta = index - self._history[-1][1]
+                if delta == 0:
+                    return False
+                if abs(delta) > 2 * max(step, 1):
+                    # Reading speed and direction are unknown after a jump.
+                    jump = True
+                    self._history.clear()
+                    self.direction = 1
+                else:
+                    self.direction = 1 if delta > 0 else -1
+            self._history.append((now, index))
+            return jump
+
+    def add_extract_time(self, seconds: float):
+        """Record the time spent to extract one page."""
+        with self._lock:
+            self._extract_time = self._average(self._extract_time, seconds)
+
+    def add_decode_time(self, seconds: float):
+        """Record the time spent to decode one page."""
+        with self._lock:
+            self._decode_time = self._average(self._decode_time, seconds)
+
+    def get_latency(self) -> float:
+        """Return the estimated time in seconds to prepare one page."""
+        with self._lock:
+            return (self._extract_time or 0.0) + (self._decode_time or 0.0)
+
+    def get_speed(self) -> float:
+        """Return the current reading speed, in pages per second."""
+        now = time.monotonic()
+        with self._lock:
+            history = [(t, index) for t, index in self._history
+                       if now - t <= _HISTORY_TIMEOUT]
+        if len(history) < 2:
+            return 0.0
+        pages = sum(abs(b[1] - a[1]) for a, b in zip(history, history[1:]))
+        # Count the time since the last page turn, so that the speed
+        # drops when the reader stops, and do not let a couple of quick
+        # page turns look like a sustained speed.
+        elapsed = max(now - history[0][0], _MIN_ELAPSED)
+        return pages / elapsed
+
+    def plan(self, index: int, number_of_pages: int, displayed: int,
+             step: int, base: int) -> List[int]:
+        """Return the indexes of the pages to prepare, most urgent first.
+        <index> is the current page, <displayed> the number of pages
+        displayed from it, <step> the number of pages of a page turn and
+        <base> the minimal number of pages to prepare.
+        """
+        if number_of_pages <= 0:
+            return []
+        base = max(base, displayed)
+        # Behind the reader: at least one page turn, up to a quarter of the
+        # base window.
+        behind = min(max(step, base // 4), base - displayed)
+        ahead = base - displayed - behind
+        speed = self.get_speed()
+        if speed > 0:
+            horizon = max(self.get_latency() * _LATENCY_HORIZON, 1.0)
+            wanted = math.ceil(speed * horizon) + step
+            ahead = max(ahead, min(wanted, _MAX_GROWTH * base))
+
+        direction = self.direction
+        pages = list(range(index, index + displayed))
+        if direction > 0:
+            first_ahead, first_behind = index + displayed, index - 1
+        else:
+            first_ahead, first_behind = index - 1, index + displayed
+        pages.extend(first_ahead + n * direction for n in range(ahead))
+        pages.extend(first_behind - n * direction for n in range(behind))
+        return [n for n in pages if 0 <= n < number_of_pages]
+
+    @staticmethod
+    def _average(average, sample):
+        if average is None:
+            return sample
+        return average + _LATENCY_WEIGHT * (sample - average)
@@ -0,0 +1,108 @@
+"""render_cache.py - Cache of scaled, transformed and enhanced page pixbufs."""
+
+from collections import OrderedDict
+from threading import Lock
+
+from mcomix import image_tools
+from mcomix import log
+from mcomix import memory
+from mcomix.preferences import prefs
+
+
+def make_key(index, size, rotation, enhancer):
+    """Return the render cache key for page <index> (starting from 0) scaled
+    to <size> (width, height) with <rotation>, using the current flip,
+    scaling and background preferences and the values of <enhancer>.
+    """
+    return (index, tuple(size), rotation,
+            prefs['vertical flip'], prefs['horizontal flip'],
+            prefs['scaling quality'], prefs['pil scaling filter'],
+            prefs['checkered bg for transparent images'],
+            enhancer.brightness, enhancer.contrast, enhancer.saturation,
+            enhancer.sharpness, enhancer.autocontrast)
+
+
+def render_pixbuf(pixbuf, size, rotation, enhancer):
+    """Return <pixbuf> scaled to <size> with <rotation>, flipped according
+    to the preferences and enhanced by <enhancer>, as displayed in the main
+    view."""
+    return image_tools.transform_image(
+            pixbuf, size, rotation,
+            flip=prefs['vertical flip'],
+            flop=prefs['horizontal flip'],
+            enhancement=enhancer.get_enhancement()
+    )
+
+
+class RenderCache(object):
+    """LRU cache of pixbufs ready to be displayed in the main view, keyed
+    by make_key(). Redraws which do not change the page geometry, and
+    flipping back to recently viewed pages, are then a lookup instead of a
+    rescale.
+
+    The total size of the cached pixel data is bounded by the 'render
+    cache size' preference (in MiB), 0 disables the cache.
+    """
+
+    def __init__(self):
+        #: key > pixbuf, least recently used first
+        self._cache = OrderedDict()
+        #: Ensure thread safety
+        self._lock = Lock()
+        #: Current size of cached pixel data, in bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._cache
+
+    def get(self, key):
+        """Return the pixbuf cached for <key>, or None."""
+        with self._lock:
+            pixbuf = self._cache.get(key, None)
+            if pixbuf is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return pixbuf
+
+    def add(self, key, pixbuf):
+        """Store <pixbuf> with <key>, evicting the least recently used
+        entries if the cache grows over its budget. Animations are not
+        cached."""
+        if image_tools.is_animation(pixbuf):
+            return
+        budget = self._get_budget()
+        size = image_tools.get_memory_size(pixbuf)
+        if size > budget:
+            return
+        released = 0
+        with self._lock:
+            old = self._cache.pop(key, None)
+            if old is not None:
+                released += image_tools.get_memory_size(old)
+            self._cache[key] = pixbuf
+            self.size += size
+            while self.size - released > budget:
+                _, evicted = self._cache.popitem(last=False)
+                released += image_tools.get_memory_size(evicted)
+            self.size -= released
+        memory.release(released)
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            if self._cache:
+                log.debug('Render cache: %u hit(s), %u miss(es)',
+                          self.hits, self.misses)
+            self._cache.clear()
+            released = self.size
+            self.size = 0
+        memory.release(released)
+
+    @staticmethod
+    def _get_budget():
+        return max(0, prefs['render cache size']) * 1024 * 1024
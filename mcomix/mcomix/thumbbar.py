@@ -58,6 +58,7 @@ class ThumbnailSidebar(Gtk.ScrolledWindow):
         self._treeview.set_activate_on_single_click(True)
 
         self._treeview.connect_after('drag_begin', self._drag_begin)
+        self._treeview.connect('drag_begin', self._drag_begin_write_file)
         self._treeview.connect('drag_data_get', self._drag_data_get)
         self._treeview.connect('row-activated', self._row_activated_event)
         self._treeview.connect('button_press_event', self._mouse_press_event)
@@ -199,6 +200,20 @@ class ThumbnailSidebar(Gtk.ScrolledWindow):
 
         return pixbuf
 
+    def get_thumbnail(self, page):
+        """Return the thumbnail pixbuf of <page> (without border) if it has
+        already been generated, or None."""
+        if not self._loaded or not 0 < page <= len(self._thumbnail_liststore):
+            return None
+        row = self._thumbnail_liststore[page - 1]
+        if not row[2]:
+            return None
+        pixbuf = row[1]
+        border = self._BORDER_SIZE
+        return pixbuf.new_subpixbuf(border, border,
+                                    pixbuf.get_width() - 2 * border,
+                                    pixbuf.get_height() - 2 * border)
+
     def _set_selected_row(self, row, scroll=True):
         """Set currently selected row.
         If <scroll> is True, the tree is automatically
@@ -242,6 +257,13 @@ class ThumbnailSidebar(Gtk.ScrolledWindow):
         uri = 'file://localhost' + urllib.request.pathname2url(path)
         selection.set_uris([uri])
 
+    def _drag_begin_write_file(self, treeview, context):
+        """Make sure the dragged page exists on disk by the time it is
+        dropped, without blocking, see _drag_data_get().
+        """
+        selected = self._get_selected_row()
+        self._window.imagehandler.request_page_file(lambda page, path: None, selected + 1)
+
     @staticmethod
     def _drag_begin(treeview, context):
         """We hook up on drag_begin events so that we can set the hotspot
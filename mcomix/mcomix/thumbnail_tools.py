@@ -19,7 +19,6 @@ from mcomix import log
 from mcomix import mimetypes
 from mcomix import portability
 from mcomix import tools
-from mcomix.lib import reader
 from mcomix.preferences import prefs
 
 
@@ -228,7 +227,9 @@ class Thumbnailer(object):
             if os.path.isfile(thumbpath):
                 # Check the thumbnail's stored mTime
                 try:
-                    with reader.LockedFileIO(thumbpath) as fio:
+                    # Not mapped: thumbnails are rewritten in place, which
+                    # would crash readers of a mapping (SIGBUS).
+                    with open(thumbpath, mode='rb') as fio:
                         with Image.open(fio) as img:
                             info = img.info
                             stored_mtime = float(info['Thumb::MTime'])
@@ -3,7 +3,6 @@
 import os
 import sys
 import re
-import gc
 import bisect
 import operator
 import math
@@ -141,6 +140,44 @@ def get_thumbnails_directory():
     return os.path.join(prefix, 'thumbnails/normal')
 
 
+def get_cache_directory():
+    '''Return the path to the MComix cache directory.
+    It is get_home_directory()/.cache/mcomix if in portable mode.
+    If not in portable mode, it will be $XDG_CACHE_HOME/mcomix,
+    or get_home_directory()/.cache/mcomix if $XDG_CACHE_HOME is empty.
+    '''
+    prefix = os.path.join(get_home_directory(), '.cache')
+    if not is_portable_mode():
+        prefix = os.environ.get('XDG_CACHE_HOME', prefix)
+    return os.path.join(prefix, 'mcomix')
+
+
+def prune_directory(path, max_files):
+    '''Delete the least recently modified files of the directory <path>
+    (subdirectories excluded) so that at most <max_files> are left. Files
+    which can not be accessed are left alone.
+    '''
+    try:
+        with os.scandir(path) as it:
+            files = []
+            for entry in it:
+                try:
+                    if entry.is_file(follow_symlinks=False):
+                        files.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass
+    except OSError:
+        return
+    if len(files) <= max_files:
+        return
+    files.sort()
+    for mtime, filepath in files[:len(files) - max_files]:
+        try:
+            os.remove(filepath)
+        except OSError:
+            pass
+
+
 def number_of_digits(n):
     if 0 == n:
         return 1
@@ -157,10 +194,6 @@ def format_byte_size(n):
         e='C{}i'.format(s)
     return '{:.3f} {}'.format(n,e)
 
-def garbage_collect():
-    ''' Runs the garbage collector. '''
-    gc.collect(0)
-
 def rootdir():
     # return path contains mcomixstarter.py
     return ROOTPATH
@@ -0,0 +1,79 @@
+"""watchdog.py - Reports stalls of the GTK main loop."""
+
+import sys
+import threading
+import time
+import traceback
+
+from gi.repository import GLib
+
+from mcomix import log
+
+#: Main loop stalls longer than that many seconds are logged
+STALL_THRESHOLD = 0.25
+#: Period of the main loop heartbeat, in seconds
+HEARTBEAT_PERIOD = 0.1
+
+
+class MainLoopWatchdog(object):
+    """Logs a warning, with the stack of the main thread, whenever the main
+    loop does not run for more than STALL_THRESHOLD seconds, e.g. because
+    the main thread waits for a page to be extracted or decoded.
+
+    The main loop updates a heartbeat every HEARTBEAT_PERIOD seconds, which
+    is checked by a separate thread.
+    """
+
+    def __init__(self, threshold=STALL_THRESHOLD):
+        self.threshold = threshold
+        self._main_thread = None
+        self._source = None
+        self._stop = None
+        #: Time of the last heartbeat
+        self._last_beat = 0.0
+        #: True if the current stall has been reported
+        self._reported = False
+
+    def start(self):
+        """Start watching the main loop. Must be called from the main
+        thread."""
+        if self._source is not None:
+            return
+        self._main_thread = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop = threading.Event()
+        self._source = GLib.timeout_add(int(HEARTBEAT_PERIOD * 1000), self._beat)
+        thread = threading.Thread(target=self._watch, args=(self._stop,),
+                                  name='MainLoopWatchdog')
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        """Stop watching the main loop."""
+        if self._source is None:
+            return
+        self._stop.set()
+        GLib.source_remove(self._source)
+        self._source = None
+
+    def _beat(self):
+        now = time.monotonic()
+        if self._reported:
+            log.warning('Main loop was blocked for %.2fs', now - self._last_beat)
+            self._reported = False
+        self._last_beat = now
+        return True
+
+    def _watch(self, stop):
+        while not stop.wait(HEARTBEAT_PERIOD):
+            if self._reported:
+                continue
+            stalled = time.monotonic() - self._last_beat
+            if stalled < self.threshold:
+                continue
+            self._reported = True
+            frame = sys._current_frames().get(self._main_thread, None)
+            stack = ''.join(traceback.format_stack(frame)) if frame is not None else ''
+            log.warning('Main loop blocked for more than %.2fs in:\n%s', stalled, stack)
+
+# vim: expandtab:sw=4:ts=4
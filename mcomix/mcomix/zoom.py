@@ -47,6 +47,12 @@ class ZoomModel(object):
     def reset_user_zoom(self):
         self._set_user_zoom_log(IDENTITY_ZOOM_LOG)
 
+    def get_state(self):
+        ''' Returns a hashable value which changes whenever get_zoomed_size()
+        could return different sizes for the same arguments. '''
+        return (self._fitmode, self._scale_up, self._user_zoom_log,
+                prefs['fit to size mode'], prefs['fit to size px'])
+
     def get_zoomed_size(self, image_sizes, screen_size, distribution_axis, do_not_transform):
         scale_up = self._scale_up
         fitted_image_sizes = _fix_page_sizes(image_sizes, distribution_axis, do_not_transform)
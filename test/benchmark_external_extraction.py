@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Benchmark of page extraction with external executables.
+
+The pages of an archive are extracted with each available external
+executable backend: one process per page (ExternalExecutableArchive.extract,
+the former behaviour for non-solid archives), in batches of pages (as the
+extractor now does), and all at once, each batch by a single process whose
+output is split by the page sizes listed.
+
+Without an archive, a synthetic CBZ book is created (and extracted with
+the unzip and 7z executables, when available).
+
+Usage: benchmark_external_extraction.py [archive [batch size]]
+       benchmark_external_extraction.py -n [number of pages [batch size]]
+"""
+
+import os
+import sys
+import tempfile
+import time
+import zipfile
+
+from mcomix import archive_tools
+from mcomix import constants
+from mcomix.archive import archive_base
+
+
+def make_book(path, pages, size=256 * 1024):
+    with zipfile.ZipFile(path, mode='w') as book:
+        for n in range(pages):
+            book.writestr('page%04u.jpg' % n, os.urandom(size))
+
+
+def get_handlers(path):
+    typ = archive_tools.archive_mime_type(path)
+    if typ == constants.ZIP:
+        # Python reads those, use the executables supporting other ZIP files.
+        typ = constants.ZIP_EXTERNAL
+    for handler in archive_tools._HANDLERS.get(typ, ()):
+        if not issubclass(handler, archive_base.ExternalExecutableArchive):
+            continue
+        if handler.is_available():
+            yield handler
+
+
+def per_page(archive, pages, dst, batch_size):
+    for name in pages:
+        archive.extract(name, dst)
+
+
+def batches(archive, pages, dst, batch_size):
+    for n in range(0, len(pages), batch_size):
+        for name in archive.iter_extract(pages[n:n + batch_size], dst):
+            pass
+
+
+def all_at_once(archive, pages, dst, batch_size):
+    for name in archive.iter_extract(pages, dst):
+        pass
+
+
+def run(path, batch_size):
+    for handler in get_handlers(path):
+        archive = handler(path)
+        pages = archive.list_contents()
+        print('%s: %u page(s) with %s.%s:' % (
+            os.path.basename(path), len(pages),
+            handler.__module__, handler.__name__))
+        for name, extract in (('per page', per_page),
+                              ('batches of %u' % batch_size, batches),
+                              ('all at once', all_at_once)):
+            with tempfile.TemporaryDirectory(prefix='mcomix.benchmark.') as dst:
+                start = time.perf_counter()
+                extract(archive, pages, dst, batch_size)
+                elapsed = time.perf_counter() - start
+            print('  %-16s %7.2fs' % (name, elapsed))
+        archive.close()
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] != '-n':
+        batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+        run(sys.argv[1], batch_size)
+        return
+    pages = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    batch_size = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    with tempfile.TemporaryDirectory(prefix='mcomix.benchmark.') as tmpdir:
+        path = os.path.join(tmpdir, 'book.cbz')
+        make_book(path, pages)
+        run(path, batch_size)
+
+
+if __name__ == '__main__':
+    main()
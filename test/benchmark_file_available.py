@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Benchmark of page availability updates when opening a large archive.
+
+A synthetic ZIP archive with many (empty) image entries is extracted with
+archive_extractor.Extractor, and the time spent on the main thread to map
+the extracted files to pages is measured, both with the path > page index
+used by ImageHandler._file_available, and with the former sorted walk of
+all pages for each notified file.
+
+Usage: benchmark_file_available.py [number of entries]
+"""
+
+import os
+import sys
+import tempfile
+import time
+import zipfile
+
+from gi.repository import GLib
+
+from mcomix import archive_extractor
+from mcomix import tools
+
+
+def make_archive(path, entries):
+    with zipfile.ZipFile(path, mode='w', compression=zipfile.ZIP_STORED) as archive:
+        for n in range(entries):
+            archive.writestr('%06u.jpg' % n, b'')
+
+
+def available_by_index(page_indexes, available, filepaths):
+    for path in filepaths:
+        index = page_indexes.get(path, None)
+        if index is not None and index not in available:
+            available.add(index)
+
+
+def available_by_walk(image_files, available, filepaths):
+    # Former implementation, called once per extracted file.
+    for filepath in filepaths:
+        found = sorted([filepath])
+        for i, imgpath in enumerate(image_files):
+            if tools.bin_search(found, imgpath) >= 0:
+                available.add(i)
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    with tempfile.TemporaryDirectory(prefix='mcomix.benchmark.') as tmpdir:
+        path = os.path.join(tmpdir, 'synthetic.cbz')
+        make_archive(path, entries)
+
+        loop = GLib.MainLoop()
+        extractor = archive_extractor.Extractor()
+        state = {
+            'image_files': [],
+            'page_indexes': {},
+            'by_index': set(),
+            'by_walk': set(),
+            'batches': 0,
+            'index_time': 0.0,
+            'walk_time': 0.0,
+        }
+
+        def listed(extractor, files):
+            directory = extractor.get_directory()
+            state['image_files'] = [os.path.join(directory, name) for name in files]
+            state['page_indexes'] = {path: index for index, path in enumerate(state['image_files'])}
+            extractor.set_files(files)
+            extractor.extract()
+
+        def extracted(extractor, names):
+            directory = extractor.get_directory()
+            filepaths = [os.path.join(directory, name) for name in names]
+            state['batches'] += 1
+            start = time.perf_counter()
+            available_by_index(state['page_indexes'], state['by_index'], filepaths)
+            state['index_time'] += time.perf_counter() - start
+            start = time.perf_counter()
+            available_by_walk(state['image_files'], state['by_walk'], filepaths)
+            state['walk_time'] += time.perf_counter() - start
+            if len(state['by_index']) == entries:
+                loop.quit()
+
+        extractor.contents_listed += listed
+        extractor.files_extracted += extracted
+        start = time.perf_counter()
+        extractor.setup(path)
+        loop.run()
+        elapsed = time.perf_counter() - start
+        extractor.close()
+
+    assert state['by_index'] == state['by_walk']
+    print('%u entries extracted in %.2fs, notified in %u batch(es)'
+          % (entries, elapsed, state['batches']))
+    print('page index lookup: %.4fs' % state['index_time'])
+    print('former sorted walk: %.4fs' % state['walk_time'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Benchmark of the bytes copied between PIL and GdkPixbuf per displayed page.
+
+A synthetic scanned page is rendered for display (scaled, rotated, flipped
+and enhanced) with the former chain of pixbuf operations, each going
+through PIL on its own, and with image_tools.transform_image, which keeps
+the page in PIL form and converts it to a pixbuf once.
+
+Usage: benchmark_render_copies.py [width height]
+"""
+
+import os
+import sys
+import time
+
+from PIL import Image
+
+from mcomix import image_tools
+from mcomix.preferences import prefs
+
+ENHANCEMENT = dict(brightness=1.1, contrast=1.2, saturation=1.0,
+                   sharpness=1.0, autocontrast=False)
+
+
+def former_chain(pixbuf, size, rotation):
+    pixbuf = image_tools.fit_pixbuf_to_rectangle(pixbuf, size, rotation)
+    pixbuf = image_tools.trans_pixbuf(pixbuf, flip=False, flop=True)
+    return image_tools.enhance(pixbuf, **ENHANCEMENT)
+
+
+def new_chain(pixbuf, size, rotation):
+    return image_tools.transform_image(pixbuf, size, rotation,
+                                       flip=False, flop=True,
+                                       enhancement=ENHANCEMENT)
+
+
+def measure(name, chain, pixbuf, size, rotation, runs=5):
+    copied = image_tools.get_copied_bytes()
+    start = time.perf_counter()
+    for n in range(runs):
+        chain(pixbuf, size, rotation)
+    elapsed = time.perf_counter() - start
+    copied = (image_tools.get_copied_bytes() - copied) / runs
+    print('  %-16s %8.1f MiB copied, %7.1f ms per page'
+          % (name, copied / 1024 / 1024, elapsed * 1000 / runs))
+
+
+def main():
+    image_tools.count_copies()
+    if len(sys.argv) > 2:
+        width, height = int(sys.argv[1]), int(sys.argv[2])
+    else:
+        # A4 page scanned at 300 dpi.
+        width, height = 2480, 3508
+    im = Image.frombytes('RGB', (width, height), os.urandom(width * height * 3))
+    pixbuf = image_tools.pil_to_pixbuf(im)
+    size = (height // 3, width // 3)
+    for pil_filter, filter_name in ((-1, 'GdkPixbuf scaling'),
+                                    (int(Image.LANCZOS), 'PIL Lanczos scaling')):
+        prefs['pil scaling filter'] = pil_filter
+        print('%ux%u page, rotated and scaled to %ux%u, %s:'
+              % (width, height, size[0], size[1], filter_name))
+        measure('former chain', former_chain, pixbuf, size, 90)
+        measure('transform_image', new_chain, pixbuf, size, 90)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Benchmark of thumbnail creation from large page scans.
+
+Synthetic JPEG and PNG pages are turned into thumbnails with a full
+resolution decode, with the former Image.thumbnail call (which only lets
+the JPEG decoder scale down since Pillow 7.0.0), and with
+image_tools.load_pixbuf_size, which decodes at the lowest resolution
+covering the thumbnail.
+
+Usage: benchmark_thumbnails.py [number of pages [thumbnail size]]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+from mcomix import image_tools
+
+
+def make_page(path, fmt, width=2480, height=3508):
+    # A4 page scanned at 300 dpi, noisy enough not to compress too well.
+    im = Image.blend(Image.radial_gradient('L').resize((width, height)).convert('RGB'),
+                     Image.effect_noise((width, height), 40).convert('RGB'), 0.5)
+    im.save(path, fmt)
+
+
+def full_decode(path, size):
+    with Image.open(path) as im:
+        im.load()
+        im.thumbnail((size, size), resample=Image.BOX)
+        return image_tools.pil_to_pixbuf(im, keep_orientation=True)
+
+
+def former_thumbnail(path, size):
+    with Image.open(path) as im:
+        im.thumbnail((size, size), resample=Image.BOX)
+        return image_tools.pil_to_pixbuf(im, keep_orientation=True)
+
+
+def load_pixbuf_size(path, size):
+    return image_tools.load_pixbuf_size(path, size, size)
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 128
+    with tempfile.TemporaryDirectory(prefix='mcomix.benchmark.') as tmpdir:
+        for fmt in ('JPEG', 'PNG'):
+            path = os.path.join(tmpdir, 'page.' + fmt.lower())
+            make_page(path, fmt)
+            print('%u %s page(s), %ux%u thumbnails:' % (pages, fmt, size, size))
+            for name, create in (('full decode', full_decode),
+                                 ('former thumbnail', former_thumbnail),
+                                 ('load_pixbuf_size', load_pixbuf_size)):
+                start = time.perf_counter()
+                for n in range(pages):
+                    create(path, size)
+                elapsed = time.perf_counter() - start
+                print('  %-16s %7.2fs' % (name, elapsed))
+
+
+if __name__ == '__main__':
+    main()
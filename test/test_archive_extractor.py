@@ -0,0 +1,130 @@
+
+from . import MComixTest
+
+from mcomix.archive_extractor import _ExtractionQueue
+
+
+def _make_queue(files):
+    queue = _ExtractionQueue()
+    queue.set_files(files)
+    return queue
+
+def _pop_all(queue):
+    files = []
+    while True:
+        name = queue.pop()
+        if name is None:
+            return files
+        files.append(name)
+
+
+class ExtractionQueueTest(MComixTest):
+
+    files = ['%02u.jpg' % n for n in range(10)]
+
+    def test_file_list_order(self):
+        queue = _make_queue(self.files)
+        self.assertEqual(len(queue), 10)
+        self.assertEqual(_pop_all(queue), self.files)
+        self.assertEqual(len(queue), 0)
+        self.assertIsNone(queue.pop())
+
+    def test_set_files_resets(self):
+        queue = _make_queue(self.files)
+        queue.prioritize(['05.jpg'])
+        queue.pop()
+        queue.set_files(['b', 'a'])
+        self.assertEqual(_pop_all(queue), ['b', 'a'])
+
+    def test_prioritize(self):
+        queue = _make_queue(self.files)
+        queue.prioritize(['07.jpg', '03.jpg'])
+        self.assertEqual(_pop_all(queue), [
+            '07.jpg', '03.jpg',
+            '00.jpg', '01.jpg', '02.jpg', '04.jpg',
+            '05.jpg', '06.jpg', '08.jpg', '09.jpg',
+        ])
+
+    def test_prioritize_again(self):
+        queue = _make_queue(self.files)
+        queue.prioritize(['07.jpg', '08.jpg'])
+        self.assertEqual(queue.pop(), '07.jpg')
+        # 08.jpg is back to its place in the file list.
+        queue.prioritize(['02.jpg', '01.jpg'])
+        self.assertEqual(_pop_all(queue), [
+            '02.jpg', '01.jpg',
+            '00.jpg', '03.jpg', '04.jpg', '05.jpg',
+            '06.jpg', '08.jpg', '09.jpg',
+        ])
+
+    def test_prioritize_ignores_extracted_and_unknown_files(self):
+        queue = _make_queue(self.files)
+        self.assertEqual(queue.pop(), '00.jpg')
+        queue.prioritize(['00.jpg', 'unknown.jpg', '04.jpg'])
+        self.assertEqual(len(queue), 9)
+        self.assertEqual(_pop_all(queue), [
+            '04.jpg',
+            '01.jpg', '02.jpg', '03.jpg', '05.jpg',
+            '06.jpg', '07.jpg', '08.jpg', '09.jpg',
+        ])
+
+    def test_prioritize_many_times(self):
+        # Outdated heap entries are dropped along the way.
+        queue = _make_queue(self.files)
+        for n in range(200):
+            queue.prioritize([self.files[n % 10], self.files[(n * 7) % 10]])
+        queue.prioritize([])
+        self.assertEqual(_pop_all(queue), self.files)
+
+    def test_pop_many(self):
+        queue = _make_queue(self.files)
+        queue.prioritize(['05.jpg'])
+        self.assertEqual(queue.pop_many(3), ['05.jpg', '00.jpg', '01.jpg'])
+        self.assertEqual(queue.pop_many(0), [])
+        self.assertEqual(queue.pop_many(4), ['02.jpg', '03.jpg', '04.jpg', '06.jpg'])
+        self.assertEqual(queue.pop_many(8), ['07.jpg', '08.jpg', '09.jpg'])
+        self.assertEqual(queue.pop_many(8), [])
+
+    def test_pop_block(self):
+        # Blocks of 4 files: 00-03, 04-07, 08-09.
+        get_block = lambda name: int(name[:2]) // 4
+        queue = _make_queue(self.files)
+        queue.prioritize(['06.jpg', '04.jpg'])
+        self.assertEqual(queue.pop_block(get_block),
+                         ['06.jpg', '04.jpg', '05.jpg', '07.jpg'])
+        self.assertEqual(len(queue), 6)
+        self.assertEqual(queue.pop_block(get_block),
+                         ['00.jpg', '01.jpg', '02.jpg', '03.jpg'])
+        queue.prioritize(['09.jpg'])
+        self.assertEqual(queue.pop_block(get_block), ['09.jpg', '08.jpg'])
+        self.assertEqual(queue.pop_block(get_block), [])
+        self.assertIsNone(queue.pop())
+
+    def test_pop_block_single_block(self):
+        queue = _make_queue(self.files)
+        queue.prioritize(['03.jpg'])
+        self.assertEqual(queue.pop(), '03.jpg')
+        self.assertEqual(queue.pop_block(lambda name: None),
+                         [name for name in self.files if name != '03.jpg'])
+        self.assertEqual(len(queue), 0)
+
+    def test_is_overtaken(self):
+        queue = _make_queue(self.files)
+        batch = queue.pop_many(4)
+        self.assertFalse(queue.is_overtaken(batch))
+        queue.prioritize(['02.jpg', '06.jpg'])
+        self.assertFalse(queue.is_overtaken(batch[2:]))
+        self.assertTrue(queue.is_overtaken(batch[3:]))
+        queue.prioritize(['03.jpg'])
+        self.assertFalse(queue.is_overtaken(batch[3:]))
+
+    def test_push(self):
+        queue = _make_queue(self.files)
+        batch = queue.pop_many(4)
+        queue.prioritize(['06.jpg', '03.jpg'])
+        queue.push(batch[2:] + ['unknown.jpg'])
+        self.assertEqual(len(queue), 8)
+        self.assertEqual(_pop_all(queue), [
+            '06.jpg', '03.jpg',
+            '02.jpg', '04.jpg', '05.jpg', '07.jpg', '08.jpg', '09.jpg',
+        ])
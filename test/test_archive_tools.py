@@ -1,10 +1,20 @@
 
+import bz2
+import gzip
+import io
+import lzma
 import os
+import struct
+import tarfile
+import threading
+import zipfile
+from unittest import mock
 
 from . import MComixTest, get_testfile_path
 
 from mcomix import archive_tools
 from mcomix import constants
+from mcomix.archive import listing_cache, tar, zip_py
 
 
 _EXTENSION_TO_MIME_TYPES = {
@@ -54,3 +64,235 @@ class ArchiveToolsTest(MComixTest):
            )
            self.assertEqual(archive_type, expected_type, msg=msg)
 
+
+def _write_file(path, data):
+    with open(path, 'wb') as fd:
+        fd.write(data)
+    return path
+
+def _make_zip(path, contents, compression=zipfile.ZIP_DEFLATED):
+    with zipfile.ZipFile(path, mode='w', compression=compression) as zip_file:
+        for name, data in contents:
+            zip_file.writestr(name, data)
+    return path
+
+def _make_tar(path, contents, mode='w'):
+    with tarfile.open(path, mode=mode) as tar_file:
+        for name, data in contents:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar_file.addfile(info, io.BytesIO(data))
+    return path
+
+_CONTENTS = [('page%u.jpg' % n, bytes([n]) * 1000 * n) for n in range(1, 4)]
+
+class ArchiveSniffingTest(MComixTest):
+
+    def _make_files(self):
+        ''' Returns a list of (path, expected type). '''
+        files = []
+        def add(name, data, expected_type):
+            files.append((_write_file(os.path.join(self.tmp_dir, name), data), expected_type))
+        path = os.path.join(self.tmp_dir, 'book.zip')
+        files.append((_make_zip(path, _CONTENTS), constants.ZIP))
+        with open(path, 'rb') as fd:
+            data = fd.read()
+        # Self-extracting archive: the ZIP file is found from its end.
+        add('sfx.exe', b'MZ' + b'\0' * 10000 + data, constants.ZIP)
+        # Compression method unsupported by Python (PPMd).
+        stored = _make_zip(os.path.join(self.tmp_dir, 'stored.zip'), _CONTENTS,
+                           compression=zipfile.ZIP_STORED)
+        with open(stored, 'rb') as fd:
+            data = bytearray(fd.read())
+        for signature, offset in ((b'PK\x03\x04', 8), (b'PK\x01\x02', 10)):
+            start = data.find(signature)
+            while start != -1:
+                data[start + offset:start + offset + 2] = struct.pack('<H', 98)
+                start = data.find(signature, start + 4)
+        add('ppmd.zip', bytes(data), constants.ZIP_EXTERNAL)
+        for name, mode, expected_type in (
+            ('book.tar'    , 'w'    , constants.TAR  ),
+            ('book.tar.gz' , 'w:gz' , constants.GZIP ),
+            ('book.tar.bz2', 'w:bz2', constants.BZIP2),
+            ('book.tar.xz' , 'w:xz' , constants.XZ   ),
+        ):
+            files.append((_make_tar(os.path.join(self.tmp_dir, name), _CONTENTS, mode=mode),
+                          expected_type))
+        # Compressed files which are not tar files.
+        add('page.gz', gzip.compress(b'\xff\xd8' * 10000), None)
+        add('page.bz2', bz2.compress(b'\xff\xd8' * 10000), None)
+        add('page.xz', lzma.compress(b'\xff\xd8' * 10000), None)
+        add('book.7z', b'7z\xbc\xaf\x27\x1c\x00\x04' + b'\0' * 100, constants.SEVENZIP)
+        add('book.lzh', b'\x20\x00-lh5-' + b'\0' * 100, constants.LHA)
+        add('book.pdf', b'%PDF-1.4\n' + b'\0' * 100, constants.PDF)
+        add('book.sqsh', b'hsqs' + b'\0' * 100, constants.SQUASHFS)
+        add('empty', b'', None)
+        add('page.jpg', b'\xff\xd8\xff\xe0' + b'\0' * 100, None)
+        return files
+
+    def test_sniff(self):
+        for path, expected_type in self._make_files():
+            archive_type, directory = archive_tools._sniff(path, os.stat(path).st_size)
+            self.assertEqual(archive_type, expected_type, msg=path)
+            if archive_type == constants.ZIP:
+                self.assertEqual([info.filename for info in directory.infolist],
+                                 [name for name, data in _CONTENTS])
+            else:
+                self.assertIsNone(directory, msg=path)
+
+    def test_sniff_rar(self):
+        path = _write_file(os.path.join(self.tmp_dir, 'book.rar'),
+                           b'Rar!\x1a\x07\x01\x00' + b'\0' * 100)
+        archive_type, directory = archive_tools._sniff(path, os.stat(path).st_size)
+        self.assertIn(archive_type, (constants.RAR, constants.RAR5))
+
+    def test_sniff_cache(self):
+        path = _make_zip(os.path.join(self.tmp_dir, 'book.cbz'), _CONTENTS)
+        self.assertEqual(archive_tools.archive_mime_type(path), constants.ZIP)
+        self.assertIsNotNone(archive_tools._sniff_cached(path)[1])
+        archive = archive_tools.get_archive_handler(path)
+        try:
+            self.assertEqual(archive.list_contents(), [name for name, data in _CONTENTS])
+            self.assertEqual(archive.read('page2.jpg'), _CONTENTS[1][1])
+        finally:
+            archive.close()
+        # The central directory is only kept until the archive is opened.
+        self.assertEqual(archive_tools._sniff_cached(path), (constants.ZIP, None))
+        # Changing the file invalidates the cache.
+        _make_tar(path, _CONTENTS)
+        self.assertEqual(archive_tools.archive_mime_type(path), constants.TAR)
+
+
+class ListingCacheTest(MComixTest):
+
+    def setUp(self):
+        super(ListingCacheTest, self).setUp()
+        patcher = mock.patch.object(constants, 'ARCHIVE_LISTING_PATH',
+                                    os.path.join(self.tmp_dir, 'listings'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_round_trip(self):
+        path = _make_tar(os.path.join(self.tmp_dir, 'book.tar'), _CONTENTS)
+        self.assertIsNone(listing_cache.load(path, tar.TarArchive))
+        archive = tar.TarArchive(path)
+        try:
+            names = archive.list_contents()
+            listing_cache.store(archive, names)
+        finally:
+            archive.close()
+        listing = listing_cache.load(path, tar.TarArchive)
+        self.assertIsNotNone(listing)
+        self.assertEqual(listing['names'], names)
+        # Not stored again when opened from the cache.
+        archive = archive_tools.get_archive_handler(path, cached=True)
+        try:
+            self.assertEqual(archive.listing, listing)
+            self.assertEqual(archive.list_contents(), names)
+            for name, data in _CONTENTS:
+                self.assertEqual(archive.read(name), data)
+        finally:
+            archive.close()
+        # Another handler, or a changed archive, need a new listing.
+        self.assertIsNone(listing_cache.load(path, zip_py.ZipArchive))
+        _make_tar(path, _CONTENTS[:2])
+        self.assertIsNone(listing_cache.load(path, tar.TarArchive))
+
+    def test_pruning(self):
+        paths = []
+        for n in range(4):
+            paths.append(_make_tar(os.path.join(self.tmp_dir, 'book%u.tar' % n), _CONTENTS))
+        with mock.patch.object(listing_cache, '_STORE_MAX_ARCHIVES', 2):
+            for n, path in enumerate(paths):
+                archive = tar.TarArchive(path)
+                try:
+                    listing_cache.store(archive, archive.list_contents())
+                finally:
+                    archive.close()
+                # Make the modification times distinct.
+                for other in os.listdir(constants.ARCHIVE_LISTING_PATH):
+                    other = os.path.join(constants.ARCHIVE_LISTING_PATH, other)
+                    stat = os.stat(other)
+                    os.utime(other, (stat.st_atime, stat.st_mtime - 10))
+        self.assertEqual(len(os.listdir(constants.ARCHIVE_LISTING_PATH)), 2)
+        self.assertIsNone(listing_cache.load(paths[0], tar.TarArchive))
+        self.assertIsNone(listing_cache.load(paths[1], tar.TarArchive))
+        self.assertIsNotNone(listing_cache.load(paths[2], tar.TarArchive))
+        self.assertIsNotNone(listing_cache.load(paths[3], tar.TarArchive))
+
+
+def _read_concurrently(archive, contents):
+    ''' Reads all the <contents> of <archive> from several threads at
+    once, and returns the names of those read wrong. '''
+    errors = []
+    def read(name, data):
+        for n in range(10):
+            if archive.read(name) != data:
+                errors.append(name)
+    threads = [threading.Thread(target=read, args=(name, data))
+               for name, data in contents * 4]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+class TarArchiveTest(MComixTest):
+
+    def test_uncompressed(self):
+        contents = [('page%02u.jpg' % n, bytes([n]) * 997 * n) for n in range(1, 17)]
+        path = _make_tar(os.path.join(self.tmp_dir, 'book.cbt'), contents)
+        archive = tar.TarArchive(path)
+        try:
+            self.assertFalse(archive.is_solid())
+            self.assertTrue(archive.support_concurrent_extractions)
+            self.assertEqual(_read_concurrently(archive, contents), [])
+            self.assertEqual(archive.read_start('page03.jpg', 10), contents[2][1][:10])
+            listing = archive.get_listing()
+        finally:
+            archive.close()
+        # Opened from the member offsets of the listing.
+        archive = tar.TarArchive(path, listing=listing)
+        try:
+            self.assertEqual(archive.list_contents(), [name for name, data in contents])
+            self.assertEqual(_read_concurrently(archive, contents), [])
+        finally:
+            archive.close()
+
+    def test_compressed(self):
+        path = _make_tar(os.path.join(self.tmp_dir, 'book.tar.gz'), _CONTENTS, mode='w:gz')
+        archive = tar.TarArchive(path)
+        try:
+            self.assertTrue(archive.is_solid())
+            self.assertFalse(archive.support_concurrent_extractions)
+            for name, data in _CONTENTS:
+                self.assertEqual(archive.read(name), data)
+        finally:
+            archive.close()
+
+
+class ZipArchiveTest(MComixTest):
+
+    def test_read_concurrently(self):
+        contents = [('page%02u.jpg' % n, bytes([n]) * 997 * n) for n in range(1, 17)]
+        path = _make_zip(os.path.join(self.tmp_dir, 'book.cbz'), contents)
+        archive = zip_py.ZipArchive(path)
+        try:
+            self.assertEqual(_read_concurrently(archive, contents), [])
+        finally:
+            archive.close()
+
+    def test_read_after_close(self):
+        path = _make_zip(os.path.join(self.tmp_dir, 'book.cbz'), _CONTENTS)
+        archive = zip_py.ZipArchive(path)
+        try:
+            self.assertEqual(archive.read('page1.jpg'), _CONTENTS[0][1])
+            # Memory map closed by another thread while reading: the file
+            # is read through zipfile instead.
+            archive._mmap.close()
+            self.assertEqual(archive.read('page2.jpg'), _CONTENTS[1][1])
+            self.assertEqual(archive.read_start('page3.jpg', 10), _CONTENTS[2][1][:10])
+        finally:
+            archive.close()
+        self.assertRaises(ValueError, archive.read, 'page1.jpg')
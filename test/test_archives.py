@@ -94,8 +94,9 @@ def make_archive(outfile, contents, format='zip', solid=False, password=None, he
         elif format.startswith('tar'):
             assert password is None
             assert not header_encryption
-            if not solid:
-                raise UnsupportedOption(format, 'not solid')
+            # Only compressed tar files are solid.
+            if solid != ('tar' != format):
+                raise UnsupportedOption(format, 'solid' if solid else 'not solid')
             if 'tar' == format:
                 compression = ''
             elif 'tar.bz2' == format:
@@ -264,7 +265,7 @@ for name, handler, is_available, format, not_solid, solid, password, header_encr
     ('7z (external) lha', sevenzip_external.SevenZipArchive, sevenzip_external.SevenZipArchive.is_available(), 'lha'    , True , False, False, False ),
     ('7z (external) rar', sevenzip_external.SevenZipArchive, sevenzip_external.SevenZipArchive.is_available(), 'rar'    , True , True , True , True  ),
     ('7z (external) zip', sevenzip_external.SevenZipArchive, sevenzip_external.SevenZipArchive.is_available(), 'zip'    , True , False, True , False ),
-    ('tar'              , tar.TarArchive                   , True                                            , 'tar'    , False, True , False, False ),
+    ('tar'              , tar.TarArchive                   , True                                            , 'tar'    , True , False, False, False ),
     ('tar (gzip)'       , tar.TarArchive                   , True                                            , 'tar.gz' , False, True , False, False ),
     ('tar (bzip2)'      , tar.TarArchive                   , True                                            , 'tar.bz2', False, True , False, False ),
     ('rar (external)'   , rar_external.RarArchive          , rar_external.RarArchive.is_available()          , 'rar'    , True , True , True , True  ),
@@ -518,10 +519,10 @@ if 'win32' == sys.platform:
         ('TarGzipSolidUnicode'    , 'test_list_contents'),
         ('TarGzipSolidUnicode'    , 'test_iter_extract' ),
         ('TarGzipSolidUnicode'    , 'test_extract'      ),
-        ('TarSolidUnicode'        , 'test_iter_contents'),
-        ('TarSolidUnicode'        , 'test_list_contents'),
-        ('TarSolidUnicode'        , 'test_iter_extract' ),
-        ('TarSolidUnicode'        , 'test_extract'      ),
+        ('TarUnicode'             , 'test_iter_contents'),
+        ('TarUnicode'             , 'test_list_contents'),
+        ('TarUnicode'             , 'test_iter_extract' ),
+        ('TarUnicode'             , 'test_extract'      ),
         # Idem with unzip...
         ('ZipExternalUnicode'     , 'test_iter_contents'),
         ('ZipExternalUnicode'     , 'test_list_contents'),